@@ -0,0 +1,145 @@
+"""
+Cumuls journaliers pour les tableaux de bord.
+
+Les ventes sont comptées au jour de la commande, au moment où elle passe en
+« confirmed » ou à sa création si elle l'est déjà (et retirées si elle en sort) :
+chaque transition coûte quelques UPDATE incrémentaux, et les vues d'analyse ne
+lisent que les tables *Daily, jamais Order ni OrderItem. Les niveaux de stock
+sont relevés par la commande rollup_analytics, ou à la première consultation
+du jour si elle n'est pas encore passée.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+from .models import (
+  Inventory, OrderItem, SalesDaily, ProductSalesDaily, CategorySalesDaily, StockLevelDaily
+)
+
+
+CONFIRMED = 'confirmed'
+
+
+def sales_day(order):
+  return timezone.localtime(order.created_at).date()
+
+
+def _increment(model, key, day, totals):
+  """Ajoute {id: (unités, montant)} aux lignes du jour, créées au besoin : sûr en concurrence"""
+  if not totals:
+    return
+  model.objects.bulk_create([model(day=day, **{f'{key}_id': pk}) for pk in totals], ignore_conflicts=True)
+  model.objects.filter(day=day, **{f'{key}_id__in': totals}).update(
+    units=Case(
+      *[When(**{f'{key}_id': pk}, then=F('units') + units) for pk, (units, _) in totals.items()],
+      output_field=IntegerField()
+    ),
+    revenue=Case(
+      *[When(**{f'{key}_id': pk}, then=F('revenue') + revenue) for pk, (_, revenue) in totals.items()],
+      output_field=DecimalField(max_digits=14, decimal_places=2)
+    ),
+  )
+
+
+def record_order(order, sign=1):
+  """Ajoute (sign=1) ou retire (sign=-1) les lignes de la commande des cumuls de son jour"""
+  day = sales_day(order)
+  products, categories = {}, {}
+  units_total, revenue_total = 0, Decimal('0')
+  rows = OrderItem.objects.filter(order=order).values_list('product_id', 'product__category_id', 'quantity', 'price')
+  for product_id, category_id, quantity, price in rows:
+    units, revenue = sign * quantity, sign * quantity * price
+    for totals, pk in ((products, product_id), (categories, category_id)):
+      previous_units, previous_revenue = totals.get(pk, (0, Decimal('0')))
+      totals[pk] = (previous_units + units, previous_revenue + revenue)
+    units_total += units
+    revenue_total += revenue
+
+  with transaction.atomic():
+    SalesDaily.objects.bulk_create([SalesDaily(day=day)], ignore_conflicts=True)
+    SalesDaily.objects.filter(day=day).update(
+      orders=F('orders') + sign, units=F('units') + units_total, revenue=F('revenue') + revenue_total
+    )
+    _increment(ProductSalesDaily, 'product', day, products)
+    _increment(CategorySalesDaily, 'category', day, categories)
+
+
+def order_status_changed(order, previous_status, created=False):
+  if created:
+    # commande créée déjà confirmée : ses lignes sont enregistrées après elle,
+    # elle est comptée à la validation de la transaction, lignes comprises
+    if order.status == CONFIRMED:
+      transaction.on_commit(partial(record_order, order, 1))
+    return
+  if order.status == CONFIRMED and previous_status != CONFIRMED:
+    record_order(order, 1)
+  elif previous_status == CONFIRMED and order.status != CONFIRMED:
+    record_order(order, -1)
+
+
+def snapshot_stock(day=None):
+  """Relève le nombre de stocks suivis, sous leur seuil (Inventory.low_stock) et épuisés"""
+  counts = Inventory.objects.aggregate(
+    tracked=Count('pk'),
+    low_stock=Count('pk', filter=Q(quantity__gt=0, quantity__lte=F('low_stock'))),
+    out_of_stock=Count('pk', filter=Q(quantity__lte=0)),
+  )
+  row, _ = StockLevelDaily.objects.update_or_create(day=day or timezone.localdate(), defaults=counts)
+  return row
+
+
+def rebuild_sales():
+  """Recalcule tous les cumuls de ventes depuis les commandes confirmées (reprise de l'existant)"""
+  lines = OrderItem.objects.filter(order__status=CONFIRMED).annotate(day=TruncDate('order__created_at'))
+  amount = Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+  with transaction.atomic():
+    for model in (SalesDaily, ProductSalesDaily, CategorySalesDaily):
+      model.objects.all().delete()
+    SalesDaily.objects.bulk_create([
+      SalesDaily(**row) for row in lines.values('day').annotate(
+        orders=Count('order_id', distinct=True), units=Sum('quantity'), revenue=amount
+      ).order_by()
+    ], batch_size=1000)
+    ProductSalesDaily.objects.bulk_create([
+      ProductSalesDaily(**row) for row in lines.values('day', 'product_id').annotate(
+        units=Sum('quantity'), revenue=amount
+      ).order_by()
+    ], batch_size=1000)
+    CategorySalesDaily.objects.bulk_create([
+      CategorySalesDaily(**row) for row in lines.values('day', category_id=F('product__category_id')).annotate(
+        units=Sum('quantity'), revenue=amount
+      ).order_by()
+    ], batch_size=1000)
+  return SalesDaily.objects.count()
+
+
+def date_range(query_params):
+  """?from=AAAA-MM-JJ&to=AAAA-MM-JJ, par défaut les 30 derniers jours ; étendue bornée"""
+  def parse(name, default):
+    value = query_params.get(name)
+    if not value:
+      return default
+    try:
+      parsed = parse_date(value)
+    except ValueError:
+      parsed = None
+    if parsed is None:
+      raise ValidationError({name: "Date invalide, format attendu AAAA-MM-JJ"})
+    return parsed
+
+  end = parse('to', timezone.localdate())
+  start = parse('from', end - timedelta(days=29))
+  max_days = getattr(settings, 'ANALYTICS_MAX_DAYS', 366)
+  if start > end:
+    raise ValidationError({'from': "La date de début doit précéder la date de fin"})
+  if (end - start).days >= max_days:
+    raise ValidationError({'from': f"Période limitée à {max_days} jours"})
+  return start, end
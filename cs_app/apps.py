@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cs_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
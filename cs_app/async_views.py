@@ -0,0 +1,163 @@
+"""
+Lecture du catalogue en asynchrone, pour un déploiement ASGI (cs_project/asgi.py).
+
+Chaque vue reprend la vue DRF synchrone correspondante (queryset, filtres,
+pagination, serializer, clé de cache) mais sans occuper de thread pendant
+l'attente : cache lu et écrit par l'API asynchrone du cache, COUNT et page lus
+par l'ORM asynchrone. Les étapes encore synchrones de DRF (authentification,
+permissions et limites de débit de initial(), validation des filtres,
+sérialisation) sont confiées à sync_to_async ; une réponse déjà en cache ne
+coûte que le passage par initial().
+
+Mêmes réponses que les vues synchrones, erreurs comprises (gestionnaire
+d'exceptions de DRF), au format JSON uniquement.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views import View
+from rest_framework.exceptions import APIException
+
+from . import views
+from .cache import CachedResponseMixin
+from .conditional import ConditionalResponseMixin, set_validators
+from .facets import facet_counts
+from .renderers import FastJSONRenderer
+
+
+class AsyncReadView(View):
+  """Vue GET asynchrone adossée à `view_class`, une vue DRF de lecture"""
+  view_class = None
+  many = True
+  http_method_names = ['get', 'head', 'options']
+
+  def get_drf_view(self, request, *args, **kwargs):
+    view = self.view_class()
+    view.setup(request, *args, **kwargs)
+    view.format_kwarg = None
+    view.headers = {}
+    view.request = view.initialize_request(request, *args, **kwargs)
+    return view
+
+  async def get(self, request, *args, **kwargs):
+    view = self.get_drf_view(request, *args, **kwargs)
+    cached = isinstance(view, CachedResponseMixin)
+    try:
+      # contrôles de la vue synchrone : négociation, authentification, permissions, débit
+      await sync_to_async(view.initial)(view.request, *args, **kwargs)
+      validators = None
+      if isinstance(view, ConditionalResponseMixin):
+        validators = await sync_to_async(view.get_validators)(view.request, *args, **kwargs)
+      if validators is not None:
+        not_modified = get_conditional_response(request, etag=validators[0], last_modified=validators[1])
+        if not_modified is not None:
+          return self.finalize(view, not_modified, validators)
+
+      data = key = None
+      if cached:
+        key = await view.aget_cache_key(view.request, *args, **kwargs)
+        data = await view.aget_cached(key)
+      hit = data is not None
+      if not hit:
+        data = await (self.list(view) if self.many else self.retrieve(view, **kwargs))
+        if cached:
+          await cache.aset(key, data, view.get_cache_timeout())
+    except (Http404, APIException) as exc:
+      return await self.handle_exception(view, exc)
+
+    response = self.render(data)
+    if cached:
+      response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return self.finalize(view, response, validators)
+
+  async def handle_exception(self, view, exc):
+    """Réponse d'erreur de la vue synchrone (message, statut, en-têtes), rendue en JSON"""
+    response = await sync_to_async(view.handle_exception)(exc)
+    rendered = self.render(response.data, response.status_code)
+    for header in ('WWW-Authenticate', 'Retry-After'):
+      if response.has_header(header):
+        rendered[header] = response[header]
+    return rendered
+
+  def finalize(self, view, response, validators):
+    if validators is not None:
+      set_validators(response, *validators)
+    if isinstance(view, views.ImageResponseMixin):
+      patch_vary_headers(response, ['Accept'])
+    return response
+
+  async def list(self, view):
+    values_serializer = None
+    if getattr(view, 'values_serializer_class', None) is not None:
+      # même chemin values() que la vue synchrone (voir ValuesListMixin)
+      values_serializer = view.values_serializer_class(context=view.get_serializer_context())
+      queryset = await sync_to_async(view.get_values_queryset)(values_serializer)
+    else:
+      # get_queryset et les filtres peuvent lire la base (moteur de promotions, recherche, choix de catégorie)
+      queryset = await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+    paginator = view.paginator
+    page = None
+    if hasattr(paginator, 'apaginate_queryset'):
+      page = await paginator.apaginate_queryset(queryset, view.request, view)
+    elif paginator is not None:
+      page = await sync_to_async(paginator.paginate_queryset)(queryset, view.request, view)
+    if page is None:
+      page = [row async for row in queryset]
+    if values_serializer is not None:
+      data = await sync_to_async(values_serializer.to_representation)(page)
+    else:
+      data = await sync_to_async(lambda: view.get_serializer(page, many=True).data)()
+    if paginator is not None:
+      data = paginator.get_paginated_response(data).data
+    return data
+
+  async def retrieve(self, view, **kwargs):
+    lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+    # comme get_object : filtres de la vue compris (et préchargements réduits par FieldSelectionMixin)
+    queryset = await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+    instance = await queryset.filter(**{view.lookup_field: kwargs[lookup_url_kwarg]}).afirst()
+    if instance is None:
+      # même message que get_object_or_404
+      raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+    await sync_to_async(view.check_object_permissions)(view.request, instance)
+    return await sync_to_async(lambda: view.get_serializer(instance).data)()
+
+  def render(self, data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class AsyncProductListView(AsyncReadView):
+  view_class = views.ProductListView
+
+  async def list(self, view):
+    data = await super().list(view)
+    data['facets'] = await sync_to_async(facet_counts)(view)
+    return data
+
+
+class AsyncProductDetailView(AsyncReadView):
+  view_class = views.ProductDetailView
+  many = False
+
+
+class AsyncCategoryListView(AsyncReadView):
+  view_class = views.CategoryListView
+
+
+class AsyncPromotionListView(AsyncReadView):
+  view_class = views.PromotionListView
+
+
+class AsyncPromotionDetailView(AsyncReadView):
+  view_class = views.PromotionDetailView
+  many = False
+
+
+class AsyncBlogPostListView(AsyncReadView):
+  view_class = views.BlogPostListView
+
+
+class AsyncBlogPostDetailView(AsyncReadView):
+  view_class = views.BlogPostDetailView
+  many = False
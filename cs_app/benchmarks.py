@@ -0,0 +1,303 @@
+"""
+Scénarios de charge du catalogue, du panier et de la commande.
+
+Les mêmes scénarios passent soit par le client de test de Django (dans le
+processus, séquentiel : nombre exact de requêtes SQL), soit en HTTP vers un
+serveur local avec plusieurs clients simultanés (requêtes SQL lues dans
+l'en-tête Server-Timing, voir cs_app/middleware.py). Le rapport (débit,
+p50/p95/p99, requêtes SQL) est du JSON : compare_reports le confronte à celui
+d'un autre commit. Les données viennent de cs_app/seed.py.
+"""
+import http.client
+import json
+import math
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlencode, urlsplit
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, modify_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import User, Category, Product, Cart
+
+
+SQL_TIMING = re.compile(r'db;[^,]*desc="(\d+) SQL"')
+
+
+class ClientTransport:
+  """Client de test de Django : une requête à la fois, SQL compté par CaptureQueriesContext"""
+  name = 'client'
+
+  def __init__(self):
+    self.clients = {}
+
+  def get_client(self, user):
+    key = user.pk if user else None
+    if key not in self.clients:
+      client = APIClient()
+      if user is not None:
+        client.force_authenticate(user)
+      self.clients[key] = client
+    return self.clients[key]
+
+  def request(self, user, method, path, data=None):
+    client = self.get_client(user)
+    with CaptureQueriesContext(connection) as queries:
+      started = time.perf_counter()
+      if method == 'get':
+        response = client.get(path, data)
+      else:
+        response = client.post(path, data or {}, format='json')
+      elapsed = time.perf_counter() - started
+    return response.status_code, elapsed, len(queries)
+
+
+class HTTPTransport:
+  """HTTP/1.1 avec keep-alive, une connexion par thread client, authentification JWT"""
+  name = 'http'
+
+  def __init__(self, base_url):
+    parts = urlsplit(base_url)
+    self.host, self.port = parts.hostname, parts.port or 80
+    self.local = threading.local()
+    self.tokens = {}
+
+  def authorize(self, users):
+    # jetons créés à l'avance, dans le thread principal
+    for user in users:
+      self.tokens[user.pk] = str(AccessToken.for_user(user))
+
+  def get_connection(self):
+    if getattr(self.local, 'connection', None) is None:
+      self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+    return self.local.connection
+
+  def request(self, user, method, path, data=None):
+    headers = {'Accept': 'application/json'}
+    if user is not None:
+      headers['Authorization'] = f'Bearer {self.tokens[user.pk]}'
+    body = None
+    if method == 'get' and data:
+      path = f'{path}?{urlencode(data)}'
+    elif method != 'get':
+      body = json.dumps(data or {})
+      headers['Content-Type'] = 'application/json'
+
+    connection = self.get_connection()
+    started = time.perf_counter()
+    try:
+      connection.request(method.upper(), path, body, headers)
+      response = connection.getresponse()
+      response.read()
+    except (OSError, http.client.HTTPException):
+      self.local.connection = None
+      connection.close()
+      return 0, time.perf_counter() - started, None
+    elapsed = time.perf_counter() - started
+    match = SQL_TIMING.search(response.getheader('Server-Timing') or '')
+    return response.status, elapsed, int(match.group(1)) if match else None
+
+
+@contextmanager
+def local_server():
+  """Serveur WSGI multithread dans le processus, sur la base courante ; retourne son URL"""
+
+  class QuietHandler(WSGIRequestHandler):
+    # en-têtes et corps partent en deux écritures : sans TCP_NODELAY, l'ACK retardé ajoute ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+      pass
+
+  server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+  server.set_app(WSGIHandler())
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  try:
+    # comme LiveServerTestCase : setup_test_environment ne laisse passer que « testserver »
+    with modify_settings(ALLOWED_HOSTS={'append': '127.0.0.1'}):
+      yield f'http://127.0.0.1:{server.server_port}'
+  finally:
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+class Scenario:
+  """
+  Suite de requêtes d'un parcours. steps(index, worker) retourne les étapes de
+  l'itération : (chronométrée, utilisateur, méthode, chemin, données). Les
+  étapes non chronométrées préparent l'état (remplir le panier avant la commande).
+  """
+  name = None
+
+  def __init__(self, fixtures):
+    self.fixtures = fixtures
+
+  def steps(self, index, worker):
+    raise NotImplementedError
+
+
+class ProductListScenario(Scenario):
+  name = 'liste produits'
+
+  def steps(self, index, worker):
+    variants = [
+      {},
+      {'featured': 'true'},
+      {'category': self.fixtures.categories[index % len(self.fixtures.categories)]},
+      {'ordering': 'price'},
+      {'page': index % 5 + 2},
+      {'search': 'acier'},
+    ]
+    return [(True, None, 'get', '/products/', variants[index % len(variants)])]
+
+
+class ProductDetailScenario(Scenario):
+  name = 'détail produit'
+
+  def steps(self, index, worker):
+    products = self.fixtures.products
+    return [(True, None, 'get', f'/products/{products[index % len(products)]}/', None)]
+
+
+class CartScenario(Scenario):
+  name = 'panier'
+
+  def steps(self, index, worker):
+    return [(True, self.fixtures.user(worker), 'get', '/cart/', None)]
+
+
+class AddCartItemScenario(Scenario):
+  name = 'ajout panier'
+
+  def steps(self, index, worker):
+    product = self.fixtures.stocked[index % len(self.fixtures.stocked)]
+    return [(True, self.fixtures.user(worker), 'post', '/cart/add/', {'product_id': product, 'quantity': 1})]
+
+
+class CheckoutScenario(Scenario):
+  name = 'commande'
+
+  def steps(self, index, worker):
+    user = self.fixtures.user(worker)
+    stocked = self.fixtures.stocked
+    fill = [
+      (False, user, 'post', '/cart/add/', {'product_id': stocked[(index * 2 + offset) % len(stocked)], 'quantity': 1})
+      for offset in range(2)
+    ]
+    return fill + [(True, user, 'post', '/orders/', {})]
+
+
+SCENARIOS = [ProductListScenario, ProductDetailScenario, CartScenario, AddCartItemScenario, CheckoutScenario]
+
+
+class Fixtures:
+  """Identifiants tirés du jeu de données, relus une fois avant les mesures"""
+
+  def __init__(self, concurrency=1):
+    self.categories = list(Category.objects.order_by('pk').values_list('pk', flat=True)[:20])
+    self.products = list(Product.objects.filter(in_stock=True).order_by('pk').values_list('pk', flat=True)[:500])
+    # produits au stock confortable : les ajouts et commandes répétés ne l'épuisent pas
+    self.stocked = list(
+      Product.objects.filter(in_stock=True, inventory__quantity__gte=100)
+      .order_by('pk').values_list('pk', flat=True)[:200]
+    )
+    # un utilisateur par client simultané : deux clients ne se disputent jamais le même panier
+    with_cart = Cart.objects.filter(user__isnull=False, user__is_staff=False).values('user')
+    self.users = list(User.objects.filter(pk__in=with_cart).order_by('pk')[:concurrency])
+    if not (self.categories and self.products and self.stocked) or len(self.users) < concurrency:
+      raise ValueError("Jeu de données trop petit pour ces scénarios (produits en stock, paniers, utilisateurs)")
+
+  def user(self, worker):
+    return self.users[worker]
+
+
+def percentile(ordered, rank):
+  """Percentile au rang le plus proche d'une liste triée"""
+  return ordered[max(0, math.ceil(rank / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples, errors, elapsed):
+  timings = sorted(duration * 1000 for duration, _ in samples)
+  queries = [count for _, count in samples if count is not None]
+  if not timings:
+    return {'requests': 0, 'errors': errors}
+  return {
+    'requests': len(timings),
+    'errors': errors,
+    'throughput_rps': round(len(timings) / elapsed, 1) if elapsed else None,
+    'p50_ms': round(percentile(timings, 50), 2),
+    'p95_ms': round(percentile(timings, 95), 2),
+    'p99_ms': round(percentile(timings, 99), 2),
+    'queries': statistics.median(queries) if queries else None,
+    'max_queries': max(queries) if queries else None,
+  }
+
+
+def run_scenario(transport, scenario, requests, concurrency=1, warmup=3):
+  """Exécute `requests` itérations réparties entre `concurrency` clients ; retourne le résumé"""
+  lock = threading.Lock()
+  samples, errors = [], 0
+
+  def worker(number, indexes, record=True):
+    nonlocal errors
+    for index in indexes:
+      for timed, user, method, path, data in scenario.steps(index, number):
+        status, duration, queries = transport.request(user, method, path, data)
+        if not record or not timed:
+          continue
+        with lock:
+          if 200 <= status < 300:
+            samples.append((duration, queries))
+          else:
+            errors += 1
+
+  # échauffement hors mesure : connexions, caches de processus, index en mémoire
+  worker(0, range(-warmup, 0), record=False)
+  started = time.perf_counter()
+  if concurrency == 1:
+    worker(0, range(requests))
+  else:
+    with ThreadPoolExecutor(concurrency) as pool:
+      futures = [pool.submit(worker, number, range(number, requests, concurrency)) for number in range(concurrency)]
+      for future in futures:
+        future.result()
+  return summarize(samples, errors, time.perf_counter() - started)
+
+
+def run(transport, requests, concurrency=1, scenarios=None, progress=None):
+  fixtures = Fixtures(concurrency)
+  if isinstance(transport, HTTPTransport):
+    transport.authorize(fixtures.users)
+  results = {}
+  for scenario_class in SCENARIOS:
+    if scenarios and scenario_class.name not in scenarios:
+      continue
+    results[scenario_class.name] = run_scenario(transport, scenario_class(fixtures), requests, concurrency)
+    if progress is not None:
+      progress(scenario_class.name, results[scenario_class.name])
+  return results
+
+
+def compare_reports(baseline, report):
+  """Écart relatif (%) de chaque mesure entre deux rapports, par scénario commun"""
+  comparison = {}
+  for name, current in report['scenarios'].items():
+    previous = baseline.get('scenarios', {}).get(name)
+    if not previous:
+      continue
+    comparison[name] = {
+      key: round((current[key] - previous[key]) / previous[key] * 100, 1)
+      for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries')
+      if current.get(key) is not None and previous.get(key)
+    }
+  return comparison
@@ -0,0 +1,157 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+
+VERSION_KEY = 'catalog:version:{}'
+STATS_KEY = 'catalog:stats:{}'
+
+
+def _counter(key, delta=1):
+  # cache.incr lève ValueError si la clé n'existe pas (expirée ou évincée)
+  cache.add(key, 0, timeout=None)
+  try:
+    return cache.incr(key, delta)
+  except ValueError:
+    cache.set(key, delta, timeout=None)
+    return delta
+
+
+async def _acounter(key, delta=1):
+  await cache.aadd(key, 0, timeout=None)
+  try:
+    return await cache.aincr(key, delta)
+  except ValueError:
+    await cache.aset(key, delta, timeout=None)
+    return delta
+
+
+def model_label(model):
+  return model._meta.label_lower
+
+
+def bump_version(model):
+  """Invalide toutes les réponses en cache qui dépendent de ce modèle"""
+  key = VERSION_KEY.format(model_label(model))
+  # une version évincée repart d'un horodatage, jamais d'une valeur déjà utilisée
+  if cache.add(key, time.time_ns(), timeout=None):
+    return
+  try:
+    cache.incr(key)
+  except ValueError:
+    cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_versions(models):
+  keys = [VERSION_KEY.format(model_label(model)) for model in models]
+  versions = cache.get_many(keys)
+  missing = {key: time.time_ns() for key in keys if key not in versions}
+  if missing:
+    cache.set_many(missing, timeout=None)
+    versions.update(missing)
+  return [versions[key] for key in keys]
+
+
+async def aget_versions(models):
+  """get_versions pour les vues asynchrones (cs_app/async_views.py)"""
+  keys = [VERSION_KEY.format(model_label(model)) for model in models]
+  versions = await cache.aget_many(keys)
+  missing = {key: time.time_ns() for key in keys if key not in versions}
+  if missing:
+    await cache.aset_many(missing, timeout=None)
+    versions.update(missing)
+  return [versions[key] for key in keys]
+
+
+def get_many_cached(name, keys, models, load, variant=None, timeout=None):
+  """
+  Valeurs par clé (un produit, une catégorie...) gardées chacune en cache et
+  invalidées avec les versions de `models`, comme les réponses. Les entrées
+  présentes sont lues en un seul cache.get_many ; `load(manquantes)` retourne
+  un dict des autres, écrites en un seul set_many. Les clés que `load` ne
+  trouve pas sont absentes du résultat.
+  """
+  digest = hashlib.md5(repr((get_versions(models), variant)).encode()).hexdigest()
+  cache_keys = {key: f'catalog:{name}:{key}:{digest}' for key in keys}
+  found = cache.get_many(cache_keys.values())
+  values = {key: found[cache_key] for key, cache_key in cache_keys.items() if cache_key in found}
+  missing = [key for key in keys if key not in values]
+  if values:
+    _counter(STATS_KEY.format('hits'), len(values))
+  if missing:
+    _counter(STATS_KEY.format('misses'), len(missing))
+    loaded = load(missing)
+    if loaded:
+      timeout = timeout or getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+      cache.set_many({cache_keys[key]: value for key, value in loaded.items()}, timeout)
+      values.update(loaded)
+  return values
+
+
+def cache_stats():
+  stats = cache.get_many([STATS_KEY.format('hits'), STATS_KEY.format('misses')])
+  return {
+    'hits': stats.get(STATS_KEY.format('hits'), 0),
+    'misses': stats.get(STATS_KEY.format('misses'), 0),
+  }
+
+
+def reset_cache_stats():
+  cache.delete_many([STATS_KEY.format('hits'), STATS_KEY.format('misses')])
+
+
+class CachedResponseMixin:
+  """
+  Cache en lecture des réponses GET d'une vue DRF.
+
+  La clé combine le nom de la vue, ses arguments d'URL, les paramètres de requête
+  (filtres, tri, page) et la version courante de chaque modèle de `cache_models`.
+  Les signaux post_save/post_delete incrémentent ces versions (voir signals.py),
+  les anciennes entrées deviennent donc inaccessibles et expirent d'elles-mêmes.
+  """
+  cache_models = ()
+  cache_timeout = None
+
+  def get_cache_variant(self, request):
+    """Ce qui, hors URL, change le contenu de la réponse (en-têtes de négociation...)"""
+    return None
+
+  def build_cache_key(self, request, versions, *args, **kwargs):
+    params = sorted(request.query_params.lists())
+    raw = repr((args, sorted(kwargs.items()), params, versions, self.get_cache_variant(request)))
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'catalog:response:{type(self).__name__}:{digest}'
+
+  def get_cache_key(self, request, *args, **kwargs):
+    return self.build_cache_key(request, get_versions(self.cache_models), *args, **kwargs)
+
+  async def aget_cache_key(self, request, *args, **kwargs):
+    # même clé que get_cache_key : vues synchrones et asynchrones partagent leurs entrées
+    return self.build_cache_key(request, await aget_versions(self.cache_models), *args, **kwargs)
+
+  def get_cache_timeout(self):
+    return self.cache_timeout or getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+  async def aget_cached(self, key):
+    data = await cache.aget(key)
+    await _acounter(STATS_KEY.format('hits' if data is not None else 'misses'))
+    return data
+
+  def get(self, request, *args, **kwargs):
+    key = self.get_cache_key(request, *args, **kwargs)
+    data = cache.get(key)
+    if data is not None:
+      _counter(STATS_KEY.format('hits'))
+      response = Response(data)
+      response['X-Cache'] = 'HIT'
+      return response
+
+    _counter(STATS_KEY.format('misses'))
+    response = super().get(request, *args, **kwargs)
+    if response.status_code == 200:
+      cache.set(key, response.data, self.get_cache_timeout())
+    response['X-Cache'] = 'MISS'
+    return response
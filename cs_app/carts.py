@@ -0,0 +1,277 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, PositiveIntegerField, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+
+from .models import Cart, CartItem, Product
+from .promotions import get_engine
+from .reservations import release_bulk, reserve_bulk
+
+
+def adjust_totals(cart_id, quantity, amount):
+  """Répercute l'ajout (ou le retrait, valeurs négatives) de lignes sur les totaux du panier"""
+  Cart.objects.filter(pk=cart_id).update(
+    item_count=F('item_count') + quantity,
+    subtotal=F('subtotal') + amount,
+    updated_at=timezone.now(),
+  )
+
+
+def reset_totals(cart_id):
+  Cart.objects.filter(pk=cart_id).update(item_count=0, subtotal=0, updated_at=timezone.now())
+
+
+def recompute_totals(carts, touch=True):
+  """
+  Recalcule les totaux des paniers donnés (queryset) en un seul UPDATE.
+
+  Avec `touch`, updated_at passe aussi à maintenant : le panier a été modifié et
+  ne doit pas être purgé comme abandonné (voir retention.purge_abandoned_carts).
+  """
+  lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+  extra = {'updated_at': timezone.now()} if touch else {}
+  return carts.update(
+    subtotal=Coalesce(
+      Subquery(lines.annotate(total=Sum(F('quantity') * F('product__price'))).values('total')),
+      Value(0), output_field=DecimalField(max_digits=10, decimal_places=2)
+    ),
+    item_count=Coalesce(
+      Subquery(lines.annotate(count=Sum('quantity')).values('count')),
+      Value(0), output_field=PositiveIntegerField()
+    ),
+    **extra,
+  )
+
+
+def recompute_for_product(product_id):
+  """Un changement de prix rend faux le sous-total des paniers qui contiennent le produit"""
+  return recompute_for_products([product_id])
+
+
+def recompute_for_products(product_ids):
+  carts = CartItem.objects.filter(product_id__in=product_ids).values('cart_id')
+  # le client n'a rien modifié : un panier abandonné le reste
+  return recompute_totals(Cart.objects.filter(pk__in=carts), touch=False)
+
+
+def price_lines(items):
+  """
+  {'subtotal', 'discount', 'total'} de lignes de panier (CartItem avec leur produit),
+  promotions en cours comprises : le panier coûte ce qu'affiche le catalogue
+  """
+  return get_engine().price_cart(
+    (item.product_id, item.product.category_id, item.product.price, item.quantity) for item in items
+  )
+
+
+class SessionCart:
+  """
+  Panier d'un visiteur anonyme, conservé dans sa session : {id produit: quantité}.
+
+  Avec SESSION_ENGINE sur le cache, naviguer et remplir ce panier n'écrit rien en
+  base ; les lignes rejoignent le Cart de l'utilisateur à la connexion (voir
+  merge_session_cart). Mêmes attributs que Cart pour passer par CartSerializer.
+  """
+  session_key = 'cart'
+  id = created_at = updated_at = None
+
+  def __init__(self, session):
+    self.session = session
+    self.lines = {int(pk): quantity for pk, quantity in session.get(self.session_key, {}).items()}
+
+  def quantity(self, product_id):
+    return self.lines.get(product_id, 0)
+
+  def add(self, product_id, quantity):
+    self.set(product_id, self.quantity(product_id) + quantity)
+
+  def set(self, product_id, quantity):
+    if quantity > 0:
+      self.lines[product_id] = quantity
+    else:
+      self.lines.pop(product_id, None)
+    self.save()
+
+  def remove(self, product_id):
+    self.set(product_id, 0)
+
+  def clear(self):
+    self.lines = {}
+    self.session.pop(self.session_key, None)
+
+  def save(self):
+    # clés texte : la session est sérialisée en JSON
+    self.session[self.session_key] = {str(pk): quantity for pk, quantity in self.lines.items()}
+    self.session.modified = True
+    self.__dict__.pop('items', None)
+
+  @cached_property
+  def items(self):
+    """Lignes non enregistrées, produits lus en une requête ; les produits supprimés sont ignorés"""
+    if not self.lines:
+      return []
+    products = Product.objects.in_bulk(self.lines)
+    return [
+      CartItem(product=products[pk], quantity=quantity)
+      for pk, quantity in self.lines.items() if pk in products
+    ]
+
+  @property
+  def item_count(self):
+    return sum(item.quantity for item in self.items)
+
+  @property
+  def subtotal(self):
+    return sum((item.product.price * item.quantity for item in self.items), Decimal('0.00'))
+
+
+def merge_session_cart(session, user):
+  """
+  Verse le panier de session dans le Cart de l'utilisateur ; retourne le nombre de lignes fusionnées.
+
+  Les quantités s'ajoutent à celles déjà présentes, dans la limite du stock
+  disponible. Nombre de requêtes constant : réservations en masse, un seul upsert
+  des CartItem puis un recalcul des totaux.
+  """
+  session_cart = SessionCart(session)
+  if not session_cart.lines:
+    return 0
+
+  with transaction.atomic():
+    cart = Cart.objects.filter(user=user).first() or Cart.objects.create(user=user)
+    products = Product.objects.filter(in_stock=True).select_related('inventory').in_bulk(session_cart.lines)
+    wanted = {pk: quantity for pk, quantity in session_cart.lines.items() if pk in products}
+    inventories = {
+      product.inventory.pk: pk for pk, product in products.items()
+      if getattr(product, 'inventory', None) is not None
+    }
+    granted = reserve_bulk(cart, {inventory: wanted[pk] for inventory, pk in inventories.items()}, partial=True)
+    for inventory, pk in inventories.items():
+      wanted[pk] = granted.get(inventory, 0)
+    wanted = {pk: quantity for pk, quantity in wanted.items() if quantity > 0}
+
+    if wanted:
+      existing = dict(
+        CartItem.objects.filter(cart=cart, product_id__in=wanted).values_list('product_id', 'quantity')
+      )
+      CartItem.objects.bulk_create(
+        [
+          CartItem(cart=cart, product_id=pk, quantity=existing.get(pk, 0) + quantity)
+          for pk, quantity in wanted.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['cart', 'product'],
+        update_fields=['quantity'],
+      )
+      recompute_totals(Cart.objects.filter(pk=cart.pk))
+
+  session_cart.clear()
+  return len(wanted)
+
+
+def fold_operations(current, operations):
+  """
+  Quantités finales des produits touchés par les opérations (add, set, remove),
+  appliquées dans l'ordre à `current` ({id produit: quantité}) ; seules celles
+  qui changent sont retournées.
+  """
+  targets = {}
+  for operation in operations:
+    pk = operation['product_id']
+    quantity = targets.get(pk, current.get(pk, 0))
+    if operation['op'] == 'add':
+      quantity += operation['quantity']
+    elif operation['op'] == 'set':
+      quantity = operation['quantity']
+    else:
+      quantity = 0
+    targets[pk] = quantity
+  return {pk: quantity for pk, quantity in targets.items() if quantity != current.get(pk, 0)}
+
+
+def check_products(products, current, targets):
+  errors = []
+  for pk, quantity in targets.items():
+    product = products.get(pk)
+    if product is None:
+      errors.append(f"Produit {pk} non trouvé")
+    elif not product.in_stock and quantity > current.get(pk, 0):
+      errors.append(f"Le produit {pk} n'est pas en stock")
+  if errors:
+    raise ValidationError({'operations': errors})
+
+
+def apply_cart_operations(user, operations):
+  """
+  Applique une liste d'opérations au Cart de l'utilisateur, tout ou rien ; retourne le panier.
+
+  Nombre de requêtes constant quel que soit le nombre de lignes : lignes
+  actuelles, produits et stocks lus en une fois, réservations prises et
+  libérées en masse, un upsert et un DELETE des CartItem, un recalcul des totaux.
+  """
+  with transaction.atomic():
+    cart = Cart.objects.filter(user=user).first() or Cart.objects.create(user=user)
+    product_ids = {operation['product_id'] for operation in operations}
+    current = dict(
+      CartItem.objects.filter(cart=cart, product_id__in=product_ids).values_list('product_id', 'quantity')
+    )
+    targets = fold_operations(current, operations)
+    if not targets:
+      return cart
+    products = Product.objects.select_related('inventory').in_bulk(targets)
+    check_products(products, current, targets)
+
+    reserved, released = {}, {}
+    for pk, quantity in targets.items():
+      inventory = getattr(products[pk], 'inventory', None)
+      if inventory is None:
+        continue
+      delta = quantity - current.get(pk, 0)
+      if delta > 0:
+        reserved[inventory.pk] = delta
+      else:
+        # ligne retirée : toute la réservation, même si elle ne correspond plus à la ligne
+        released[inventory.pk] = None if quantity == 0 else -delta
+    # lève ValidationError en listant les produits sans stock suffisant
+    reserve_bulk(cart, reserved)
+    release_bulk(cart, released)
+
+    kept = {pk: quantity for pk, quantity in targets.items() if quantity > 0}
+    if kept:
+      CartItem.objects.bulk_create(
+        [CartItem(cart=cart, product_id=pk, quantity=quantity) for pk, quantity in kept.items()],
+        update_conflicts=True,
+        unique_fields=['cart', 'product'],
+        update_fields=['quantity'],
+      )
+    removed = [pk for pk in targets if pk not in kept]
+    if removed:
+      CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+    recompute_totals(Cart.objects.filter(pk=cart.pk))
+  return cart
+
+
+def apply_session_operations(session_cart, operations):
+  """apply_cart_operations pour un panier anonyme : stock contrôlé sans réservation, rien n'est écrit en base"""
+  targets = fold_operations(session_cart.lines, operations)
+  if not targets:
+    return
+  products = Product.objects.select_related('inventory').in_bulk(targets)
+  check_products(products, session_cart.lines, targets)
+  missing = []
+  for pk, quantity in targets.items():
+    inventory = getattr(products[pk], 'inventory', None)
+    if inventory is not None and quantity > session_cart.quantity(pk) and inventory.available < quantity:
+      missing.append(f"Stock insuffisant pour le produit {pk}. Seulement {max(inventory.available, 0)} disponible(s)")
+  if missing:
+    raise ValidationError({'items': missing})
+  for pk, quantity in targets.items():
+    if quantity > 0:
+      session_cart.lines[pk] = quantity
+    else:
+      session_cart.lines.pop(pk, None)
+  session_cart.save()
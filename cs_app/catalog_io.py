@@ -0,0 +1,352 @@
+"""
+Import et export du catalogue en CSV ou JSON Lines, en flux.
+
+L'import lit le fichier ligne à ligne et écrit par lots : un upsert (bulk_create
+avec update_conflicts) par table et par lot, catégories et attributs résolus par
+des dictionnaires en mémoire. L'export parcourt les produits par tranches d'id
+(keyset) et n'a jamais plus d'une tranche en mémoire.
+
+Colonnes : slug (clé), name, description, price, compare_price, category (slug),
+featured, in_stock, quantity, low_stock, puis une colonne attr.<nom> par
+attribut en CSV, ou un objet "attributes" en JSON Lines.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+
+from . import search
+from .cache import bump_version
+from .carts import recompute_for_products
+from .models import Category, Product, ProductAttribute, ProductAttributeValue, Inventory
+
+
+FIELDS = [
+  'slug', 'name', 'description', 'price', 'compare_price', 'category',
+  'featured', 'in_stock', 'quantity', 'low_stock',
+]
+# colonnes facultatives : un produit existant ne les voit réécrites que si le fichier les donne
+OPTIONAL_FIELDS = ('description', 'compare_price', 'featured', 'in_stock')
+ATTRIBUTE_PREFIX = 'attr.'
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+TRUE = {'1', 'true', 'yes', 'oui', 'y', 'o'}
+FALSE = {'0', 'false', 'no', 'non', 'n', ''}
+
+
+def guess_format(filename, default='jsonl'):
+  name = (filename or '').lower()
+  if name.endswith('.csv'):
+    return 'csv'
+  if name.endswith(('.jsonl', '.ndjson')):
+    return 'jsonl'
+  return default
+
+
+def read_csv(stream):
+  """(n° de ligne, ligne, erreur) pour chaque ligne du CSV"""
+  reader = csv.DictReader(stream)
+  for row in reader:
+    attributes = {
+      key[len(ATTRIBUTE_PREFIX):]: value
+      for key, value in row.items()
+      if key and key.startswith(ATTRIBUTE_PREFIX) and value not in (None, '')
+    }
+    fields = {key: value for key, value in row.items() if key in FIELDS and value != ''}
+    yield reader.line_num, {**fields, 'attributes': attributes}, None
+
+
+def read_jsonl(stream):
+  """(n° de ligne, ligne, erreur) pour chaque ligne non vide du fichier JSON Lines"""
+  for line, text in enumerate(stream, start=1):
+    if not text.strip():
+      continue
+    try:
+      row = json.loads(text)
+    except ValueError as exc:
+      yield line, None, f"JSON invalide : {exc}"
+      continue
+    if not isinstance(row, dict):
+      yield line, None, "Objet JSON attendu"
+      continue
+    yield line, row, None
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def parse_bool(value, default):
+  if value is None:
+    return default
+  if isinstance(value, bool):
+    return value
+  text = str(value).strip().lower()
+  if text in TRUE:
+    return True
+  if text in FALSE:
+    return False
+  raise ValueError(f"Booléen invalide : {value!r}")
+
+
+def parse_decimal(value, name):
+  try:
+    number = Decimal(str(value).strip())
+  except InvalidOperation:
+    raise ValueError(f"{name} invalide : {value!r}")
+  if not number.is_finite() or number < 0:
+    raise ValueError(f"{name} invalide : {value!r}")
+  return number.quantize(Decimal('0.01'))
+
+
+def parse_int(value, name):
+  try:
+    return int(str(value).strip())
+  except ValueError:
+    raise ValueError(f"{name} invalide : {value!r}")
+
+
+class ProductImporter:
+  """
+  Upsert des produits, de leur stock et de leurs valeurs d'attributs par lots.
+
+  Chaque lot est une transaction ; une ligne invalide est rapportée sans
+  interrompre l'import. Pour un produit existant, seuls les champs présents
+  dans la ligne sont réécrits : les colonnes facultatives absentes (ou vides en
+  CSV), le seuil de stock et les attributs absents ne sont pas effacés.
+  """
+
+  def __init__(self, batch_size=2000, progress=None, max_errors=100):
+    self.batch_size = batch_size
+    self.progress = progress
+    self.max_errors = max_errors
+    self.categories = dict(Category.objects.values_list('slug', 'pk'))
+    # ProductAttribute.name n'est pas unique : le plus ancien l'emporte
+    self.attributes = {}
+    for pk, name in ProductAttribute.objects.order_by('-pk').values_list('pk', 'name'):
+      self.attributes[name] = pk
+    self.processed = self.imported = 0
+    self.errors = []
+    self.error_count = 0
+
+  def run(self, rows):
+    batch = []
+    for line, row, error in rows:
+      self.processed += 1
+      if error is None:
+        try:
+          batch.append(self.parse(row))
+        except ValueError as exc:
+          error = str(exc)
+      if error is not None:
+        self.error(line, error)
+      if len(batch) >= self.batch_size:
+        self.flush(batch)
+        batch = []
+    if batch:
+      self.flush(batch)
+    # bulk_create n'émet aucun signal : invalider le cache du catalogue une fois pour toutes
+    if self.imported:
+      for model in (Product, Inventory, ProductAttribute, ProductAttributeValue):
+        bump_version(model)
+    return self.report()
+
+  def report(self):
+    return {
+      'processed': self.processed,
+      'imported': self.imported,
+      'error_count': self.error_count,
+      'errors': self.errors,
+    }
+
+  def error(self, line, message):
+    self.error_count += 1
+    if len(self.errors) < self.max_errors:
+      self.errors.append({'line': line, 'error': message})
+
+  def parse(self, row):
+    slug = str(row.get('slug') or '').strip()
+    if not slug:
+      raise ValueError("slug manquant")
+    for field in ('name', 'price', 'category'):
+      if row.get(field) in (None, ''):
+        raise ValueError(f"{field} manquant")
+    category = self.categories.get(str(row['category']).strip())
+    if category is None:
+      raise ValueError(f"Catégorie inconnue : {row['category']!r}")
+
+    name = str(row['name']).strip()
+    if len(name) > Product._meta.get_field('name').max_length:
+      raise ValueError(f"name trop long : {name!r}")
+    price = parse_decimal(row['price'], 'price')
+    compare_price = row.get('compare_price')
+    product = Product(
+      slug=slug,
+      name=name,
+      description=row.get('description') or '',
+      price=price,
+      compare_price=price if compare_price in (None, '') else parse_decimal(compare_price, 'compare_price'),
+      category_id=category,
+      featured=parse_bool(row.get('featured'), False),
+      in_stock=parse_bool(row.get('in_stock'), True),
+    )
+
+    present = frozenset(field for field in OPTIONAL_FIELDS if row.get(field) is not None)
+
+    quantity = row.get('quantity')
+    stock = None
+    if quantity not in (None, ''):
+      low_stock = row.get('low_stock')
+      # low_stock None : seuil par défaut à la création, inchangé sinon
+      stock = (
+        parse_int(quantity, 'quantity'),
+        None if low_stock in (None, '') else parse_int(low_stock, 'low_stock'),
+      )
+
+    attributes = row.get('attributes') or {}
+    if not isinstance(attributes, dict):
+      raise ValueError("attributes doit être un objet")
+    attributes = {
+      str(name).strip(): str(value)
+      for name, value in attributes.items() if str(name).strip() and value is not None
+    }
+    return product, stock, attributes, present
+
+  def flush(self, batch):
+    # un slug répété dans le lot : la dernière ligne l'emporte
+    batch = list({row[0].slug: row for row in batch}.values())
+    with transaction.atomic():
+      # un upsert par jeu de colonnes présentes : un fichier partiel ne réécrit que ses colonnes
+      groups = {}
+      for product, _, _, present in batch:
+        groups.setdefault(present, []).append(product)
+      for present, products in groups.items():
+        Product.objects.bulk_create(
+          products,
+          update_conflicts=True,
+          unique_fields=['slug'],
+          update_fields=['name', 'price', 'category', *sorted(present), 'updated_at'],
+        )
+      ids = dict(Product.objects.filter(slug__in=[row[0].slug for row in batch]).values_list('slug', 'pk'))
+
+      inventories = {}
+      for product, stock, _, _ in batch:
+        if stock is None:
+          continue
+        inventory = Inventory(product_id=ids[product.slug], quantity=stock[0])
+        if stock[1] is not None:
+          inventory.low_stock = stock[1]
+        inventories.setdefault(stock[1] is not None, []).append(inventory)
+      for with_low_stock, rows in inventories.items():
+        Inventory.objects.bulk_create(
+          rows,
+          update_conflicts=True,
+          unique_fields=['product'],
+          update_fields=['quantity', 'low_stock', 'updated_at'] if with_low_stock else ['quantity', 'updated_at'],
+        )
+
+      names = {name for _, _, attributes, _ in batch for name in attributes} - set(self.attributes)
+      if names:
+        created = ProductAttribute.objects.bulk_create([ProductAttribute(name=name) for name in sorted(names)])
+        if any(attribute.pk is None for attribute in created):
+          created = ProductAttribute.objects.filter(name__in=names).order_by('-pk')
+        for attribute in created:
+          self.attributes[attribute.name] = attribute.pk
+
+      values = [
+        ProductAttributeValue(product_id=ids[product.slug], attribute_id=self.attributes[name], value=value)
+        for product, _, attributes, _ in batch for name, value in attributes.items()
+      ]
+      if values:
+        ProductAttributeValue.objects.bulk_create(
+          values,
+          update_conflicts=True,
+          unique_fields=['product', 'attribute'],
+          update_fields=['value'],
+        )
+
+      # ce que les signaux post_save auraient fait : recherche et totaux des paniers
+      product_ids = list(ids.values())
+      search.index_products(product_ids)
+      recompute_for_products(product_ids)
+
+    self.imported += len(batch)
+    if self.progress is not None:
+      self.progress(self.processed, self.imported)
+
+
+def import_products(stream, format='jsonl', **options):
+  """Importe un flux texte ; retourne le rapport (lignes lues, importées, erreurs)"""
+  if format not in READERS:
+    raise ValueError(f"Format inconnu : {format}")
+  return ProductImporter(**options).run(READERS[format](stream))
+
+
+def export_rows(chunk_size=2000):
+  """Produits dans l'ordre des id, par tranches : une requête produits et une attributs par tranche"""
+  names = dict(ProductAttribute.objects.values_list('pk', 'name'))
+  last = 0
+  while True:
+    rows = list(
+      Product.objects.filter(pk__gt=last).order_by('pk').values(
+        'pk', 'slug', 'name', 'description', 'price', 'compare_price', 'featured', 'in_stock',
+        category_slug=F('category__slug'),
+        stock_quantity=F('inventory__quantity'),
+        stock_low=F('inventory__low_stock'),
+      )[:chunk_size]
+    )
+    if not rows:
+      return
+    last = rows[-1]['pk']
+    attributes = {}
+    values = ProductAttributeValue.objects.filter(product_id__in=[row['pk'] for row in rows]).values_list(
+      'product_id', 'attribute_id', 'value'
+    )
+    for product_id, attribute_id, value in values:
+      attributes.setdefault(product_id, {})[names[attribute_id]] = value
+    for row in rows:
+      yield {
+        'slug': row['slug'],
+        'name': row['name'],
+        'description': row['description'],
+        'price': row['price'],
+        'compare_price': row['compare_price'],
+        'category': row['category_slug'],
+        'featured': row['featured'],
+        'in_stock': row['in_stock'],
+        'quantity': row['stock_quantity'],
+        'low_stock': row['stock_low'],
+        'attributes': attributes.get(row['pk'], {}),
+      }
+
+
+class Echo:
+  # csv.writer écrit dans cet objet, qui rend simplement la ligne formatée
+  def write(self, value):
+    return value
+
+
+def export_csv(chunk_size=2000):
+  names = sorted(set(ProductAttribute.objects.values_list('name', flat=True)))
+  writer = csv.writer(Echo())
+  yield writer.writerow(FIELDS + [ATTRIBUTE_PREFIX + name for name in names])
+  for row in export_rows(chunk_size):
+    values = ['' if row[field] is None else row[field] for field in FIELDS]
+    yield writer.writerow(values + [row['attributes'].get(name, '') for name in names])
+
+
+def export_jsonl(chunk_size=2000):
+  for row in export_rows(chunk_size):
+    yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+
+
+EXPORTERS = {'csv': export_csv, 'jsonl': export_jsonl}
+
+
+def export_products(format='jsonl', chunk_size=2000):
+  """Générateur des lignes du fichier d'export"""
+  if format not in EXPORTERS:
+    raise ValueError(f"Format inconnu : {format}")
+  return EXPORTERS[format](chunk_size)
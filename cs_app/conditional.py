@@ -0,0 +1,102 @@
+"""
+Requêtes conditionnelles (ETag / Last-Modified) sur les lectures du catalogue et du blog.
+
+Avant toute sérialisation, les validateurs sont calculés au moindre coût. Un
+détail lit ses dates de modification (values_list, sans jointure ni
+préchargement). Une liste servie par le cache de réponses tire son ETag des
+versions qui font la clé de ce cache, sans aucune requête. Une autre liste lit
+en un seul agrégat le total et la date la plus récente de l'ensemble filtré ;
+la pagination par page de la réponse reprend ce total au lieu de recompter.
+Un client qui a déjà cette version reçoit un 304 vide, sans lecture du cache
+de réponses ni sérialisation.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .cache import CachedResponseMixin, get_versions
+
+
+class ConditionalResponseMixin:
+  """
+  ETag et Last-Modified pour une vue DRF de lecture (GET/HEAD).
+
+  `last_modified_fields` : champs datés, sur le modèle de la vue ou à travers une
+  relation, dont le plus récent fait la date de modification. Sur une vue en
+  cache, l'ETag reprend aussi les versions de `cache_models` : une modification
+  sans date propre (image, attribut, promotion) le change. L'état d'un détail
+  est gardé sous la clé de cache de la réponse, invalidé avec elle ; une liste
+  en cache n'a pas de Last-Modified, son ETag suffit.
+  """
+  last_modified_fields = ('updated_at',)
+
+  def is_detail(self):
+    return (self.lookup_url_kwarg or self.lookup_field) in self.kwargs
+
+  def get_validator_state(self):
+    """(lignes de dates, total) ; None si la ressource n'existe pas"""
+    # prefetch_related(None) : values_list n'a que faire des préchargements
+    queryset = self.get_queryset().prefetch_related(None)
+    if self.is_detail():
+      lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+      row = queryset.filter(**{self.lookup_field: lookup}).values_list('pk', *self.last_modified_fields).first()
+      return None if row is None else ((row,), None)
+
+    latest = {f'latest_{index}': Max(field) for index, field in enumerate(self.last_modified_fields)}
+    state = self.filter_queryset(queryset).order_by().aggregate(count=Count('pk'), **latest)
+    # repris par KeysetPagination : la réponse ne refait pas le COUNT
+    self.validated_count = state['count']
+    return (tuple(state[name] for name in latest),), state['count']
+
+  def get_validators(self, request, *args, **kwargs):
+    """(ETag, Last-Modified en secondes ou None) de la réponse à venir, None si la ressource n'existe pas"""
+    versions = variant = key = state = None
+    cached = isinstance(self, CachedResponseMixin)
+    if cached:
+      versions = get_versions(self.cache_models)
+      variant = self.get_cache_variant(request)
+    if cached and self.is_detail():
+      key = self.build_cache_key(request, versions, *args, **kwargs) + ':validators'
+      validators = cache.get(key)
+      if validators is not None:
+        return validators
+    # une liste en cache ne change qu'avec sa clé (versions, paramètres, variante) : aucune requête
+    if not cached or self.is_detail():
+      state = self.get_validator_state()
+      if state is None:
+        return None
+
+    raw = repr((type(self).__name__, sorted(kwargs.items()), sorted(request.query_params.lists()), variant, versions, state))
+    dates = [value for row in (state[0] if state else ()) for value in row if hasattr(value, 'timestamp')]
+    validators = (
+      f'W/"{hashlib.md5(raw.encode()).hexdigest()}"',
+      int(max(dates).timestamp()) if dates else None,
+    )
+    if key is not None:
+      cache.set(key, validators, self.get_cache_timeout())
+    return validators
+
+  def get(self, request, *args, **kwargs):
+    validators = self.get_validators(request, *args, **kwargs)
+    if validators is None:
+      return super().get(request, *args, **kwargs)
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+      response = super().get(request, *args, **kwargs)
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+  if response.status_code not in (200, 304):
+    return
+  response['ETag'] = etag
+  if last_modified is not None:
+    response['Last-Modified'] = http_date(last_modified)
+  # le client peut garder la réponse mais doit la revalider (304) avant de la réutiliser
+  patch_cache_control(response, no_cache=True)
@@ -0,0 +1,163 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from rest_framework.filters import BaseFilterBackend
+
+from .cache import get_versions
+from .models import ProductAttribute, ProductAttributeValue
+
+
+def to_bitmap(ids):
+  """Entier dont le bit n vaut 1 si l'id n est présent"""
+  ids = list(ids)
+  if not ids:
+    return 0
+  bits = bytearray(max(ids) // 8 + 1)
+  for pk in ids:
+    bits[pk >> 3] |= 1 << (pk & 7)
+  return int.from_bytes(bits, 'little')
+
+
+def normalize(text):
+  return text.strip().casefold()
+
+
+class FacetIndex:
+  """
+  Index inversé des valeurs d'attributs : un bitmap de produits par valeur.
+
+  Les comptes de facettes d'un ensemble de résultats se calculent alors par
+  intersections de bitmaps, sans GROUP BY par attribut.
+  """
+
+  def __init__(self):
+    self.built_at = time.monotonic()
+    self.versions = get_versions((ProductAttribute, ProductAttributeValue))
+    ids = {}
+    self.labels = {}
+    self.value_labels = {}
+    # graphies exactes rencontrées, pour filtrer en base par égalité stricte (indexable)
+    self.attribute_ids = {}
+    self.value_variants = {}
+    rows = ProductAttributeValue.objects.values_list('attribute_id', 'attribute__name', 'value', 'product_id')
+    for attribute_id, attribute, value, product_id in rows.iterator(chunk_size=5000):
+      key, value_key = normalize(attribute), normalize(value)
+      self.labels.setdefault(key, attribute)
+      self.value_labels.setdefault((key, value_key), value)
+      self.attribute_ids.setdefault(key, set()).add(attribute_id)
+      self.value_variants.setdefault((key, value_key), set()).add(value)
+      ids.setdefault(key, {}).setdefault(value_key, []).append(product_id)
+    self.bitmaps = {
+      key: {value: to_bitmap(product_ids) for value, product_ids in values.items()}
+      for key, values in ids.items()
+    }
+
+  def is_stale(self, ttl):
+    if time.monotonic() - self.built_at > ttl:
+      return True
+    return get_versions((ProductAttribute, ProductAttributeValue)) != self.versions
+
+  def selection_bitmap(self, key, values):
+    """Produits ayant au moins une des valeurs choisies pour cet attribut"""
+    bitmap = 0
+    for value in values:
+      bitmap |= self.bitmaps.get(key, {}).get(value, 0)
+    return bitmap
+
+  def counts(self, base, selection):
+    """
+    Comptes par attribut et par valeur pour l'ensemble `base` (bitmap).
+
+    Un attribut est compté en appliquant les choix des autres attributs mais pas
+    les siens, pour que ses autres valeurs restent proposées.
+    """
+    chosen = {key: self.selection_bitmap(key, values) for key, values in selection.items()}
+    facets = {}
+    for key, values in self.bitmaps.items():
+      scope = base
+      for other, bitmap in chosen.items():
+        if other != key:
+          scope &= bitmap
+      counts = {}
+      for value, bitmap in values.items():
+        count = (scope & bitmap).bit_count()
+        if count:
+          counts[self.value_labels[(key, value)]] = count
+      if counts:
+        facets[self.labels[key]] = dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+    return facets
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_facet_index():
+  """Index partagé, reconstruit après FACET_INDEX_TTL secondes ou si un attribut change"""
+  global _index
+  ttl = getattr(settings, 'FACET_INDEX_TTL', 300)
+  index = _index
+  if index is None or index.is_stale(ttl):
+    with _lock:
+      if _index is index:
+        _index = FacetIndex()
+      index = _index
+  return index
+
+
+def parse_selection(query_params, prefix='attr.'):
+  """?attr.color=red,blue&attr.size=M -> {'color': {'red', 'blue'}, 'size': {'m'}}"""
+  selection = {}
+  for param, values in query_params.lists():
+    if not param.startswith(prefix):
+      continue
+    chosen = {normalize(part) for value in values for part in value.split(',') if part.strip()}
+    if chosen:
+      selection[normalize(param[len(prefix):])] = chosen
+  return selection
+
+
+class AttributeFacetFilter(BaseFilterBackend):
+  """
+  Filtre ?attr.<attribut>=<valeur>[,<valeur>] : OU entre les valeurs d'un attribut,
+  ET entre attributs.
+
+  À placer en dernier : le queryset reçu (déjà filtré par catégorie, recherche...)
+  est conservé sur la vue comme base du calcul des facettes.
+  """
+
+  def filter_queryset(self, request, queryset, view):
+    selection = parse_selection(request.query_params)
+    view.facet_base_queryset = queryset
+    view.facet_selection = selection
+    if not selection:
+      return queryset
+
+    index = get_facet_index()
+    for attribute, values in selection.items():
+      # l'index traduit la saisie normalisée en graphies exactes, comme pour les comptes
+      variants = set()
+      for value in values:
+        variants |= index.value_variants.get((attribute, value), set())
+      if not variants:
+        return queryset.none()
+      queryset = queryset.filter(Exists(ProductAttributeValue.objects.filter(
+        product=OuterRef('pk'),
+        attribute_id__in=index.attribute_ids[attribute],
+        value__in=variants,
+      )))
+    return queryset
+
+
+def facet_counts(view):
+  """Comptes de facettes pour les résultats filtrés de la vue (une requête sur les ids)"""
+  base = getattr(view, 'facet_base_queryset', None)
+  if base is None:
+    return {}
+  index = get_facet_index()
+  if not index.bitmaps:
+    return {}
+  ids = base.order_by().values_list('pk', flat=True)
+  return index.counts(to_bitmap(ids.iterator(chunk_size=5000)), view.facet_selection)
@@ -0,0 +1,256 @@
+"""
+Déclinaisons des images envoyées : vignettes et WebP.
+
+Après chaque envoi (post_save, une fois la transaction validée), l'original est
+redimensionné dans un pool de processus (IMAGE_WORKERS ; 0 = dans la requête,
+pour les tests) puis enregistré par un thread d'écriture unique ; les déclinaisons
+de l'image remplacée sont supprimées. Chaque déclinaison est enregistrée à
+côté de l'original sous un nom contenant l'empreinte de son contenu
+(media/Products/poele.thumb.3f2a9c01b7e4.webp), donc cachable indéfiniment.
+Les chemins sont stockés dans le champ `variants` de la ligne : les serializers
+construisent les URL sans requête ni accès disque.
+"""
+import hashlib
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from .cache import bump_version
+
+
+logger = logging.getLogger(__name__)
+
+# champ image de chaque modèle décliné
+IMAGE_FIELDS = {
+  'ProductImage': 'image',
+  'Category': 'image',
+  'UserProfile': 'avatar',
+  'BlogPost': 'featured_image',
+}
+
+
+def variant_sizes():
+  """{nom: côté maximal en pixels}"""
+  return getattr(settings, 'IMAGE_VARIANT_SIZES', {'thumb': 320, 'medium': 960})
+
+
+def render_variants(name, sizes):
+  """
+  Produit les déclinaisons de l'image `name` et retourne {nom: chemin}.
+
+  Tourne dans un processus du pool : ni base de données ni état partagé, seulement
+  le stockage. Une déclinaison déjà écrite (même contenu, même nom) n'est pas réécrite.
+  """
+  from PIL import Image, ImageOps
+
+  with default_storage.open(name, 'rb') as original:
+    image = Image.open(original)
+    image.load()
+  image = ImageOps.exif_transpose(image)
+  transparent = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+  stem = os.path.splitext(name)[0]
+
+  variants = {'source': name}
+  for label, size in sizes.items():
+    resized = image.copy()
+    resized.thumbnail((size, size))
+    resized = resized.convert('RGBA' if transparent else 'RGB')
+    outputs = (
+      (label, 'PNG' if transparent else 'JPEG', 'png' if transparent else 'jpg'),
+      (f'{label}_webp', 'WEBP', 'webp'),
+    )
+    for key, image_format, extension in outputs:
+      buffer = BytesIO()
+      resized.save(buffer, image_format, quality=82, optimize=True)
+      data = buffer.getvalue()
+      path = f'{stem}.{label}.{hashlib.sha256(data).hexdigest()[:12]}.{extension}'
+      if not default_storage.exists(path):
+        path = default_storage.save(path, ContentFile(data))
+      variants[key] = path
+  return variants
+
+
+def render_or_log(name, sizes):
+  """render_variants qui journalise au lieu de lever : une image illisible n'arrête pas un lot"""
+  try:
+    return render_variants(name, sizes)
+  except Exception:
+    logger.exception("Déclinaisons impossibles pour %s", name)
+    return None
+
+
+def _init_worker():
+  # démarrage par spawn : le processus fils doit configurer Django lui-même
+  if not apps.ready:
+    django.setup()
+
+
+_executor = None
+_writer = None
+_lock = threading.Lock()
+# (modèle, pk, champ, nom, future) dans l'ordre des envois, enregistrés par le seul thread d'écriture
+_pending = queue.Queue()
+
+
+def get_executor():
+  global _executor
+  with _lock:
+    if _executor is None:
+      _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS, initializer=_init_worker)
+    return _executor
+
+
+def store_variants(model, pk, field, name, variants):
+  """Enregistre les déclinaisons de l'image `name` et supprime celles de l'image qu'elle remplace"""
+  if variants is None:
+    return 0
+  previous = model.objects.filter(pk=pk).values_list('variants', flat=True).first() or {}
+  # l'image a pu être remplacée entre-temps : ne mettre à jour que si c'est toujours la même
+  updated = model.objects.filter(pk=pk, **{field: name}).update(variants=variants)
+  if updated:
+    bump_version(model)
+    if previous.get('source') != name:
+      delete_variants(previous, keep=variants.values())
+  return updated
+
+
+def delete_variants(variants, keep=()):
+  """Supprime du stockage les déclinaisons listées (jamais l'original) sauf celles de `keep`"""
+  keep = set(keep)
+  for key, path in variants.items():
+    if key != 'source' and path not in keep:
+      try:
+        default_storage.delete(path)
+      except OSError:
+        logger.warning("Suppression impossible de la déclinaison %s", path)
+
+
+def _write_results():
+  """
+  Boucle du thread d'écriture : attend chaque rendu du pool puis l'enregistre.
+
+  Les écritures ne partent ni du thread de gestion du pool ni de plusieurs threads
+  à la fois : une seule connexion, des UPDATE courts, le reste de l'application
+  attend au plus un verrou d'écriture SQLite.
+  """
+  while True:
+    model, pk, field, name, future = _pending.get()
+    try:
+      store_variants(model, pk, field, name, future.result())
+    except Exception:
+      logger.exception("Enregistrement des déclinaisons impossible pour %s", name)
+    finally:
+      close_old_connections()
+      _pending.task_done()
+
+
+def get_writer():
+  global _writer
+  with _lock:
+    if _writer is None:
+      _writer = threading.Thread(target=_write_results, name='image-variants', daemon=True)
+      _writer.start()
+    return _writer
+
+
+def wait_for_variants():
+  """Attend que les rendus en cours soient enregistrés (commandes, tests)"""
+  _pending.join()
+
+
+def is_stale(instance, field):
+  file = getattr(instance, field)
+  return bool(file) and (instance.variants or {}).get('source') != file.name
+
+
+def schedule(instance):
+  """Lance la génération des déclinaisons si l'image a changé (en arrière-plan si IMAGE_WORKERS > 0)"""
+  field = IMAGE_FIELDS[type(instance).__name__]
+  if not is_stale(instance, field):
+    return
+  model, name = type(instance), getattr(instance, field).name
+  if not getattr(settings, 'IMAGE_WORKERS', 0):
+    store_variants(model, instance.pk, field, name, render_or_log(name, variant_sizes()))
+    return
+  get_writer()
+  _pending.put((model, instance.pk, field, name, get_executor().submit(render_or_log, name, variant_sizes())))
+
+
+def regenerate(model, progress=None, chunk_size=100):
+  """Génère les déclinaisons manquantes ou périmées d'un modèle (reprise de l'existant) ; retourne le nombre d'images"""
+  field = IMAGE_FIELDS[model.__name__]
+  rows = model.objects.exclude(**{field: ''}).order_by('pk').values_list('pk', field, 'variants')
+  pending = [(pk, name) for pk, name, variants in rows.iterator() if (variants or {}).get('source') != name]
+  done = 0
+  for start in range(0, len(pending), chunk_size):
+    chunk = pending[start:start + chunk_size]
+    names = [name for _, name in chunk]
+    if getattr(settings, 'IMAGE_WORKERS', 0):
+      results = get_executor().map(render_or_log, names, [variant_sizes()] * len(names))
+    else:
+      results = (render_or_log(name, variant_sizes()) for name in names)
+    for (pk, name), variants in zip(chunk, results):
+      store_variants(model, pk, field, name, variants)
+    done += len(chunk)
+    if progress is not None:
+      progress(done)
+  return done
+
+
+@lru_cache(maxsize=8192)
+def _filesystem_url(path):
+  return default_storage.url(path)
+
+
+def storage_url(path):
+  """
+  default_storage.url(path), gardée en mémoire pour le stockage local : son URL
+  ne dépend que du chemin (un stockage distant peut signer ses URL, il est
+  interrogé à chaque fois)
+  """
+  if isinstance(default_storage, FileSystemStorage):
+    return _filesystem_url(path)
+  return default_storage.url(path)
+
+
+@receiver(setting_changed)
+def clear_storage_urls(setting, **kwargs):
+  if setting in ('MEDIA_URL', 'STORAGES'):
+    _filesystem_url.cache_clear()
+
+
+def accepts_webp(request):
+  return request is not None and 'image/webp' in request.META.get('HTTP_ACCEPT', '')
+
+
+def variant_url(file, variants, size, request=None):
+  """URL de la déclinaison `size` (WebP si le client l'accepte), l'original à défaut"""
+  if not file:
+    return None
+  return stored_variant_url(file.name, variants, size, request)
+
+
+def stored_variant_url(name, variants, size, request=None):
+  """variant_url à partir du chemin stocké, pour les lignes lues par values()"""
+  if not name:
+    return None
+  variants = variants or {}
+  if variants.get('source') == name:
+    path = variants.get(f'{size}_webp') if accepts_webp(request) else None
+    path = path or variants.get(size)
+    if path:
+      return storage_url(path)
+  return storage_url(name)
@@ -0,0 +1,121 @@
+import json
+import subprocess
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from cs_app import benchmarks
+from cs_app.seed import DEFAULTS, seed
+
+
+def current_commit():
+  try:
+    return subprocess.run(
+      ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+    ).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+class Command(BaseCommand):
+  help = (
+    "Crée une base jetable, la remplit avec cs_app.seed et mesure la liste et le détail des produits, "
+    "le panier, l'ajout au panier et la commande (débit, p50/p95/p99, requêtes SQL) ; rapport JSON "
+    "comparable d'un commit à l'autre"
+  )
+
+  def add_arguments(self, parser):
+    for name, default in DEFAULTS.items():
+      parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=default)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=200, help="Itérations mesurées par scénario")
+    parser.add_argument(
+      '--transport', choices=['client', 'http'], default='client',
+      help="client : client de test de Django ; http : serveur local multithread dans ce processus"
+    )
+    parser.add_argument('--concurrency', type=int, default=1, help="Clients simultanés (http seulement)")
+    parser.add_argument(
+      '--scenario', action='append', dest='scenarios',
+      choices=[scenario.name for scenario in benchmarks.SCENARIOS], help="À répéter ; tous par défaut"
+    )
+    parser.add_argument(
+      '--cache', action='store_true',
+      help="Garde le cache des réponses du catalogue (par défaut, chaque lecture est recalculée)"
+    )
+    parser.add_argument('--json', dest='json_path', help="Écrit le rapport JSON dans ce fichier")
+    parser.add_argument('--compare', dest='baseline_path', help="Rapport JSON d'un autre commit à comparer")
+
+  def handle(self, *args, **options):
+    if options['transport'] == 'client' and options['concurrency'] != 1:
+      raise CommandError("--concurrency n'a de sens qu'avec --transport http")
+    baseline = None
+    if options['baseline_path']:
+      with open(options['baseline_path']) as source:
+        baseline = json.load(source)
+
+    counts = {name: options[name] for name in DEFAULTS}
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+    setup_test_environment()
+    try:
+      self.stdout.write("Remplissage de la base de benchmark...")
+      seed(seed=options['seed'], stdout=self.stdout, **counts)
+      caching = nullcontext() if options['cache'] else override_settings(CATALOG_CACHE_TIMEOUT=0)
+      with caching:
+        results = self.run(options)
+    finally:
+      teardown_test_environment()
+      connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    report = {
+      'commit': current_commit(),
+      'date': timezone.now().isoformat(),
+      'transport': options['transport'],
+      'concurrency': options['concurrency'],
+      'requests': options['requests'],
+      'cache': options['cache'],
+      'seed': options['seed'],
+      'counts': counts,
+      'scenarios': results,
+    }
+    if baseline is not None:
+      report['compared_to'] = baseline.get('commit')
+      report['comparison'] = benchmarks.compare_reports(baseline, report)
+
+    self.print_report(report)
+    if options['json_path']:
+      with open(options['json_path'], 'w') as output:
+        json.dump(report, output, indent=2, ensure_ascii=False)
+
+  def run(self, options):
+    def progress(name, result):
+      self.stdout.write(f"{name} : {result['requests']} requête(s), {result['errors']} erreur(s)")
+
+    if options['transport'] == 'client':
+      return benchmarks.run(
+        benchmarks.ClientTransport(), options['requests'], scenarios=options['scenarios'], progress=progress
+      )
+    with benchmarks.local_server() as url:
+      return benchmarks.run(
+        benchmarks.HTTPTransport(url), options['requests'], options['concurrency'],
+        scenarios=options['scenarios'], progress=progress,
+      )
+
+  def print_report(self, report):
+    self.stdout.write("")
+    self.stdout.write(
+      f"{'scénario':<18}{'req/s':>9}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'SQL':>6}{'erreurs':>9}"
+    )
+    for name, result in report['scenarios'].items():
+      self.stdout.write(
+        f"{name:<18}{result.get('throughput_rps', '-')!s:>9}{result.get('p50_ms', '-')!s:>10}"
+        f"{result.get('p95_ms', '-')!s:>10}{result.get('p99_ms', '-')!s:>10}"
+        f"{result.get('queries', '-')!s:>6}{result['errors']:>9}"
+      )
+    if 'comparison' in report:
+      self.stdout.write("")
+      self.stdout.write(f"Écarts par rapport à {report['compared_to'] or 'la référence'} (%)")
+      for name, deltas in report['comparison'].items():
+        self.stdout.write(f"  {name:<16}" + '  '.join(f"{key} {value:+}" for key, value in deltas.items()))
@@ -0,0 +1,153 @@
+import json
+import statistics
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+  CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+)
+from rest_framework.test import APIClient
+
+from cs_app.models import User, Category, Product, BlogPost
+from cs_app.seed import DEFAULTS, seed
+
+
+def plan_indexes():
+  """Index déclarés dans les Meta.indexes de cs_app : le plan d'index mesuré ici"""
+  return [
+    (model, index)
+    for model in apps.get_app_config('cs_app').get_models()
+    for index in model._meta.indexes
+  ]
+
+
+class Command(BaseCommand):
+  help = (
+    "Crée une base jetable, la remplit avec un volume réaliste et mesure chaque vue "
+    "de cs_app avec et sans le plan d'index (plans d'exécution et latences)"
+  )
+
+  def add_arguments(self, parser):
+    for name, default in DEFAULTS.items():
+      parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=default)
+    parser.add_argument('--runs', type=int, default=20, help="Requêtes mesurées par scénario")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', dest='json_path', help="Écrit aussi le rapport en JSON dans ce fichier")
+
+  def handle(self, *args, **options):
+    counts = {name: options[name] for name in DEFAULTS}
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+    setup_test_environment()
+    try:
+      self.stdout.write("Remplissage de la base de benchmark...")
+      seed(seed=options['seed'], stdout=self.stdout, **counts)
+      # réponses jamais servies depuis le cache, mais versions et index en mémoire stables
+      with override_settings(CATALOG_CACHE_TIMEOUT=0):
+        report = self.run(options['runs'])
+    finally:
+      teardown_test_environment()
+      connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    self.print_report(report)
+    if options['json_path']:
+      with open(options['json_path'], 'w') as output:
+        json.dump(report, output, indent=2, ensure_ascii=False)
+
+  def scenarios(self):
+    user = User.objects.filter(orders__isnull=False).first()
+    category = Category.objects.filter(products__in_stock=True).first()
+    product = Product.objects.order_by('pk').first()
+    post = BlogPost.objects.filter(published=True).first()
+    anonymous = APIClient()
+    authenticated = APIClient()
+    authenticated.force_authenticate(user)
+    return [
+      ('produits', '/products/', {}, anonymous),
+      ('produits vedettes', '/products/', {'featured': 'true'}, anonymous),
+      ('produits par catégorie', '/products/', {'category': category.pk}, anonymous),
+      ('produits par prix', '/products/', {'ordering': 'price'}, anonymous),
+      ('produits page 50', '/products/', {'page': 50}, anonymous),
+      ('produits recherche', '/products/', {'search': 'acier'}, anonymous),
+      ('détail produit', f'/products/{product.pk}/', {}, anonymous),
+      ('catégories', '/categories/', {}, anonymous),
+      ('promotions', '/promotions/', {}, anonymous),
+      ('articles', '/blog/', {}, anonymous),
+      ('détail article', f'/blog/{post.pk}/', {}, anonymous),
+      ('panier', '/cart/', {}, authenticated),
+      ('commandes', '/orders/', {}, authenticated),
+    ]
+
+  def measure(self, client, url, params, runs):
+    client.get(url, params)
+    timings = []
+    for _ in range(runs):
+      start = time.perf_counter()
+      with CaptureQueriesContext(connection) as ctx:
+        response = client.get(url, params)
+      timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+      'status': response.status_code,
+      'queries': len(ctx.captured_queries),
+      'median_ms': round(statistics.median(timings), 2),
+      'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 2),
+      'plans': [self.explain(query['sql']) for query in ctx.captured_queries],
+    }
+
+  def explain(self, sql):
+    if not sql.lstrip().upper().startswith('SELECT'):
+      return None
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+      cursor.execute(prefix + sql)
+      rows = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+      return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+  def set_indexes(self, enabled):
+    with connection.schema_editor() as editor:
+      for model, index in plan_indexes():
+        if enabled:
+          editor.add_index(model, index)
+        else:
+          editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+      cursor.execute('ANALYZE')
+
+  def run(self, runs):
+    scenarios = self.scenarios()
+    report = {'indexes': [index.name for _, index in plan_indexes()], 'scenarios': {}}
+    # la base migrée a déjà les index : on mesure « après », puis « avant » sans eux
+    for phase in ('after', 'before'):
+      if phase == 'before':
+        self.set_indexes(False)
+      else:
+        with connection.cursor() as cursor:
+          cursor.execute('ANALYZE')
+      for label, url, params, client in scenarios:
+        self.stdout.write(f"[{phase}] {label}")
+        report['scenarios'].setdefault(label, {})[phase] = self.measure(client, url, params, runs)
+    self.set_indexes(True)
+    return report
+
+  def print_report(self, report):
+    self.stdout.write("")
+    self.stdout.write(f"{'scénario':<26}{'requêtes':>9}{'avant (ms)':>12}{'après (ms)':>12}{'gain':>8}")
+    for label, phases in report['scenarios'].items():
+      before, after = phases['before'], phases['after']
+      gain = before['median_ms'] / after['median_ms'] if after['median_ms'] else 0
+      self.stdout.write(
+        f"{label:<26}{after['queries']:>9}{before['median_ms']:>12}{after['median_ms']:>12}{gain:>7.1f}x"
+      )
+    self.stdout.write("")
+    for label, phases in report['scenarios'].items():
+      self.stdout.write(self.style.MIGRATE_HEADING(label))
+      for phase in ('before', 'after'):
+        steps = sorted({
+          step for plan in phases[phase]['plans'] if plan
+          for step in plan if step.startswith(('SCAN', 'SEARCH', 'USE TEMP'))
+        })
+        self.stdout.write(f"  {phase}: " + ('; '.join(steps) or '-'))
@@ -0,0 +1,96 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from cs_app.models import Product
+from cs_app.promotions import get_engine
+from cs_app.renderers import FastJSONRenderer, orjson
+from cs_app.seed import seed
+from cs_app.serializers import ProductListSerializer, ProductListValuesSerializer
+
+
+class Command(BaseCommand):
+  help = (
+    "Coût par ligne de la liste des produits : ProductListSerializer (instances et préchargements) "
+    "contre ProductListValuesSerializer (lignes values()), puis rendu JSON de DRF contre orjson"
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--products', type=int, default=2000, help="Produits créés dans la base jetable")
+    parser.add_argument('--rows', type=int, nargs='+', default=[20, 100, 500], help="Tailles de page mesurées")
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--json', dest='json_path', help="Écrit aussi le rapport en JSON dans ce fichier")
+
+  def handle(self, *args, **options):
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+    setup_test_environment()
+    try:
+      seed(products=options['products'], users=10, carts=0, orders=0, posts=0)
+      request = APIRequestFactory().get('/products/')
+      report = {'orjson': orjson is not None, 'rows': {}}
+      for rows in options['rows']:
+        report['rows'][rows] = self.measure(request, rows, options['runs'])
+    finally:
+      teardown_test_environment()
+      connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    self.print_report(report)
+    if options['json_path']:
+      with open(options['json_path'], 'w') as output:
+        json.dump(report, output, indent=2)
+
+  def time(self, function, runs):
+    function()
+    timings = []
+    for _ in range(runs):
+      started = time.perf_counter()
+      result = function()
+      timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+  def measure(self, request, rows, runs):
+    queryset = Product.objects.filter(in_stock=True).with_list_relations().order_by('-created_at', '-pk')[:rows]
+    columns = ProductListValuesSerializer.columns()
+    values = Product.objects.filter(in_stock=True).order_by('-created_at', '-pk').values(*columns)[:rows]
+
+    def model_serializer():
+      products = list(queryset)
+      context = {'request': request, 'prices': get_engine().price_products(products)}
+      return ProductListSerializer(products, many=True, context=context).data
+
+    def values_serializer():
+      return ProductListValuesSerializer(context={'request': request}).to_representation(list(values))
+
+    model_time, data = self.time(model_serializer, runs)
+    values_time, values_data = self.time(values_serializer, runs)
+    drf_render, _ = self.time(lambda: JSONRenderer().render(data), runs)
+    fast_render, _ = self.time(lambda: FastJSONRenderer().render(data), runs)
+    count = len(values_data) or 1
+    return {
+      'same_output': JSONRenderer().render(data) == JSONRenderer().render(values_data),
+      'model_serializer_us_per_row': round(model_time / count * 1e6, 2),
+      'values_serializer_us_per_row': round(values_time / count * 1e6, 2),
+      'drf_render_us_per_row': round(drf_render / count * 1e6, 2),
+      'fast_render_us_per_row': round(fast_render / count * 1e6, 2),
+    }
+
+  def print_report(self, report):
+    if not report['orjson']:
+      self.stdout.write(self.style.WARNING("orjson n'est pas installé : FastJSONRenderer rend par DRF"))
+    self.stdout.write("Lecture + sérialisation, puis rendu JSON (µs par ligne, médiane)")
+    self.stdout.write(
+      f"{'lignes':>7}{'ModelSerializer':>17}{'values()':>10}{'gain':>7}{'rendu DRF':>11}{'orjson':>9}{'gain':>7}{'identique':>11}"
+    )
+    for rows, result in report['rows'].items():
+      model, values = result['model_serializer_us_per_row'], result['values_serializer_us_per_row']
+      drf, fast = result['drf_render_us_per_row'], result['fast_render_us_per_row']
+      self.stdout.write(
+        f"{rows:>7}{model:>17}{values:>10}{model / values if values else 0:>6.1f}x"
+        f"{drf:>11}{fast:>9}{drf / fast if fast else 0:>6.1f}x{'oui' if result['same_output'] else 'NON':>11}"
+      )
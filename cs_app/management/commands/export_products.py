@@ -0,0 +1,24 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from cs_app.catalog_io import FORMATS, guess_format, export_products
+
+
+class Command(BaseCommand):
+  help = "Exporte le catalogue en CSV ou JSON Lines, par tranches, sans le charger en mémoire"
+
+  def add_arguments(self, parser):
+    parser.add_argument('path', nargs='?', default='-', help="Fichier de sortie ('-' pour la sortie standard)")
+    parser.add_argument('--format', choices=FORMATS, help="Par défaut, déduit de l'extension du fichier")
+    parser.add_argument('--chunk-size', type=int, default=2000)
+
+  def handle(self, *args, **options):
+    path = options['path']
+    file_format = options['format'] or guess_format(path)
+    lines = export_products(file_format, chunk_size=options['chunk_size'])
+    if path == '-':
+      sys.stdout.writelines(lines)
+      return
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+      output.writelines(lines)
@@ -0,0 +1,17 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from cs_app.images import IMAGE_FIELDS, regenerate
+
+
+class Command(BaseCommand):
+  help = "Génère les déclinaisons (vignettes, WebP) manquantes ou périmées des images déjà envoyées"
+
+  def add_arguments(self, parser):
+    parser.add_argument('--model', choices=sorted(IMAGE_FIELDS), action='append', help="Limite à ce modèle (répétable)")
+
+  def handle(self, *args, **options):
+    for name in options['model'] or sorted(IMAGE_FIELDS):
+      model = apps.get_model('cs_app', name)
+      done = regenerate(model, progress=lambda count: self.stdout.write(f"  {name} : {count} image(s)"))
+      self.stdout.write(f"{name} : {done} image(s) déclinée(s)")
@@ -0,0 +1,38 @@
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cs_app.catalog_io import FORMATS, guess_format, import_products
+
+
+class Command(BaseCommand):
+  help = "Importe (crée ou met à jour par slug) des produits depuis un fichier CSV ou JSON Lines"
+
+  def add_arguments(self, parser):
+    parser.add_argument('path', help="Fichier à importer ('-' pour l'entrée standard)")
+    parser.add_argument('--format', choices=FORMATS, help="Par défaut, déduit de l'extension du fichier")
+    parser.add_argument('--batch-size', type=int, default=2000)
+
+  def handle(self, *args, **options):
+    path = options['path']
+    file_format = options['format'] or guess_format(path)
+    start = time.perf_counter()
+
+    def progress(processed, imported):
+      self.stdout.write(f"  {processed} ligne(s) lue(s), {imported} produit(s) importé(s)")
+
+    try:
+      stream = nullcontext(sys.stdin) if path == '-' else open(path, encoding='utf-8-sig', newline='')
+    except OSError as exc:
+      raise CommandError(exc)
+    with stream as lines:
+      report = import_products(lines, format=file_format, batch_size=options['batch_size'], progress=progress)
+
+    for error in report['errors']:
+      self.stderr.write(f"ligne {error['line']} : {error['error']}")
+    self.stdout.write(
+      f"{report['imported']} produit(s) importé(s) sur {report['processed']} ligne(s), "
+      f"{report['error_count']} erreur(s) en {time.perf_counter() - start:.1f} s"
+    )
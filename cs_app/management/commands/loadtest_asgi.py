@@ -0,0 +1,163 @@
+import asyncio
+import importlib.util
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# (nom, chemin synchrone, chemin asynchrone) : mêmes lectures, même réponse
+SCENARIOS = [
+  ('produits', '/products/', '/async/products/'),
+  ('produits vedettes', '/products/?featured=true', '/async/products/?featured=true'),
+  ('produits curseur', '/products/?pagination=cursor', '/async/products/?pagination=cursor'),
+  ('catégories', '/categories/', '/async/categories/'),
+  ('promotions', '/promotions/', '/async/promotions/'),
+  ('articles', '/blog/', '/async/blog/'),
+]
+
+
+def free_port():
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+
+async def fetch(host, port, path):
+  """GET HTTP/1.1 minimal (connexion fermée après la réponse) ; retourne le code de statut"""
+  reader, writer = await asyncio.open_connection(host, port)
+  try:
+    writer.write(
+      f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: application/json\r\nConnection: close\r\n\r\n'.encode()
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    await reader.read()
+    return status
+  finally:
+    writer.close()
+
+
+async def load(url, path, concurrency, requests):
+  """Envoie `requests` requêtes avec `concurrency` clients simultanés ; latences en secondes"""
+  parts = urlsplit(url)
+  host, port = parts.hostname, parts.port or 80
+  latencies, errors = [], 0
+  remaining = iter(range(requests))
+
+  async def client():
+    nonlocal errors
+    for _ in remaining:
+      started = time.perf_counter()
+      try:
+        status = await fetch(host, port, path)
+      except (OSError, ValueError, IndexError):
+        status = 0
+      latencies.append(time.perf_counter() - started)
+      if status != 200:
+        errors += 1
+
+  started = time.perf_counter()
+  await asyncio.gather(*[client() for _ in range(concurrency)])
+  elapsed = time.perf_counter() - started
+  return latencies, errors, elapsed
+
+
+def summarize(latencies, errors, elapsed):
+  ordered = sorted(latencies)
+  quantiles = statistics.quantiles(ordered, n=100) if len(ordered) > 1 else ordered * 99
+  return {
+    'requests': len(ordered),
+    'errors': errors,
+    'rps': round(len(ordered) / elapsed, 1) if elapsed else 0,
+    'p50_ms': round(quantiles[49] * 1000, 2),
+    'p99_ms': round(quantiles[98] * 1000, 2),
+  }
+
+
+class Command(BaseCommand):
+  help = (
+    "Compare sous charge les lectures du catalogue servies en WSGI (gunicorn, vues synchrones) "
+    "et en ASGI (uvicorn, vues /async/) : débit, p50 et p99"
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--asgi-url', help="Serveur ASGI déjà démarré (sinon uvicorn est lancé)")
+    parser.add_argument('--wsgi-url', help="Serveur WSGI déjà démarré (sinon gunicorn est lancé)")
+    parser.add_argument('--workers', type=int, default=2, help="Processus par serveur lancé")
+    parser.add_argument('--concurrency', type=int, default=50, help="Clients simultanés")
+    parser.add_argument('--requests', type=int, default=1000, help="Requêtes par scénario")
+    parser.add_argument('--json', dest='json_path', help="Écrit aussi le rapport en JSON dans ce fichier")
+
+  def handle(self, *args, **options):
+    servers = []
+    try:
+      asgi_url = options['asgi_url'] or self.start(servers, 'uvicorn', [
+        sys.executable, '-m', 'uvicorn', 'cs_project.asgi:application',
+        '--workers', str(options['workers']), '--log-level', 'warning',
+      ], '--host', '--port')
+      wsgi_url = options['wsgi_url'] or self.start(servers, 'gunicorn', [
+        sys.executable, '-m', 'gunicorn', 'cs_project.wsgi:application',
+        '--workers', str(options['workers']), '--log-level', 'warning',
+      ], '--bind')
+      report = asyncio.run(self.run(wsgi_url, asgi_url, options['concurrency'], options['requests']))
+    finally:
+      for server in servers:
+        server.terminate()
+        server.wait()
+
+    self.print_report(report)
+    if options['json_path']:
+      with open(options['json_path'], 'w') as output:
+        json.dump(report, output, indent=2, ensure_ascii=False)
+
+  def start(self, servers, module, command, *address):
+    if importlib.util.find_spec(module) is None:
+      raise CommandError(f"{module} n'est pas installé : démarrez le serveur vous-même et passez son URL")
+    port = free_port()
+    if len(address) == 2:
+      command += [address[0], '127.0.0.1', address[1], str(port)]
+    else:
+      command += [address[0], f'127.0.0.1:{port}']
+    servers.append(subprocess.Popen(command))
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+      try:
+        socket.create_connection(('127.0.0.1', port), timeout=1).close()
+        return f'http://127.0.0.1:{port}'
+      except OSError:
+        if servers[-1].poll() is not None:
+          raise CommandError(f"{module} s'est arrêté au démarrage")
+        time.sleep(0.2)
+    raise CommandError(f"{module} ne répond pas sur le port {port}")
+
+  async def run(self, wsgi_url, asgi_url, concurrency, requests):
+    report = []
+    for name, sync_path, async_path in SCENARIOS:
+      row = {'scenario': name}
+      for label, url, path in (('wsgi', wsgi_url, sync_path), ('asgi', asgi_url, async_path)):
+        # une première requête remplit le cache : on mesure le régime établi
+        await load(url, path, 1, 1)
+        row[label] = summarize(*await load(url, path, concurrency, requests))
+      report.append(row)
+      self.stdout.write(f"{name} : mesuré")
+    return report
+
+  def print_report(self, report):
+    self.stdout.write('')
+    self.stdout.write(
+      f"{'scénario':<22}{'wsgi req/s':>12}{'p50':>9}{'p99':>9}{'asgi req/s':>12}{'p50':>9}{'p99':>9}{'erreurs':>9}"
+    )
+    for row in report:
+      wsgi, asgi = row['wsgi'], row['asgi']
+      self.stdout.write(
+        f"{row['scenario']:<22}"
+        f"{wsgi['rps']:>12}{wsgi['p50_ms']:>9}{wsgi['p99_ms']:>9}"
+        f"{asgi['rps']:>12}{asgi['p50_ms']:>9}{asgi['p99_ms']:>9}"
+        f"{wsgi['errors'] + asgi['errors']:>9}"
+      )
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cs_app.retention import cart_cutoff, history_cutoff, purge_abandoned_carts, rollup_inventory_history
+
+
+class Command(BaseCommand):
+  help = (
+    "Supprime les paniers abandonnés et regroupe par jour les mouvements de stock anciens, "
+    "par lots courts"
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--cart-days', type=int, help="Âge des paniers abandonnés (défaut : CART_RETENTION_DAYS)")
+    parser.add_argument(
+      '--history-days', type=int,
+      help="Âge du détail des mouvements de stock conservé (défaut : INVENTORY_HISTORY_RETENTION_DAYS)"
+    )
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument(
+      '--interval', type=int, default=0,
+      help="Tourne en boucle toutes les N secondes (0 = une seule passe)"
+    )
+
+  def handle(self, *args, **options):
+    batch_size = options['batch_size']
+    while True:
+      carts = purge_abandoned_carts(
+        cart_cutoff(options['cart_days']), batch_size=batch_size,
+        progress=lambda done: self.stdout.write(f"  paniers : {done} supprimé(s)")
+      )
+      self.stdout.write(f"{carts} panier(s) abandonné(s) supprimé(s)")
+      movements = rollup_inventory_history(
+        history_cutoff(options['history_days']), batch_size=batch_size,
+        progress=lambda done: self.stdout.write(f"  mouvements : {done} regroupé(s)")
+      )
+      self.stdout.write(f"{movements} mouvement(s) de stock regroupé(s) par jour")
+      if not options['interval']:
+        return
+      time.sleep(options['interval'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cs_app.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+  help = "Reconstruit l'index plein texte des produits (SQLite FTS5)"
+
+  def handle(self, *args, **options):
+    if not fts_available():
+      self.stdout.write("Index FTS5 indisponible sur cette base, rien à faire")
+      return
+    count = rebuild_index()
+    self.stdout.write(f"{count} produit(s) indexé(s)")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cs_app.reservations import release_expired
+
+
+class Command(BaseCommand):
+  help = "Libère le stock retenu par les réservations de panier expirées"
+
+  def add_arguments(self, parser):
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument(
+      '--interval', type=int, default=0,
+      help="Tourne en boucle toutes les N secondes (0 = une seule passe)"
+    )
+
+  def handle(self, *args, **options):
+    while True:
+      released = release_expired(batch_size=options['batch_size'])
+      self.stdout.write(f"{released} réservation(s) expirée(s) libérée(s)")
+      if not options['interval']:
+        return
+      time.sleep(options['interval'])
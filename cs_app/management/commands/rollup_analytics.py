@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cs_app.analytics import rebuild_sales, snapshot_stock
+
+
+class Command(BaseCommand):
+  help = (
+    "Relève les niveaux de stock du jour pour l'analyse ; avec --rebuild, recalcule aussi "
+    "les cumuls de ventes depuis les commandes confirmées"
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--rebuild', action='store_true', help="Recalcule tous les cumuls de ventes (reprise)")
+    parser.add_argument(
+      '--interval', type=int, default=0,
+      help="Relève le stock en boucle toutes les N secondes (0 = une seule passe)"
+    )
+
+  def handle(self, *args, **options):
+    if options['rebuild']:
+      days = rebuild_sales()
+      self.stdout.write(f"Cumuls de ventes recalculés sur {days} jour(s)")
+    while True:
+      row = snapshot_stock()
+      self.stdout.write(
+        f"{row.day} : {row.tracked} stock(s) suivi(s), {row.low_stock} sous le seuil, {row.out_of_stock} épuisé(s)"
+      )
+      if not options['interval']:
+        return
+      time.sleep(options['interval'])
@@ -0,0 +1,167 @@
+"""
+Mesures de performance par vue, pour cs_app/middleware.py.
+
+Chaque requête instrumentée porte un RequestMetrics (variable de contexte,
+propagée aux threads de sync_to_async) que remplissent le middleware, le
+wrapper d'exécution SQL posé sur chaque connexion et le chronométrage de
+Serializer.data. À la fin de la requête, les valeurs rejoignent les
+histogrammes du registre, exposés au format texte de Prometheus.
+
+Le registre est propre au processus : avec plusieurs workers, Prometheus doit
+interroger chacun d'eux (ou agréger par instance).
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+from rest_framework.serializers import BaseSerializer
+
+
+# secondes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# requêtes SQL par requête HTTP
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+current = ContextVar('cs_app_request_metrics', default=None)
+
+
+class RequestMetrics:
+  def __init__(self, keep_queries=False):
+    self.started = time.perf_counter()
+    self.queries = 0
+    self.db_time = 0.0
+    self.serializer_time = 0.0
+    self.serializing = 0
+    # (sql, durée) de chaque requête, seulement si une requête lente doit être journalisée
+    self.query_log = [] if keep_queries else None
+
+  def elapsed(self):
+    return time.perf_counter() - self.started
+
+
+def record_query(execute, sql, params, many, context):
+  """Wrapper d'exécution SQL (connection.execute_wrappers) : compte et chronomètre"""
+  metrics = current.get()
+  if metrics is None:
+    return execute(sql, params, many, context)
+  started = time.perf_counter()
+  try:
+    return execute(sql, params, many, context)
+  finally:
+    duration = time.perf_counter() - started
+    metrics.queries += 1
+    metrics.db_time += duration
+    if metrics.query_log is not None:
+      metrics.query_log.append((sql, duration))
+
+
+def install_query_wrapper(connection, **kwargs):
+  # posé une fois par connexion (signal connection_created), sans effet hors requête instrumentée
+  if record_query not in connection.execute_wrappers:
+    connection.execute_wrappers.append(record_query)
+
+
+_serializer_data = BaseSerializer.data
+
+
+def _timed_data(self):
+  metrics = current.get()
+  if metrics is None or metrics.serializing:
+    return _serializer_data.fget(self)
+  # seul le serializer de plus haut niveau est chronométré (requêtes SQL comprises)
+  metrics.serializing += 1
+  started = time.perf_counter()
+  try:
+    return _serializer_data.fget(self)
+  finally:
+    metrics.serializer_time += time.perf_counter() - started
+    metrics.serializing -= 1
+
+
+def install_serializer_timing():
+  BaseSerializer.data = property(_timed_data)
+
+
+class Histogram:
+  def __init__(self, buckets):
+    self.buckets = buckets
+    self.counts = [0] * len(buckets)
+    self.count = 0
+    self.sum = 0.0
+
+  def observe(self, value):
+    self.count += 1
+    self.sum += value
+    for index, bound in enumerate(self.buckets):
+      if value <= bound:
+        self.counts[index] += 1
+
+
+class Registry:
+  """Compteurs et histogrammes par (vue, méthode), protégés par un verrou"""
+
+  HISTOGRAMS = {
+    'cs_request_duration_seconds': ("Durée de traitement de la requête", LATENCY_BUCKETS),
+    'cs_request_db_queries': ("Requêtes SQL par requête HTTP", QUERY_BUCKETS),
+    'cs_request_db_duration_seconds': ("Temps passé en base par requête HTTP", LATENCY_BUCKETS),
+    'cs_request_serializer_duration_seconds': ("Temps de sérialisation par requête HTTP", LATENCY_BUCKETS),
+  }
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    self.histograms = {name: {} for name in self.HISTOGRAMS}
+    self.requests = {}
+    self.cache = {}
+
+  def observe(self, view, method, status, metrics, elapsed, cache_result=None):
+    values = {
+      'cs_request_duration_seconds': elapsed,
+      'cs_request_db_queries': metrics.queries,
+      'cs_request_db_duration_seconds': metrics.db_time,
+      'cs_request_serializer_duration_seconds': metrics.serializer_time,
+    }
+    labels = (view, method)
+    with self.lock:
+      for name, value in values.items():
+        series = self.histograms[name]
+        if labels not in series:
+          series[labels] = Histogram(self.HISTOGRAMS[name][1])
+        series[labels].observe(value)
+      key = (view, method, str(status))
+      self.requests[key] = self.requests.get(key, 0) + 1
+      if cache_result is not None:
+        key = (view, cache_result.lower())
+        self.cache[key] = self.cache.get(key, 0) + 1
+
+  def render(self):
+    """Exposition au format texte de Prometheus (version 0.0.4)"""
+    lines = []
+    with self.lock:
+      lines += [
+        '# HELP cs_requests_total Requêtes HTTP traitées',
+        '# TYPE cs_requests_total counter',
+      ]
+      for (view, method, status), value in sorted(self.requests.items()):
+        lines.append(f'cs_requests_total{{view="{view}",method="{method}",status="{status}"}} {value}')
+      lines += [
+        '# HELP cs_response_cache_total Réponses servies depuis le cache (hit) ou recalculées (miss)',
+        '# TYPE cs_response_cache_total counter',
+      ]
+      for (view, result), value in sorted(self.cache.items()):
+        lines.append(f'cs_response_cache_total{{view="{view}",result="{result}"}} {value}')
+      for name, (description, _) in self.HISTOGRAMS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for (view, method), histogram in sorted(self.histograms[name].items()):
+          labels = f'view="{view}",method="{method}"'
+          for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+          lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+          lines.append(f'{name}_sum{{{labels}}} {round(histogram.sum, 6)}')
+          lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
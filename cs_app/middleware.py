@@ -0,0 +1,149 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+  import brotli
+except ImportError:  # dépendance optionnelle : sans elle, gzip seulement
+  brotli = None
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class PerformanceMiddleware:
+  """
+  Latence, requêtes SQL (nombre et durée), résultat du cache et temps de
+  sérialisation de chaque requête, par vue.
+
+  Les mesures sont renvoyées dans l'en-tête Server-Timing, agrégées dans
+  metrics.registry (exposé par /metrics/) et, au-delà de METRICS_SLOW_REQUEST_MS,
+  journalisées avec la liste complète des requêtes SQL. Avec METRICS_ENABLED à
+  False, le middleware se retire de la chaîne au démarrage : aucun coût.
+  """
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response):
+    if not getattr(settings, 'METRICS_ENABLED', False):
+      raise MiddlewareNotUsed
+    self.get_response = get_response
+    self.slow_ms = getattr(settings, 'METRICS_SLOW_REQUEST_MS', None)
+    connection_created.connect(metrics.install_query_wrapper, dispatch_uid='cs_app-metrics-queries')
+    for connection in connections.all(initialized_only=True):
+      metrics.install_query_wrapper(connection)
+    metrics.install_serializer_timing()
+    if iscoroutinefunction(get_response):
+      markcoroutinefunction(self)
+
+  def __call__(self, request):
+    if iscoroutinefunction(self):
+      return self.__acall__(request)
+    request_metrics, token = self.start()
+    try:
+      response = self.get_response(request)
+    finally:
+      metrics.current.reset(token)
+    return self.finish(request, response, request_metrics)
+
+  async def __acall__(self, request):
+    request_metrics, token = self.start()
+    try:
+      response = await self.get_response(request)
+    finally:
+      metrics.current.reset(token)
+    return self.finish(request, response, request_metrics)
+
+  def start(self):
+    request_metrics = metrics.RequestMetrics(keep_queries=self.slow_ms is not None)
+    return request_metrics, metrics.current.set(request_metrics)
+
+  def finish(self, request, response, request_metrics):
+    elapsed = request_metrics.elapsed()
+    match = request.resolver_match
+    view = (match.view_name if match else None) or 'unresolved'
+    cache_result = response.get('X-Cache')
+    metrics.registry.observe(view, request.method, response.status_code, request_metrics, elapsed, cache_result)
+
+    timings = [
+      f'total;dur={elapsed * 1000:.1f}',
+      f'db;dur={request_metrics.db_time * 1000:.1f};desc="{request_metrics.queries} SQL"',
+      f'serializer;dur={request_metrics.serializer_time * 1000:.1f}',
+    ]
+    if cache_result:
+      timings.append(f'cache;desc="{cache_result}"')
+    response['Server-Timing'] = ', '.join(timings)
+
+    if self.slow_ms is not None and elapsed * 1000 >= self.slow_ms:
+      logger.warning(
+        "Requête lente : %s %s (%s) %.0f ms, %d requête(s) SQL en %.0f ms\n%s",
+        request.method, request.get_full_path(), view, elapsed * 1000,
+        request_metrics.queries, request_metrics.db_time * 1000,
+        '\n'.join(f'{duration * 1000:8.1f} ms  {sql}' for sql, duration in request_metrics.query_log),
+      )
+    return response
+
+
+def accepted_encodings(request):
+  """Codages acceptés par Accept-Encoding (ceux à q=0 exclus)"""
+  accepted = set()
+  for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+    coding, _, params = part.strip().partition(';')
+    quality = params.strip().removeprefix('q=')
+    try:
+      if params and float(quality) == 0:
+        continue
+    except ValueError:
+      continue
+    if coding:
+      accepted.add(coding.strip().lower())
+  return accepted
+
+
+class CompressionMiddleware(GZipMiddleware):
+  """
+  Compression brotli (si le paquet brotli est installé) ou gzip des réponses
+  JSON d'au moins COMPRESSION_MIN_SIZE octets, selon Accept-Encoding.
+
+  En dessous du seuil, le gain ne paie pas le temps de compression. Les
+  réponses en flux (exports) et les autres types de contenu passent tels quels.
+  """
+  # qualité 11 (défaut) : trop lente pour des réponses dynamiques
+  brotli_quality = 5
+
+  def process_response(self, request, response):
+    if (
+      response.streaming or response.has_header('Content-Encoding')
+      or not response.get('Content-Type', '').startswith('application/json')
+      or len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+    ):
+      return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+
+    accepted = accepted_encodings(request)
+    if brotli is not None and 'br' in accepted:
+      encoding, compressed = 'br', brotli.compress(response.content, quality=self.brotli_quality)
+    elif 'gzip' in accepted or '*' in accepted:
+      encoding, compressed = 'gzip', compress_string(response.content, max_random_bytes=self.max_random_bytes)
+    else:
+      return response
+    if len(compressed) >= len(response.content):
+      return response
+
+    response.content = compressed
+    response['Content-Length'] = str(len(compressed))
+    response['Content-Encoding'] = encoding
+    # comme GZipMiddleware : le corps change, un ETag fort devient faible
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+      response['ETag'] = 'W/' + etag
+    return response
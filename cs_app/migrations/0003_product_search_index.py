@@ -0,0 +1,42 @@
+from django.db import migrations, OperationalError
+
+
+FTS_TABLE = 'cs_app_product_fts'
+
+
+def create_fts_index(apps, schema_editor):
+    # index FTS5 uniquement sur SQLite ; PostgreSQL passe par django.contrib.postgres.search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, description, category, attributes, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        # SQLite compilé sans FTS5 : cs_app.search se rabat sur LIKE
+        return
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, name, description, category, attributes) "
+        "SELECT p.id, p.name, p.description, c.name, "
+        "COALESCE((SELECT group_concat(v.value, ' ') FROM cs_app_productattributevalue v "
+        "WHERE v.product_id = p.id), '') "
+        "FROM cs_app_product p JOIN cs_app_category c ON c.id = p.category_id"
+    )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cs_app', '0002_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
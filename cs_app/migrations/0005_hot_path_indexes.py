@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cs_app', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_created_keyset',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_price_keyset',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_name_keyset',
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(condition=models.Q(('session_key__isnull', False)), fields=['session_key'], name='cart_session_key'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['-created_at', '-id'], name='product_created_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['price', 'id'], name='product_price_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['name', 'id'], name='product_name_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['category', '-created_at', '-id'], name='product_category_created'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('featured', True), ('in_stock', True)), fields=['-created_at', '-id'], name='product_featured_created'),
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(condition=models.Q(('active', True)), fields=['valid_to'], name='promotion_active_valid_to'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:36
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, PositiveIntegerField, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def compute_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('cs_app', 'Cart')
+    CartItem = apps.get_model('cs_app', 'CartItem')
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    Cart.objects.update(
+        subtotal=Coalesce(
+            Subquery(lines.annotate(total=Sum(F('quantity') * F('product__price'))).values('total')),
+            Value(0), output_field=DecimalField(max_digits=10, decimal_places=2)
+        ),
+        item_count=Coalesce(
+            Subquery(lines.annotate(count=Sum('quantity')).values('count')),
+            Value(0), output_field=PositiveIntegerField()
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cs_app', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(compute_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cs_app', '0007_cart_item_unique_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryHistoryDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity_changed', models.IntegerField(default=0)),
+                ('movements', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['updated_at'], name='cart_updated_at'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryhistory',
+            index=models.Index(fields=['created_at'], name='inventory_history_created'),
+        ),
+        migrations.AddField(
+            model_name='inventoryhistorydaily',
+            name='inventory',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_history', to='cs_app.inventory'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventoryhistorydaily',
+            constraint=models.UniqueConstraint(fields=('inventory', 'day'), name='unique_inventory_day'),
+        ),
+    ]
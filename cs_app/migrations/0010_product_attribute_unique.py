@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:45
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_values(apps, schema_editor):
+    # garde la valeur la plus récente de chaque attribut avant d'ajouter la contrainte
+    ProductAttributeValue = apps.get_model('cs_app', 'ProductAttributeValue')
+    duplicates = (
+        ProductAttributeValue.objects.values('product', 'attribute')
+        .annotate(lines=Count('id'), keep=Max('id'))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        ProductAttributeValue.objects.filter(
+            product=row['product'], attribute=row['attribute']
+        ).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cs_app', '0009_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_values, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productattributevalue',
+            constraint=models.UniqueConstraint(fields=('product', 'attribute'), name='unique_product_attribute'),
+        ),
+    ]
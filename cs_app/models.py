@@ -11,6 +11,34 @@ class User(AbstractUser):
 class UserProfile(models.Model):
   user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
   avatar = models.ImageField(upload_to="media/users_profile", blank=True)
+  # déclinaisons générées par cs_app/images.py : {nom: chemin dans le stockage}
+  variants = models.JSONField(default=dict, blank=True, editable=False)
+
+
+class CategoryQuerySet(models.QuerySet):
+  def product_counts(self):
+    """
+    Retourne {id: (produits directs, produits incluant les sous-catégories)}
+    pour tout l'arbre, calculé à partir d'une seule requête agrégée.
+    """
+    rows = self.model.objects.values('id', 'parent_id').annotate(direct=models.Count('products')).order_by()
+    direct = {}
+    children = {}
+    for row in rows:
+      direct[row['id']] = row['direct']
+      children.setdefault(row['parent_id'], []).append(row['id'])
+
+    totals = {}
+    # parcours en profondeur itératif : les enfants sont cumulés avant leur parent
+    stack = [(root, False) for root in children.get(None, [])]
+    while stack:
+      node, expanded = stack.pop()
+      if expanded:
+        totals[node] = direct[node] + sum(totals[child] for child in children.get(node, []))
+        continue
+      stack.append((node, True))
+      stack.extend((child, False) for child in children.get(node, []) if child not in totals)
+    return {pk: (count, totals.get(pk, count)) for pk, count in direct.items()}
 
 
 class Category(models.Model):
@@ -18,8 +46,24 @@ class Category(models.Model):
   slug = models.CharField(unique=True)
   description = models.TextField(blank=True)
   image = models.ImageField(upload_to="media/categories/", blank=True)
+  # déclinaisons générées par cs_app/images.py : {nom: chemin dans le stockage}
+  variants = models.JSONField(default=dict, blank=True, editable=False)
   parent =models.ForeignKey('self',on_delete=models.CASCADE, blank=True, null=True, related_name='children')
 
+  objects = CategoryQuerySet.as_manager()
+
+
+class ProductQuerySet(models.QuerySet):
+  def with_list_relations(self):
+    """Charge la catégorie et l'image par défaut en un nombre constant de requêtes"""
+    return self.select_related('category').prefetch_related(
+      models.Prefetch(
+        'images',
+        queryset=ProductImage.objects.filter(is_default=True),
+        to_attr='default_images'
+      )
+    )
+
 
 class Product(models.Model):
   name = models.CharField(max_length=50)
@@ -33,11 +77,26 @@ class Product(models.Model):
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
 
+  objects = ProductQuerySet.as_manager()
+
+  class Meta:
+    # ProductListView ne liste que les produits en stock : index partiels sur in_stock,
+    # un par tri proposé (départagé par l'id pour la pagination par curseur)
+    indexes = [
+      models.Index(fields=['-created_at', '-id'], condition=models.Q(in_stock=True), name='product_created_keyset'),
+      models.Index(fields=['price', 'id'], condition=models.Q(in_stock=True), name='product_price_keyset'),
+      models.Index(fields=['name', 'id'], condition=models.Q(in_stock=True), name='product_name_keyset'),
+      models.Index(fields=['category', '-created_at', '-id'], condition=models.Q(in_stock=True), name='product_category_created'),
+      models.Index(fields=['-created_at', '-id'], condition=models.Q(in_stock=True, featured=True), name='product_featured_created'),
+    ]
+
 
 class ProductImage(models.Model):
   product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
   image = models.ImageField(upload_to="media/Products", blank=True)
   alt_text = models.CharField(max_length=100, blank=True)
+  # déclinaisons générées par cs_app/images.py : {nom: chemin dans le stockage}
+  variants = models.JSONField(default=dict, blank=True, editable=False)
   is_default = models.BooleanField(default=False)
 
 
@@ -51,13 +110,25 @@ class ProductAttributeValue(models.Model):
   attribute = models.ForeignKey(ProductAttribute, on_delete=models.CASCADE)
   value = models.CharField(max_length=200)
 
+  class Meta:
+    constraints = [
+      # une valeur par attribut et par produit : permet les upserts de l'import en masse
+      models.UniqueConstraint(fields=['product', 'attribute'], name='unique_product_attribute'),
+    ]
+
 
 class Inventory(models.Model):
   product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='inventory')
   quantity = models.IntegerField(default=0)
+  # quantité retenue par des paniers (voir StockReservation), disponible = quantity - reserved
+  reserved = models.IntegerField(default=0)
   low_stock = models.IntegerField(default=6)
   updated_at = models.DateTimeField(auto_now=True)
 
+  @property
+  def available(self):
+    return self.quantity - self.reserved
+
 
 class InventoryHistory(models.Model):
   inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='history')
@@ -65,6 +136,25 @@ class InventoryHistory(models.Model):
   reason = models.TextField()
   created_at = models.DateTimeField(auto_now_add=True)
 
+  class Meta:
+    indexes = [
+      # purge par ancienneté (cs_app/retention.py)
+      models.Index(fields=['created_at'], name='inventory_history_created'),
+    ]
+
+
+class InventoryHistoryDaily(models.Model):
+  """Mouvements de stock anciens regroupés par jour, voir cs_app/retention.py"""
+  inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='daily_history')
+  day = models.DateField()
+  quantity_changed = models.IntegerField(default=0)
+  movements = models.PositiveIntegerField(default=0)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['inventory', 'day'], name='unique_inventory_day'),
+    ]
+
 
 class Order(models.Model):
   ORDER_STATUS = (
@@ -83,6 +173,11 @@ class Order(models.Model):
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
 
+  class Meta:
+    indexes = [
+      models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_keyset'),
+    ]
+
 
 class OrderItem(models.Model):
   order = models.ForeignKey(Order, on_delete=models.CASCADE , related_name='items')
@@ -115,9 +210,18 @@ class Payment(models.Model):
 class Cart(models.Model):
   user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
   session_key = models.CharField(max_length=40, null=True, blank=True)
+  # totaux dénormalisés, tenus à jour par cs_app.carts à chaque modification des lignes
+  subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+  item_count = models.PositiveIntegerField(default=0)
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
 
+  class Meta:
+    indexes = [
+      models.Index(fields=['session_key'], condition=models.Q(session_key__isnull=False), name='cart_session_key'),
+      models.Index(fields=['updated_at'], name='cart_updated_at'),
+    ]
+
 
 class CartItem(models.Model):
   cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -125,6 +229,24 @@ class CartItem(models.Model):
   quantity = models.PositiveIntegerField(default=1)
   added_at = models.DateTimeField(auto_now_add=True)
 
+  class Meta:
+    constraints = [
+      # une ligne par produit : permet les upserts en masse (fusion des paniers anonymes)
+      models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+    ]
+
+
+class StockReservation(models.Model):
+  cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+  inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='reservations')
+  quantity = models.PositiveIntegerField()
+  expires_at = models.DateTimeField(db_index=True)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['cart', 'inventory'], name='unique_reservation_per_cart'),
+    ]
+
 
 class Promotion(models.Model):
     # Définir les types de réduction directement dans Promotion
@@ -144,6 +266,11 @@ class Promotion(models.Model):
     valid_to = models.DateTimeField()
     active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['valid_to'], condition=models.Q(active=True), name='promotion_active_valid_to'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -175,7 +302,56 @@ class BlogPost(models.Model):
   excerpt = models.TextField(blank=True)
   author = models.ForeignKey(User, on_delete=models.CASCADE)
   featured_image = models.ImageField(upload_to='media/blog/', blank=True)
+  # déclinaisons générées par cs_app/images.py : {nom: chemin dans le stockage}
+  variants = models.JSONField(default=dict, blank=True, editable=False)
   published = models.BooleanField(default=False)
   published_at = models.DateTimeField(null=True, blank=True)
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['published', '-published_at', '-id'], name='blog_published_keyset'),
+    ]
+
+
+# Cumuls journaliers des ventes confirmées et des niveaux de stock, tenus à jour
+# par cs_app/analytics.py : les tableaux de bord ne lisent jamais les commandes
+
+class SalesDaily(models.Model):
+  day = models.DateField(unique=True)
+  orders = models.IntegerField(default=0)
+  units = models.IntegerField(default=0)
+  revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+
+class ProductSalesDaily(models.Model):
+  day = models.DateField()
+  product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+  units = models.IntegerField(default=0)
+  revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['day', 'product'], name='unique_product_sales_day'),
+    ]
+
+
+class CategorySalesDaily(models.Model):
+  day = models.DateField()
+  category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+  units = models.IntegerField(default=0)
+  revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['day', 'category'], name='unique_category_sales_day'),
+    ]
+
+
+class StockLevelDaily(models.Model):
+  day = models.DateField(unique=True)
+  tracked = models.IntegerField(default=0)
+  low_stock = models.IntegerField(default=0)
+  out_of_stock = models.IntegerField(default=0)
+  updated_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,65 @@
+"""
+Export en flux de l'historique des commandes (CSV : une ligne par article,
+NDJSON : une commande par ligne avec ses articles).
+
+Les commandes sont lues par iterator(chunk_size) et leurs lignes préchargées
+tranche par tranche : la mémoire reste constante quel que soit le nombre de
+commandes du compte.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.db.models import F, Prefetch
+
+from .catalog_io import Echo
+from .models import OrderItem
+
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+ORDER_FIELDS = ['order_number', 'status', 'created_at', 'subtotal', 'tax', 'total']
+ITEM_FIELDS = ['product_id', 'product_name', 'quantity', 'price']
+
+
+def iter_orders(orders, chunk_size=None):
+  chunk_size = chunk_size or getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 500)
+  items = OrderItem.objects.annotate(product_name=F('product__name')).only(
+    'order_id', 'product_id', 'quantity', 'price'
+  ).order_by('id')
+  orders = orders.only(*ORDER_FIELDS).prefetch_related(Prefetch('items', queryset=items))
+  return orders.iterator(chunk_size=chunk_size)
+
+
+def order_row(order):
+  return {
+    **{field: getattr(order, field) for field in ORDER_FIELDS},
+    'items': [{field: getattr(item, field) for field in ITEM_FIELDS} for item in order.items.all()],
+  }
+
+
+def export_csv(orders, chunk_size=None):
+  writer = csv.writer(Echo())
+  yield writer.writerow(ORDER_FIELDS + ITEM_FIELDS)
+  for order in iter_orders(orders, chunk_size):
+    head = [getattr(order, field) for field in ORDER_FIELDS]
+    items = order.items.all()
+    if not items:
+      yield writer.writerow(head + [''] * len(ITEM_FIELDS))
+    for item in items:
+      yield writer.writerow(head + [getattr(item, field) for field in ITEM_FIELDS])
+
+
+def export_jsonl(orders, chunk_size=None):
+  for order in iter_orders(orders, chunk_size):
+    yield json.dumps(order_row(order), ensure_ascii=False, default=str) + '\n'
+
+
+EXPORTERS = {'csv': export_csv, 'jsonl': export_jsonl}
+
+
+def export_orders(orders, format='jsonl', chunk_size=None):
+  """Générateur des lignes du fichier d'export pour le queryset de commandes donné"""
+  if format not in EXPORTERS:
+    raise ValueError(f"Format inconnu : {format}")
+  return EXPORTERS[format](orders, chunk_size)
@@ -0,0 +1,167 @@
+import base64
+import json
+from functools import partial
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CountedPaginator(Paginator):
+  """Paginator dont le total est déjà connu : pas de COUNT"""
+
+  def __init__(self, object_list, per_page, count, **kwargs):
+    super().__init__(object_list, per_page, **kwargs)
+    self.count = count
+
+
+class KeysetPagination(PageNumberPagination):
+  """
+  Pagination par page par défaut, pagination par curseur (keyset) sur demande.
+
+  Avec ?pagination=cursor (puis le lien `next` renvoyé), la page suivante est
+  sélectionnée par WHERE (tri) > (dernière ligne) au lieu de COUNT(*) + OFFSET :
+  la page 5000 coûte autant que la première. Le tri de la vue (ou ?ordering)
+  est complété par l'id pour départager les égalités, et chaque tri dispose
+  d'un index composite correspondant (voir les Meta.indexes des modèles).
+  """
+  mode_query_param = 'pagination'
+  cursor_query_param = 'cursor'
+
+  def is_keyset(self, request):
+    return (request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_query_param in request.query_params)
+
+  def paginate_queryset(self, queryset, request, view=None):
+    self.keyset = self.is_keyset(request)
+    if not self.keyset:
+      # total déjà lu avec les validateurs de la réponse (voir ConditionalResponseMixin)
+      count = getattr(view, 'validated_count', None)
+      if count is not None:
+        self.django_paginator_class = partial(CountedPaginator, count=count)
+      return super().paginate_queryset(queryset, request, view)
+
+    self.request = request
+    self.page_size = self.get_page_size(request)
+    self.ordering = self.get_ordering(queryset)
+    queryset = queryset.order_by(*self.ordering)
+
+    cursor = request.query_params.get(self.cursor_query_param)
+    if cursor:
+      queryset = queryset.filter(self.after(self.decode_cursor(cursor), queryset))
+
+    rows = list(queryset[:self.page_size + 1])
+    self.has_next = len(rows) > self.page_size
+    rows = rows[:self.page_size]
+    self.last = rows[-1] if rows else None
+    return rows
+
+  async def apaginate_queryset(self, queryset, request, view=None):
+    """paginate_queryset pour les vues asynchrones : COUNT et lignes lus par l'ORM asynchrone"""
+    self.keyset = self.is_keyset(request)
+    self.request = request
+    self.page_size = self.get_page_size(request)
+    if self.keyset:
+      self.ordering = self.get_ordering(queryset)
+      queryset = queryset.order_by(*self.ordering)
+      cursor = request.query_params.get(self.cursor_query_param)
+      if cursor:
+        queryset = queryset.filter(self.after(self.decode_cursor(cursor), queryset))
+      rows = [row async for row in queryset[:self.page_size + 1]]
+      self.has_next = len(rows) > self.page_size
+      rows = rows[:self.page_size]
+      self.last = rows[-1] if rows else None
+      return rows
+
+    if not self.page_size:
+      return None
+    paginator = self.django_paginator_class(queryset, self.page_size)
+    # count est une cached_property : la renseigner évite le COUNT synchrone
+    count = getattr(view, 'validated_count', None)
+    paginator.count = count if count is not None else await queryset.acount()
+    page_number = self.get_page_number(request, paginator)
+    try:
+      self.page = paginator.page(page_number)
+    except InvalidPage as exc:
+      raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+    self.page.object_list = [row async for row in self.page.object_list]
+    return list(self.page)
+
+  def get_ordering(self, queryset):
+    ordering = [field for field in queryset.query.order_by if isinstance(field, str) and field != '?']
+    ordering = ordering or ['-pk']
+    if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+      # départage stable : même sens que le dernier critère
+      ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+    return ordering
+
+  def after(self, values, queryset):
+    """(a, b, c) > (x, y, z) en respectant le sens de chaque critère"""
+    if not isinstance(values, list) or len(values) != len(self.ordering):
+      raise NotFound("Curseur invalide")
+    condition = Q()
+    equal = Q()
+    for field, value in zip(self.ordering, values):
+      name = field.lstrip('-')
+      value = self.cursor_value(queryset, name, value)
+      lookup = 'lt' if field.startswith('-') else 'gt'
+      condition |= equal & Q(**{f'{name}__{lookup}': value})
+      equal &= Q(**{name: value})
+    return condition
+
+  def cursor_value(self, queryset, name, value):
+    """
+    Valeur du curseur convertie au type du critère de tri : un curseur forgé ou
+    repris avec un autre ?ordering donne une 404 plutôt qu'une erreur au filtrage
+    """
+    if value is None:
+      return None
+    if name in queryset.query.annotations:
+      field = queryset.query.annotations[name].output_field
+    else:
+      try:
+        field = queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+      except FieldDoesNotExist:
+        return value
+    try:
+      return field.to_python(value)
+    except (ValidationError, ValueError, TypeError):
+      raise NotFound("Curseur invalide")
+
+  def encode_cursor(self, row):
+    # row : instance de modèle, ou ligne values() (voir ValuesListMixin)
+    if isinstance(row, dict):
+      values = [row[field.lstrip('-')] for field in self.ordering]
+    else:
+      values = [getattr(row, field.lstrip('-')) for field in self.ordering]
+    # str() garde les microsecondes des dates, que DjangoJSONEncoder tronque
+    raw = json.dumps(values, default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+  def decode_cursor(self, cursor):
+    try:
+      padded = cursor + '=' * (-len(cursor) % 4)
+      return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+      raise NotFound("Curseur invalide")
+
+  def get_next_link(self):
+    if not self.keyset:
+      return super().get_next_link()
+    if not self.has_next:
+      return None
+    url = self.request.build_absolute_uri()
+    url = remove_query_param(url, self.mode_query_param)
+    return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+  def get_paginated_response(self, data):
+    if not self.keyset:
+      return super().get_paginated_response(data)
+    return Response({
+      'next': self.get_next_link(),
+      'results': data,
+    })
@@ -1,4 +1,30 @@
+from django.conf import settings
 from rest_framework import permissions
 
 
+class IsOwnerOrReadOnly(permissions.BasePermission):
+  """Lecture pour tous, écriture réservée au propriétaire de l'objet"""
 
+  def has_object_permission(self, request, view, obj):
+    if request.method in permissions.SAFE_METHODS:
+      return True
+    owner = getattr(obj, 'user', None) or getattr(obj, 'author', None)
+    return owner == request.user
+
+
+class IsAdminOrReadOnly(permissions.BasePermission):
+  """Lecture pour tous, écriture réservée aux administrateurs"""
+
+  def has_permission(self, request, view):
+    if request.method in permissions.SAFE_METHODS:
+      return True
+    return bool(request.user and request.user.is_staff)
+
+
+class IsMetricsScraper(permissions.BasePermission):
+  """Administrateurs, ou collecteur Prometheus depuis une adresse de METRICS_ALLOWED_IPS"""
+
+  def has_permission(self, request, view):
+    if request.user and request.user.is_staff:
+      return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
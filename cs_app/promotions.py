@@ -0,0 +1,192 @@
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import get_versions
+from .models import Category, Promotion
+
+
+CENT = Decimal('0.01')
+
+
+class PromotionEngine:
+  """
+  Index en mémoire des promotions en cours.
+
+  Toutes les promotions actives sont chargées en quelques requêtes, puis indexées
+  par produit et par catégorie (les promotions d'une catégorie s'appliquent aussi
+  à ses sous-catégories). Le calcul des prix d'une page ou d'un panier se fait
+  ensuite sans aucune requête.
+  """
+
+  def __init__(self, now=None):
+    now = now or timezone.now()
+    self.built_at = time.monotonic()
+    self.versions = get_versions((Promotion, Category))
+
+    # on garde aussi les promotions futures : leur fenêtre est vérifiée au calcul
+    self.promotions = {
+      promotion.pk: promotion
+      for promotion in Promotion.objects.filter(active=True, valid_to__gte=now)
+    }
+    self.by_product = {}
+    self.by_category = {}
+    targeted = set()
+
+    products = Promotion.applicable_products.through.objects.filter(
+      promotion_id__in=self.promotions
+    ).values_list('promotion_id', 'product_id')
+    for promotion_id, product_id in products:
+      self.by_product.setdefault(product_id, []).append(self.promotions[promotion_id])
+      targeted.add(promotion_id)
+
+    categories = Promotion.applicable_categories.through.objects.filter(
+      promotion_id__in=self.promotions
+    ).values_list('promotion_id', 'category_id')
+    for promotion_id, category_id in categories:
+      self.by_category.setdefault(category_id, []).append(self.promotions[promotion_id])
+      targeted.add(promotion_id)
+
+    # une promotion sans produit ni catégorie s'applique à tout le catalogue
+    self.global_promotions = [p for pk, p in self.promotions.items() if pk not in targeted]
+
+    self.parents = {}
+    self.children = {}
+    if self.by_category:
+      for pk, parent_id in Category.objects.values_list('id', 'parent_id'):
+        self.parents[pk] = parent_id
+        self.children.setdefault(parent_id, []).append(pk)
+
+  def is_stale(self, ttl):
+    if time.monotonic() - self.built_at > ttl:
+      return True
+    return get_versions((Promotion, Category)) != self.versions
+
+  def ancestors(self, category_id):
+    seen = set()
+    while category_id is not None and category_id not in seen:
+      seen.add(category_id)
+      yield category_id
+      category_id = self.parents.get(category_id)
+
+  def descendants(self, category_id):
+    stack = [category_id]
+    seen = set()
+    while stack:
+      node = stack.pop()
+      if node in seen:
+        continue
+      seen.add(node)
+      stack.extend(self.children.get(node, []))
+    return seen
+
+  def applicable(self, product_id, category_id, now=None):
+    """Promotions valides pour un produit, hors seuil de commande minimum"""
+    now = now or timezone.now()
+    candidates = list(self.by_product.get(product_id, ()))
+    for ancestor in self.ancestors(category_id):
+      candidates.extend(self.by_category.get(ancestor, ()))
+    candidates.extend(self.global_promotions)
+    return [
+      promotion for promotion in candidates
+      if promotion.valid_from <= now <= promotion.valid_to
+    ]
+
+  @staticmethod
+  def discount_for(promotion, amount):
+    # équivalent de Promotion.calculate_discount, sans revérifier la validité
+    if promotion.discount_type == 'percentage':
+      return (amount * promotion.discount_value / 100).quantize(CENT, ROUND_HALF_UP)
+    if promotion.discount_type == 'fixed':
+      return min(promotion.discount_value, amount)
+    return Decimal('0')
+
+  def best_price(self, product_id, category_id, price, now=None):
+    """Retourne (prix remisé, promotion retenue ou None) pour un prix unitaire"""
+    best, best_promotion = price, None
+    for promotion in self.applicable(product_id, category_id, now):
+      if promotion.min_order_amount:
+        continue
+      candidate = price - self.discount_for(promotion, price)
+      if candidate < best:
+        best, best_promotion = candidate, promotion
+    return best, best_promotion
+
+  def price_products(self, products, now=None):
+    """{id produit: (prix remisé, id promotion)} pour une page de produits"""
+    now = now or timezone.now()
+    prices = {}
+    for product in products:
+      price, promotion = self.best_price(product.pk, product.category_id, product.price, now)
+      prices[product.pk] = (price, promotion.pk if promotion else None)
+    return prices
+
+  def price_cart(self, lines, now=None):
+    """
+    Calcule les remises d'un panier en une passe.
+
+    `lines` est une suite de (id produit, id catégorie, prix unitaire, quantité).
+    Chaque ligne reçoit sa meilleure remise unitaire ; les promotions avec un
+    montant minimum de commande s'appliquent ensuite au sous-total des lignes
+    éligibles, si elles font mieux.
+    """
+    now = now or timezone.now()
+    subtotal = Decimal('0')
+    discount = Decimal('0')
+    eligible = {}
+    for product_id, category_id, price, quantity in lines:
+      line_total = price * quantity
+      subtotal += line_total
+      unit_price, _ = self.best_price(product_id, category_id, price, now)
+      discount += (price - unit_price) * quantity
+      for promotion in self.applicable(product_id, category_id, now):
+        if promotion.min_order_amount:
+          eligible[promotion.pk] = eligible.get(promotion.pk, Decimal('0')) + line_total
+
+    for promotion_id, amount in eligible.items():
+      promotion = self.promotions[promotion_id]
+      if subtotal >= promotion.min_order_amount:
+        discount = max(discount, self.discount_for(promotion, amount))
+
+    return {'subtotal': subtotal, 'discount': discount, 'total': subtotal - discount}
+
+  def product_filter(self, promotion_ids, now=None):
+    """Q ciblant les produits concernés par au moins une des promotions en cours"""
+    now = now or timezone.now()
+    wanted = [
+      self.promotions[pk] for pk in promotion_ids
+      if pk in self.promotions and self.promotions[pk].valid_from <= now <= self.promotions[pk].valid_to
+    ]
+    if not wanted:
+      return None
+    if any(promotion in self.global_promotions for promotion in wanted):
+      return Q()
+    wanted = set(promotion.pk for promotion in wanted)
+    product_ids = [pk for pk, promotions in self.by_product.items()
+                   if any(p.pk in wanted for p in promotions)]
+    category_ids = set()
+    for pk, promotions in self.by_category.items():
+      if any(p.pk in wanted for p in promotions):
+        category_ids |= self.descendants(pk)
+    return Q(id__in=product_ids) | Q(category_id__in=category_ids)
+
+
+_engine = None
+_lock = threading.Lock()
+
+
+def get_engine():
+  """Moteur partagé, reconstruit après PROMOTION_ENGINE_TTL secondes ou si une promotion change"""
+  global _engine
+  ttl = getattr(settings, 'PROMOTION_ENGINE_TTL', 60)
+  engine = _engine
+  if engine is None or engine.is_stale(ttl):
+    with _lock:
+      if _engine is engine:
+        _engine = PromotionEngine()
+      engine = _engine
+  return engine
@@ -0,0 +1,32 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+  import orjson
+except ImportError:  # dépendance optionnelle : sans elle, rendu par le JSONRenderer de DRF
+  orjson = None
+
+
+_encoder = JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+  """
+  JSONRenderer de DRF, encodé par orjson quand il est installé.
+
+  Sortie identique : compacte, UTF-8, et tout ce qu'orjson ne sait pas encoder
+  lui-même (Decimal, dates, durées, chaînes paresseuses...) passe par
+  l'encodeur de DRF. Une réponse indentée (Accept: ...; indent=2) reste
+  confiée à DRF.
+  """
+
+  def render(self, data, accepted_media_type=None, renderer_context=None):
+    if orjson is None or data is None:
+      return super().render(data, accepted_media_type, renderer_context)
+    if self.get_indent(accepted_media_type or '', renderer_context or {}):
+      return super().render(data, accepted_media_type, renderer_context)
+    return orjson.dumps(
+      data,
+      default=_encoder.default,
+      option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+    )
@@ -0,0 +1,200 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Case, When, IntegerField
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Inventory, StockReservation
+
+
+class InsufficientStock(ValidationError):
+  def __init__(self, available):
+    self.available = max(available, 0)
+    super().__init__({
+      'quantity': f"Stock insuffisant. Seulement {self.available} disponible(s)"
+    })
+
+
+def reservation_ttl():
+  return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', 15))
+
+
+def available_quantities(product_ids):
+  """{id produit: quantité disponible} en une requête ; absent si le produit n'a pas de stock suivi"""
+  rows = Inventory.objects.filter(product_id__in=product_ids).values_list('product_id', 'quantity', 'reserved')
+  return {product_id: quantity - reserved for product_id, quantity, reserved in rows}
+
+
+def reserve(cart, inventory, quantity):
+  """
+  Retient `quantity` unités de plus pour le panier et prolonge sa réservation.
+
+  Le contrôle et l'incrément de Inventory.reserved se font dans un seul UPDATE
+  conditionnel : deux paniers concurrents ne peuvent pas retenir la même unité.
+  """
+  with transaction.atomic():
+    updated = Inventory.objects.filter(
+      pk=inventory.pk, quantity__gte=F('reserved') + quantity
+    ).update(reserved=F('reserved') + quantity)
+    if not updated:
+      current = Inventory.objects.filter(pk=inventory.pk).values_list('quantity', 'reserved').first()
+      raise InsufficientStock(current[0] - current[1] if current else 0)
+
+    expires_at = timezone.now() + reservation_ttl()
+    extended = StockReservation.objects.filter(cart=cart, inventory=inventory).update(
+      quantity=F('quantity') + quantity, expires_at=expires_at
+    )
+    if not extended:
+      StockReservation.objects.create(cart=cart, inventory=inventory, quantity=quantity, expires_at=expires_at)
+
+
+def reserve_bulk(cart, quantities, partial=False):
+  """
+  Retient en une fois plusieurs quantités pour le panier : {id stock: quantité en plus}.
+
+  À appeler dans une transaction. Les stocks sont relus verrouillés, puis un seul
+  UPDATE incrémente tous les compteurs et un seul upsert prolonge les réservations.
+  Sans `partial`, lève ValidationError en listant les produits sans stock suffisant ;
+  avec, chaque quantité est ramenée au disponible. Retourne {id stock: quantité retenue}.
+  """
+  quantities = {pk: quantity for pk, quantity in quantities.items() if quantity > 0}
+  if not quantities:
+    return {}
+  rows = Inventory.objects.select_for_update().filter(pk__in=quantities).values_list(
+    'pk', 'product_id', 'quantity', 'reserved'
+  )
+  granted = {}
+  missing = {}
+  for pk, product_id, quantity, reserved in rows:
+    available = max(quantity - reserved, 0)
+    if available < quantities[pk] and not partial:
+      missing[product_id] = available
+    granted[pk] = min(quantities[pk], available)
+  if missing:
+    raise ValidationError({'items': [
+      f"Stock insuffisant pour le produit {product_id}. Seulement {available} disponible(s)"
+      for product_id, available in sorted(missing.items())
+    ]})
+  granted = {pk: quantity for pk, quantity in granted.items() if quantity > 0}
+  if not granted:
+    return {}
+
+  Inventory.objects.filter(pk__in=granted).update(
+    reserved=Case(
+      *[When(pk=pk, then=F('reserved') + quantity) for pk, quantity in granted.items()],
+      output_field=IntegerField()
+    )
+  )
+  held = dict(
+    StockReservation.objects.filter(cart=cart, inventory_id__in=granted).values_list('inventory_id', 'quantity')
+  )
+  expires_at = timezone.now() + reservation_ttl()
+  StockReservation.objects.bulk_create(
+    [
+      StockReservation(cart=cart, inventory_id=pk, quantity=held.get(pk, 0) + quantity, expires_at=expires_at)
+      for pk, quantity in granted.items()
+    ],
+    update_conflicts=True,
+    unique_fields=['cart', 'inventory'],
+    update_fields=['quantity', 'expires_at'],
+  )
+  return granted
+
+
+def release_bulk(cart, quantities):
+  """
+  Libère en une fois plusieurs quantités du panier : {id stock: quantité en moins},
+  None pour toute la réservation. À appeler dans une transaction ; nombre de
+  requêtes constant, comme reserve_bulk.
+  """
+  if not quantities:
+    return
+  rows = StockReservation.objects.select_for_update().filter(
+    cart=cart, inventory_id__in=quantities
+  ).values_list('id', 'inventory_id', 'quantity')
+  released, emptied, remaining = {}, [], {}
+  for pk, inventory_id, held in rows:
+    quantity = quantities[inventory_id]
+    if quantity is None or quantity >= held:
+      released[inventory_id] = held
+      emptied.append(pk)
+    else:
+      released[inventory_id] = quantity
+      remaining[pk] = held - quantity
+  if not released:
+    return
+
+  Inventory.objects.filter(pk__in=released).update(
+    reserved=Case(
+      *[When(pk=pk, then=F('reserved') - quantity) for pk, quantity in released.items()],
+      output_field=IntegerField()
+    )
+  )
+  if emptied:
+    StockReservation.objects.filter(pk__in=emptied).delete()
+  if remaining:
+    StockReservation.objects.filter(pk__in=remaining).update(
+      quantity=Case(*[When(pk=pk, then=left) for pk, left in remaining.items()], output_field=IntegerField())
+    )
+
+
+def release(cart, inventory, quantity=None):
+  """Libère `quantity` unités (ou toute la réservation) du panier sur ce stock"""
+  with transaction.atomic():
+    reservation = StockReservation.objects.select_for_update().filter(cart=cart, inventory=inventory).first()
+    if reservation is None:
+      return
+    if quantity is None or quantity >= reservation.quantity:
+      quantity = reservation.quantity
+      reservation.delete()
+    else:
+      StockReservation.objects.filter(pk=reservation.pk).update(quantity=F('quantity') - quantity)
+    Inventory.objects.filter(pk=inventory.pk).update(reserved=F('reserved') - quantity)
+
+
+def _release_rows(rows):
+  # rows : (id réservation, id stock, quantité)
+  released = {}
+  for _, inventory_id, quantity in rows:
+    released[inventory_id] = released.get(inventory_id, 0) + quantity
+  if not released:
+    return 0
+  Inventory.objects.filter(pk__in=released).update(
+    reserved=Case(
+      *[When(pk=pk, then=F('reserved') - quantity) for pk, quantity in released.items()],
+      output_field=IntegerField()
+    )
+  )
+  StockReservation.objects.filter(pk__in=[row[0] for row in rows]).delete()
+  return len(rows)
+
+
+def release_carts(cart_ids):
+  """Libère toutes les réservations des paniers donnés (suppression de panier, commande)"""
+  with transaction.atomic():
+    rows = list(
+      StockReservation.objects.select_for_update()
+      .filter(cart_id__in=cart_ids)
+      .values_list('id', 'inventory_id', 'quantity')
+    )
+    return _release_rows(rows)
+
+
+def release_expired(batch_size=500, now=None):
+  """Libère les réservations expirées par lots ; retourne le nombre de réservations libérées"""
+  now = now or timezone.now()
+  total = 0
+  while True:
+    with transaction.atomic():
+      rows = list(
+        StockReservation.objects.select_for_update(skip_locked=True)
+        .filter(expires_at__lte=now)
+        .order_by('expires_at')
+        .values_list('id', 'inventory_id', 'quantity')[:batch_size]
+      )
+      released = _release_rows(rows)
+    total += released
+    if released < batch_size:
+      return total
@@ -0,0 +1,99 @@
+"""
+Purge des données qui ne font que grossir : paniers abandonnés et détail des
+mouvements de stock.
+
+Chaque lot est traité dans sa propre transaction, du plus ancien au plus récent,
+pour ne jamais verrouiller longtemps les tables des chemins panier et stock.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cart, InventoryHistory, InventoryHistoryDaily
+from .reservations import release_carts
+
+
+def cart_cutoff(days=None):
+  days = getattr(settings, 'CART_RETENTION_DAYS', 30) if days is None else days
+  return timezone.now() - timedelta(days=days)
+
+
+def history_cutoff(days=None):
+  days = getattr(settings, 'INVENTORY_HISTORY_RETENTION_DAYS', 90) if days is None else days
+  return timezone.now() - timedelta(days=days)
+
+
+def purge_abandoned_carts(before, batch_size=500, progress=None):
+  """Supprime les paniers non modifiés depuis `before` (et rend leur stock retenu) ; retourne le total"""
+  total = 0
+  while True:
+    with transaction.atomic():
+      ids = list(
+        Cart.objects.select_for_update(skip_locked=True)
+        .filter(updated_at__lt=before)
+        .order_by('updated_at')
+        .values_list('pk', flat=True)[:batch_size]
+      )
+      if ids:
+        release_carts(ids)
+        Cart.objects.filter(pk__in=ids).delete()
+    total += len(ids)
+    if ids and progress is not None:
+      progress(total)
+    if len(ids) < batch_size:
+      return total
+
+
+def day_of(moment):
+  return timezone.localtime(moment).date() if timezone.is_aware(moment) else moment.date()
+
+
+def rollup_inventory_history(before, batch_size=1000, progress=None):
+  """
+  Remplace les mouvements antérieurs à `before` par un cumul par stock et par jour.
+
+  Un jour coupé entre deux lots s'ajoute au cumul déjà écrit. Retourne le nombre
+  de mouvements regroupés.
+  """
+  total = 0
+  while True:
+    with transaction.atomic():
+      rows = list(
+        InventoryHistory.objects.select_for_update(skip_locked=True)
+        .filter(created_at__lt=before)
+        .order_by('created_at')
+        .values_list('pk', 'inventory_id', 'created_at', 'quantity_changed')[:batch_size]
+      )
+      if rows:
+        totals = {}
+        for _, inventory_id, created_at, quantity in rows:
+          key = (inventory_id, day_of(created_at))
+          changed, movements = totals.get(key, (0, 0))
+          totals[key] = (changed + quantity, movements + 1)
+
+        existing = InventoryHistoryDaily.objects.filter(
+          inventory_id__in={inventory_id for inventory_id, _ in totals},
+          day__in={day for _, day in totals},
+        ).values_list('inventory_id', 'day', 'quantity_changed', 'movements')
+        for inventory_id, day, changed, movements in existing:
+          if (inventory_id, day) in totals:
+            added_changed, added_movements = totals[(inventory_id, day)]
+            totals[(inventory_id, day)] = (changed + added_changed, movements + added_movements)
+
+        InventoryHistoryDaily.objects.bulk_create(
+          [
+            InventoryHistoryDaily(inventory_id=inventory_id, day=day, quantity_changed=changed, movements=movements)
+            for (inventory_id, day), (changed, movements) in totals.items()
+          ],
+          update_conflicts=True,
+          unique_fields=['inventory', 'day'],
+          update_fields=['quantity_changed', 'movements'],
+        )
+        InventoryHistory.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    total += len(rows)
+    if rows and progress is not None:
+      progress(total)
+    if len(rows) < batch_size:
+      return total
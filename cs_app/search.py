@@ -0,0 +1,174 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Product
+
+
+FTS_TABLE = 'cs_app_product_fts'
+# bm25 pondère le nom plus fortement que la catégorie, les attributs et la description
+BM25 = f'bm25({FTS_TABLE}, 10.0, 1.0, 3.0, 2.0)'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_sqlite():
+  return connection.vendor == 'sqlite'
+
+
+def is_postgresql():
+  return connection.vendor == 'postgresql'
+
+
+_fts_tables = set()
+
+
+def fts_available():
+  """L'index FTS5 n'existe que sur SQLite, et seulement si la migration a pu le créer"""
+  if not is_sqlite():
+    return False
+  name = connection.settings_dict['NAME']
+  if name not in _fts_tables:
+    # seul un résultat positif est mémorisé : la table peut apparaître après migrate
+    if FTS_TABLE not in connection.introspection.table_names():
+      return False
+    _fts_tables.add(name)
+  return True
+
+
+def build_match(term):
+  """Transforme la saisie en requête FTS5 : chaque mot devient un préfixe, tous requis"""
+  tokens = TOKEN_RE.findall(term)
+  return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _documents(product_ids):
+  products = (
+    Product.objects.filter(pk__in=product_ids)
+    .select_related('category')
+    .prefetch_related('attribute_values')
+  )
+  for product in products:
+    attributes = ' '.join(value.value for value in product.attribute_values.all())
+    yield (product.pk, product.name, product.description, product.category.name, attributes)
+
+
+def index_products(product_ids):
+  """Réindexe les produits donnés (appelé par les signaux et l'import en masse)"""
+  if not fts_available():
+    return
+  product_ids = list(product_ids)
+  batch = getattr(settings, 'SEARCH_INDEX_BATCH_SIZE', 500)
+  with connection.cursor() as cursor:
+    for start in range(0, len(product_ids), batch):
+      chunk = product_ids[start:start + batch]
+      placeholders = ', '.join(['%s'] * len(chunk))
+      cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+      cursor.executemany(
+        f'INSERT INTO {FTS_TABLE} (rowid, name, description, category, attributes) VALUES (%s, %s, %s, %s, %s)',
+        list(_documents(chunk))
+      )
+
+
+def remove_products(product_ids):
+  if not fts_available():
+    return
+  product_ids = list(product_ids)
+  if not product_ids:
+    return
+  placeholders = ', '.join(['%s'] * len(product_ids))
+  with connection.cursor() as cursor:
+    cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', product_ids)
+
+
+def rebuild_index():
+  """Reconstruit tout l'index ; retourne le nombre de produits indexés"""
+  if not fts_available():
+    return 0
+  with connection.cursor() as cursor:
+    cursor.execute(f'DELETE FROM {FTS_TABLE}')
+  ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+  index_products(ids)
+  return len(ids)
+
+
+def search_ids(term, limit=None):
+  """Identifiants des produits correspondants, du plus pertinent au moins pertinent"""
+  match = build_match(term)
+  if not match:
+    return []
+  limit = limit or getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+  with connection.cursor() as cursor:
+    cursor.execute(
+      f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY {BM25} LIMIT %s',
+      [match, limit]
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def search_queryset(queryset, term):
+  """Filtre et classe `queryset` par pertinence ; retourne (queryset, classé ?)"""
+  if fts_available():
+    match = build_match(term)
+    if not match:
+      return queryset.none(), True
+    # index joint dans la même requête : les filtres de la vue, le COUNT, LIMIT/OFFSET
+    # et les curseurs (search_rank__gt) portent sur tous les résultats, sans plafond
+    quote = connection.ops.quote_name
+    table, pk = quote(queryset.model._meta.db_table), quote(queryset.model._meta.pk.column)
+    queryset = queryset.extra(
+      tables=[FTS_TABLE],
+      where=[f'{FTS_TABLE}.rowid = {table}.{pk}', f'{FTS_TABLE} MATCH %s'],
+      params=[match],
+    )
+    return queryset.annotate(search_rank=RawSQL(BM25, [], output_field=FloatField())), True
+
+  if is_postgresql():
+    from django.contrib.postgres.aggregates import StringAgg
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    tokens = TOKEN_RE.findall(term)
+    if not tokens:
+      return queryset, False
+    # les valeurs d'attributs sont agrégées pour garder une ligne par produit
+    queryset = queryset.annotate(
+      search_attributes=StringAgg('attribute_values__value', delimiter=' ', default='')
+    )
+    vector = (
+      SearchVector('name', weight='A')
+      + SearchVector('category__name', weight='B')
+      + SearchVector('search_attributes', weight='B')
+      + SearchVector('description', weight='C')
+    )
+    query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), search_type='raw')
+    queryset = queryset.annotate(search_rank=-SearchRank(vector, query)).filter(search_rank__lt=0)
+    return queryset, True
+
+  # repli sans index plein texte : LIKE sur le nom et la description
+  condition = Q()
+  for token in TOKEN_RE.findall(term):
+    condition &= Q(name__icontains=token) | Q(description__icontains=token)
+  return queryset.filter(condition), False
+
+
+class ProductSearchFilter(BaseFilterBackend):
+  """
+  ?search= sur l'index plein texte des produits.
+
+  À placer après OrderingFilter : sans paramètre ?ordering explicite, les
+  résultats sont triés par pertinence plutôt que par l'ordre par défaut de la vue.
+  """
+  search_param = 'search'
+  ordering_param = 'ordering'
+
+  def filter_queryset(self, request, queryset, view):
+    term = request.query_params.get(self.search_param, '').strip()
+    if not term:
+      return queryset
+    queryset, ranked = search_queryset(queryset, term)
+    if ranked and not request.query_params.get(self.ordering_param):
+      queryset = queryset.order_by('search_rank', 'pk')
+    return queryset
@@ -0,0 +1,204 @@
+"""
+Jeu de données déterministe pour les benchmarks.
+
+Toutes les lignes sont créées par bulk_create, donc sans signaux : l'index plein
+texte est reconstruit à la fin et les versions du cache ne bougent pas.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+  User, Category, Product, ProductImage, ProductAttribute, ProductAttributeValue,
+  Inventory, InventoryHistory, Order, OrderItem, Cart, CartItem, Promotion, BlogPost
+)
+from . import search
+from .carts import recompute_totals
+
+
+DEFAULTS = {
+  'categories': 60,
+  'products': 20000,
+  'images': 2,
+  'attributes': 3,
+  'users': 500,
+  'carts': 300,
+  'cart_items': 4,
+  'orders': 5000,
+  'order_items': 3,
+  'promotions': 40,
+  'posts': 500,
+}
+
+ATTRIBUTES = {
+  'color': ['Rouge', 'Bleu', 'Vert', 'Noir', 'Blanc', 'Inox'],
+  'size': ['S', 'M', 'L', 'XL'],
+  'material': ['Acier', 'Fonte', 'Bois', 'Céramique', 'Verre'],
+}
+
+
+@contextmanager
+def manual_timestamps(*models):
+  """Laisse bulk_create écrire created_at/updated_at au lieu de les forcer à maintenant"""
+  fields = [
+    field for model in models for field in model._meta.fields
+    if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+  ]
+  saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+  for field in fields:
+    field.auto_now = field.auto_now_add = False
+  try:
+    yield
+  finally:
+    for field, auto_now, auto_now_add in saved:
+      field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def seed(seed=42, batch_size=2000, stdout=None, **counts):
+  """Crée le jeu de données ; les mêmes paramètres donnent toujours les mêmes lignes"""
+  options = {**DEFAULTS, **counts}
+  rng = random.Random(seed)
+  now = timezone.now().replace(microsecond=0)
+
+  def log(message):
+    if stdout is not None:
+      stdout.write(message)
+
+  def ago(max_days):
+    return now - timedelta(seconds=rng.randrange(max_days * 86400))
+
+  with transaction.atomic(), manual_timestamps(Product, Order, Cart, BlogPost, InventoryHistory):
+    categories = []
+    for index in range(options['categories']):
+      parent = rng.choice(categories) if categories and index >= options['categories'] // 5 else None
+      category = Category(name=f'Catégorie {index}', slug=f'seed-categorie-{index}', parent=parent)
+      category.save()
+      categories.append(category)
+    log(f"{len(categories)} catégories")
+
+    products = Product.objects.bulk_create([
+      Product(
+        name=f'Produit {index}',
+        slug=f'seed-produit-{index}',
+        description=f'Description du produit {index} en {rng.choice(ATTRIBUTES["material"]).lower()}',
+        price=Decimal(rng.randrange(100, 50000)) / 100,
+        compare_price=Decimal(rng.randrange(50000, 60000)) / 100,
+        category=rng.choice(categories),
+        featured=rng.random() < 0.1,
+        in_stock=rng.random() < 0.9,
+        created_at=(created := ago(730)),
+        updated_at=created,
+      )
+      for index in range(options['products'])
+    ], batch_size=batch_size)
+    log(f"{len(products)} produits")
+
+    ProductImage.objects.bulk_create([
+      ProductImage(product=product, image=f'media/Products/seed-{product.pk}-{index}.jpg', is_default=index == 0)
+      for product in products for index in range(options['images'])
+    ], batch_size=batch_size)
+
+    attributes = {
+      name: ProductAttribute.objects.create(name=name)
+      for name in list(ATTRIBUTES)[:options['attributes']]
+    }
+    ProductAttributeValue.objects.bulk_create([
+      ProductAttributeValue(product=product, attribute=attribute, value=rng.choice(ATTRIBUTES[name]))
+      for product in products for name, attribute in attributes.items()
+    ], batch_size=batch_size)
+
+    inventories = Inventory.objects.bulk_create([
+      Inventory(product=product, quantity=rng.randrange(0, 200), low_stock=6)
+      for product in products
+    ], batch_size=batch_size)
+    InventoryHistory.objects.bulk_create([
+      InventoryHistory(inventory=inventory, quantity_changed=rng.randrange(-5, 20),
+                       reason='Réassort', created_at=ago(365))
+      for inventory in inventories if rng.random() < 0.3
+    ], batch_size=batch_size)
+    log("images, attributs et stocks")
+
+    password = make_password('benchmark')
+    users = User.objects.bulk_create([
+      User(username=f'seed-client-{index}', email=f'client{index}@example.com',
+           password=password, phone=f'0100{index:06d}', is_staff=index == 0)
+      for index in range(options['users'])
+    ], batch_size=batch_size)
+
+    # un panier sur trois est anonyme (session_key seule)
+    carts = Cart.objects.bulk_create([
+      Cart(user=users[index] if index % 3 and index < len(users) else None,
+           session_key=None if index % 3 and index < len(users) else f'seed-session-{index:027d}',
+           created_at=(created := ago(90)), updated_at=created)
+      for index in range(options['carts'])
+    ], batch_size=batch_size)
+    CartItem.objects.bulk_create([
+      CartItem(cart=cart, product=product, quantity=rng.randrange(1, 4))
+      for cart in carts
+      for product in rng.sample(products, min(options['cart_items'], len(products)))
+    ], batch_size=batch_size)
+    recompute_totals(Cart.objects.all(), touch=False)
+    log(f"{len(users)} utilisateurs, {len(carts)} paniers")
+
+    statuses = [status for status, _ in Order.ORDER_STATUS]
+    orders = Order.objects.bulk_create([
+      Order(
+        user=rng.choice(users), order_number=f'SEED{index:012d}', status=rng.choice(statuses),
+        customer_phone='0100', tax=0, subtotal=0, total=0,
+        created_at=(created := ago(730)), updated_at=created,
+      )
+      for index in range(options['orders'])
+    ], batch_size=batch_size)
+    items = []
+    totals = {}
+    for order in orders:
+      for product in rng.sample(products, min(options['order_items'], len(products))):
+        quantity = rng.randrange(1, 5)
+        items.append(OrderItem(order=order, product=product, quantity=quantity, price=product.price))
+        totals[order.pk] = totals.get(order.pk, 0) + product.price * quantity
+    OrderItem.objects.bulk_create(items, batch_size=batch_size)
+    for order in orders:
+      order.subtotal = order.total = totals.get(order.pk, 0)
+    Order.objects.bulk_update(orders, ['subtotal', 'total'], batch_size=batch_size)
+    log(f"{len(orders)} commandes, {len(items)} lignes")
+
+    promotions = Promotion.objects.bulk_create([
+      Promotion(
+        name=f'Promotion {index}', discount_type=rng.choice(['percentage', 'fixed']),
+        discount_value=Decimal(rng.randrange(5, 30)), active=rng.random() < 0.8,
+        valid_from=now - timedelta(days=rng.randrange(1, 60)),
+        valid_to=now + timedelta(days=rng.randrange(-30, 60)),
+      )
+      for index in range(options['promotions'])
+    ], batch_size=batch_size)
+    Promotion.applicable_categories.through.objects.bulk_create([
+      Promotion.applicable_categories.through(promotion_id=promotion.pk, category_id=category.pk)
+      for promotion in promotions[::2]
+      for category in rng.sample(categories, min(2, len(categories)))
+    ], batch_size=batch_size)
+    Promotion.applicable_products.through.objects.bulk_create([
+      Promotion.applicable_products.through(promotion_id=promotion.pk, product_id=product.pk)
+      for promotion in promotions[1::2]
+      for product in rng.sample(products, min(10, len(products)))
+    ], batch_size=batch_size)
+
+    author = users[0] if users else None
+    if author is not None:
+      BlogPost.objects.bulk_create([
+        BlogPost(
+          title=f'Article {index}', slug=f'seed-article-{index}', content='Contenu ' * 50,
+          excerpt='Résumé', author=author, published=rng.random() < 0.8,
+          published_at=(published := ago(730)), created_at=published, updated_at=published,
+        )
+        for index in range(options['posts'])
+      ], batch_size=batch_size)
+    log("promotions et articles")
+
+  indexed = search.rebuild_index()
+  log(f"{indexed} produits indexés pour la recherche")
+  return options
@@ -1,6 +1,28 @@
+from decimal import Decimal, ROUND_HALF_UP
+from operator import itemgetter
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Category, CartItem, Cart, Product, ProductImage, ProductAttribute, ProductAttributeValue, Payment, Promotion,  BlogPost,  User, UserProfile, Order, OrderItem, Inventory, InventoryHistory
 from django.contrib.auth import authenticate
+from .carts import price_lines
+from .promotions import get_engine
+from .images import stored_variant_url, variant_url
+
+
+class ImageVariantField(serializers.Field):
+  """URL d'une déclinaison de l'image (voir cs_app/images.py), lue dans `variants` : ni requête ni accès disque"""
+
+  def __init__(self, image_field, size='thumb', **kwargs):
+    self.image_field = image_field
+    self.size = size
+    kwargs['source'] = '*'
+    kwargs['read_only'] = True
+    super().__init__(**kwargs)
+
+  def to_representation(self, obj):
+    return variant_url(getattr(obj, self.image_field), obj.variants, self.size, self.context.get('request'))
 
 class CategorySerializer(serializers.ModelSerializer):
   class Meta:
@@ -10,43 +32,215 @@ class CategorySerializer(serializers.ModelSerializer):
 
 class CategoryListSerializer(serializers.ModelSerializer):
   product_count = serializers.SerializerMethodField()
+  total_product_count = serializers.SerializerMethodField()
+  thumbnail_url = ImageVariantField('image')
   class Meta:
     model = Category
-    fields = ['id','name', 'slug', 'description', 'image', 'product_count']
+    fields = ['id','name', 'slug', 'description', 'image', 'thumbnail_url', 'parent', 'product_count',
+              'total_product_count']
 
   def get_product_count(self, obj):
+    # annoté par CategoryListView ; repli sur un COUNT pour les objets non annotés
+    if hasattr(obj, 'product_count'):
+      return obj.product_count
     return obj.products.count()
 
+  def get_total_product_count(self, obj):
+    counts = self.context.get('category_counts')
+    if counts is None:
+      counts = Category.objects.product_counts()
+    return counts.get(obj.pk, (0, 0))[1]
+
 
 class ProductListSerializer(serializers.ModelSerializer):
   image_url = serializers.SerializerMethodField()
   category_name = serializers.CharField(source = 'category.name', read_only = True)
+  discounted_price = serializers.SerializerMethodField()
 
   class Meta:
     model = Product
-    fields = ['id', 'name', 'slug', 'price', 'compare_price', 'category_name',
+    fields = ['id', 'name', 'slug', 'price', 'compare_price', 'discounted_price', 'category_name',
             'image_url', 'featured', 'in_stock']
 
+  def get_discounted_price(self, obj):
+    prices = self.context.get('prices')
+    if prices is None or obj.pk not in prices:
+      prices = get_engine().price_products([obj])
+    price = prices[obj.pk][0]
+    if price == obj.price:
+      return None
+    return f'{price:.2f}'
+
   def get_image_url(self, obj):
-    main_image = obj.images.filter(is_default = True).first()
-    if main_image:
-      return main_image.image.url
+    # `default_images` est préchargé par ProductListView (voir with_list_relations)
+    if hasattr(obj, 'default_images'):
+      main_image = obj.default_images[0] if obj.default_images else None
+    else:
+      main_image = obj.images.filter(is_default = True).first()
+    if main_image and main_image.image:
+      # vignette (WebP si le client l'accepte) plutôt que l'original envoyé
+      return variant_url(main_image.image, main_image.variants, 'thumb', self.context.get('request'))
     return None
 
+class ValuesSerializer:
+  """
+  Sérialisation en lecture seule de lignes .values(), pour les listes les plus demandées.
+
+  Même sortie que le ModelSerializer équivalent, sans instance de modèle ni
+  introspection des champs à chaque ligne : chaque clé de sortie reçoit une
+  fois pour toutes une fonction (ligne -> valeur). `fields` donne, dans l'ordre
+  de sortie, (clé, colonne values(), conversion ou None) ; une colonne None est
+  un champ calculé par get_computed(rows), qui retourne {clé: fonction}.
+  """
+  fields = ()
+
+  def __init__(self, context=None):
+    self.context = context or {}
+
+  @classmethod
+  def columns(cls):
+    return [column for _, column, _ in cls.fields if column]
+
+  def get_computed(self, rows):
+    return {}
+
+  def get_mappers(self, rows):
+    computed = self.get_computed(rows)
+    mappers = []
+    for key, column, convert in self.fields:
+      if column is None:
+        mapper = computed[key]
+      elif convert is None:
+        mapper = itemgetter(column)
+      else:
+        mapper = (lambda column, convert: lambda row: convert(row[column]))(column, convert)
+      mappers.append((key, mapper))
+    return mappers
+
+  def to_representation(self, rows):
+    mappers = self.get_mappers(rows)
+    return [{key: mapper(row) for key, mapper in mappers} for row in rows]
+
+
+def decimal_string(decimal_places):
+  """Conversion de serializers.DecimalField (COERCE_DECIMAL_TO_STRING) pour un nombre de décimales fixe"""
+  exponent = Decimal(1).scaleb(-decimal_places)
+
+  def convert(value):
+    if value is None:
+      return None
+    return f'{value.quantize(exponent, rounding=ROUND_HALF_UP):f}'
+  return convert
+
+
+class ProductListValuesSerializer(ValuesSerializer):
+  """ProductListSerializer depuis des lignes values() : une requête pour les images de la page, prix remisés en mémoire"""
+  fields = (
+    ('id', 'id', None),
+    ('name', 'name', None),
+    ('slug', 'slug', None),
+    ('price', 'price', decimal_string(2)),
+    ('compare_price', 'compare_price', decimal_string(2)),
+    ('discounted_price', None, None),
+    ('category_name', 'category__name', None),
+    ('image_url', None, None),
+    ('featured', 'featured', None),
+    ('in_stock', 'in_stock', None),
+  )
+
+  @classmethod
+  def columns(cls):
+    # category_id pour le moteur de promotions
+    return super().columns() + ['category_id']
+
+  def get_computed(self, rows):
+    engine, now = get_engine(), timezone.now()
+    discounted = {}
+    for row in rows:
+      price, _ = engine.best_price(row['id'], row['category_id'], row['price'], now)
+      discounted[row['id']] = None if price == row['price'] else f'{price:.2f}'
+
+    # première image par défaut de chaque produit, comme le Prefetch `default_images`
+    images = {}
+    rows_images = ProductImage.objects.filter(
+      product_id__in=[row['id'] for row in rows], is_default=True
+    ).order_by('pk').values_list('product_id', 'image', 'variants')
+    for product_id, image, variants in rows_images:
+      images.setdefault(product_id, (image, variants))
+    request = self.context.get('request')
+    urls = {
+      product_id: stored_variant_url(image, variants, 'thumb', request) if image else None
+      for product_id, (image, variants) in images.items()
+    }
+    return {
+      'discounted_price': lambda row: discounted[row['id']],
+      'image_url': lambda row: urls.get(row['id']),
+    }
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
+  thumbnail_url = ImageVariantField('image')
+  medium_url = ImageVariantField('image', 'medium')
+
   class Meta:
-    model = Product
-    fields = '__all__'
+    model = ProductImage
+    fields = ['id', 'image', 'thumbnail_url', 'medium_url', 'alt_text', 'is_default']
 
 
 class ProductAttributeValueSerializer(serializers.ModelSerializer):
   attribute_name = serializers.CharField(source = 'attribute.name', read_only = True)
   class Meta:
-    model = ProductAttribute
+    model = ProductAttributeValue
     fields= ['id', 'attribute_name', 'value']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+def select_fields(serializer_class, query_params):
+  """
+  Champs demandés par ?fields=id,name,price et ?expand=images pour un serializer
+  à SelectableFieldsMixin ; None sans l'un ni l'autre (tous les champs).
+
+  `fields` restreint les champs de premier niveau. Les relations imbriquées
+  (Meta.expandable_fields) n'y figurent que si elles sont nommées dans `fields`
+  ou `expand` ; `expand` seul garde tous les champs simples.
+  """
+  if 'fields' not in query_params and 'expand' not in query_params:
+    return None
+  available = list(serializer_class.Meta.fields)
+  expandable = set(serializer_class.Meta.expandable_fields)
+
+  def names(param):
+    return [name for value in query_params.getlist(param) for name in value.split(',') if name.strip()]
+
+  requested = {name.strip() for name in names('fields')} if 'fields' in query_params else None
+  expand = {name.strip() for name in names('expand')}
+  errors = {}
+  if requested is not None and requested - set(available):
+    errors['fields'] = f"Champ(s) inconnu(s) : {', '.join(sorted(requested - set(available)))}"
+  if expand - expandable:
+    errors['expand'] = f"Relation(s) non dépliable(s) : {', '.join(sorted(expand - expandable))}"
+  if errors:
+    raise serializers.ValidationError(errors)
+  if requested is None:
+    requested = set(available) - expandable
+  return {name for name in available if name in requested or name in expand}
+
+
+class SelectableFieldsMixin:
+  """
+  Serializer dont les champs se restreignent à context['fields'] (voir
+  select_fields) ; appliqué au serializer de plus haut niveau seulement.
+  """
+
+  def get_fields(self):
+    fields = super().get_fields()
+    selected = self.context.get('fields')
+    parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+    if selected is None or parent is not None:
+      return fields
+    return {name: field for name, field in fields.items() if name in selected}
+
+
+class ProductSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
   images = ProductImageSerializer(many= True, read_only =True)
   attribute_values = ProductAttributeValueSerializer(many=True, read_only = True)
   category_name = serializers.CharField(source = 'category.name', read_only = True)
@@ -58,6 +252,7 @@ class ProductSerializer(serializers.ModelSerializer):
             'category', 'category_name', 'featured',
             'in_stock', 'images', 'attribute_values',
             'created_at', 'updated_at']
+    expandable_fields = ['images', 'attribute_values']
     read_only = ['slug', 'created_at', 'updated_at']
 
 
@@ -70,7 +265,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
     fields = ['id', 'product', 'product_name', 'quantity', 'price']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
   items = OrderItemSerializer(many =True, read_only = True)
   status_display = serializers.CharField(source = 'get_status_display', read_only = True)
 
@@ -78,7 +273,9 @@ class OrderSerializer(serializers.ModelSerializer):
     model = Order
     fields = ['id', 'order_number', 'status', 'status_display', 'customer_phone', 'items', 'subtotal', 'tax',
              'total', 'created_at', 'updated_at']
-    read_only = ['order_number', 'created_at', 'updated_at']
+    expandable_fields = ['items']
+    read_only_fields = ['order_number', 'status', 'customer_phone', 'subtotal', 'tax', 'total',
+                        'created_at', 'updated_at']
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -96,15 +293,22 @@ class CartItemSerializer(serializers.ModelSerializer):
 
 
 class CartSerializer(serializers.ModelSerializer):
+  """Panier enregistré ou de session ; sous-total, remise et total calculés en une passe du moteur de promotions"""
   items = CartItemSerializer(many= True, read_only = True)
-  total =  serializers.SerializerMethodField()
 
   class Meta:
     model = Cart
-    fields= ['id', 'items', 'total', 'created_at', 'updated_at']
-
-  def get_total (self, obj):
-    return sum(item.quantity * item.product.price for item in obj.items.all())
+    fields= ['id', 'items', 'item_count', 'created_at', 'updated_at']
+
+  def to_representation(self, instance):
+    data = super().to_representation(instance)
+    # lignes déjà préchargées (Cart) ou en mémoire (SessionCart) : aucune requête
+    items = instance.items.all() if isinstance(instance, Cart) else instance.items
+    pricing = price_lines(items)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    for key in ('subtotal', 'discount', 'total'):
+      data[key] = amount.to_representation(pricing[key])
+    return data
 
 
 
@@ -138,6 +342,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
+  avatar_thumbnail_url = ImageVariantField('avatar')
+
   class Meta:
     model = UserProfile
     fields = '__all__'
@@ -148,6 +354,17 @@ class PromotionSerializer(serializers.ModelSerializer):
     fields = '__all__'
 
 
+class BlogPostSerializer(serializers.ModelSerializer):
+  author_name = serializers.CharField(source = 'author.username', read_only = True)
+  featured_image_url = ImageVariantField('featured_image', 'medium')
+
+  class Meta:
+    model = BlogPost
+    fields = ['id', 'title', 'slug', 'content', 'excerpt', 'author', 'author_name',
+             'featured_image', 'featured_image_url', 'published', 'published_at', 'created_at', 'updated_at']
+    read_only_fields = ['author', 'created_at', 'updated_at']
+
+
 class AddToCartSerializer(serializers.Serializer):
     product_id = serializers.IntegerField(
         min_value=1,
@@ -160,37 +377,56 @@ class AddToCartSerializer(serializers.Serializer):
     )
 
     def validate_product_id(self, value):
-        try:
-            product = Product.objects.get(id=value)
-
-            if not product.in_stock:
-                raise serializers.ValidationError("Ce produit n'est pas en stock")
+        # une seule lecture du produit et de son stock, réutilisée par validate() et la vue
+        product = Product.objects.select_related('inventory').filter(id=value).first()
+        if product is None:
+            raise serializers.ValidationError("Produit non trouvé")
 
-            if hasattr(product, 'inventory') and product.inventory.quantity < 1:
-                raise serializers.ValidationError("Produit en rupture de stock")
+        if not product.in_stock:
+            raise serializers.ValidationError("Ce produit n'est pas en stock")
 
-            return value
+        inventory = getattr(product, 'inventory', None)
+        if inventory is not None and inventory.available < 1:
+            raise serializers.ValidationError("Produit en rupture de stock")
 
-        except Product.DoesNotExist:
-            raise serializers.ValidationError("Produit non trouvé")
+        self._product = product
+        return value
 
     def validate(self, data):
-        product_id = data['product_id']
+        product = self._product
         quantity = data['quantity']
 
-        try:
-            product = Product.objects.get(id=product_id)
+        inventory = getattr(product, 'inventory', None)
+        if inventory is not None and inventory.available < quantity:
+            raise serializers.ValidationError({
+                'quantity': f"Stock insuffisant. Seulement {inventory.available} disponible(s)"
+            })
 
-            if hasattr(product, 'inventory'):
-                available_stock = product.inventory.quantity
-                if available_stock < quantity:
-                    raise serializers.ValidationError({
-                        'quantity': f"Stock insuffisant. Seulement {available_stock} disponible(s)"
-                    })
+        data['product'] = product
+        return data
 
-            return data
 
-        except Product.DoesNotExist:
-            raise serializers.ValidationError({
-                'product_id': "Produit non trouvé"
-            })
+class CartOperationSerializer(serializers.Serializer):
+  """Une opération de BulkCartView : add (quantité en plus), set (quantité finale, 0 retire) ou remove"""
+  op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+  product_id = serializers.IntegerField(min_value=1)
+  quantity = serializers.IntegerField(min_value=0, required=False)
+
+  def validate(self, data):
+    if data['op'] == 'add' and data.get('quantity', 1) < 1:
+      raise serializers.ValidationError({'quantity': "Quantité à ajouter d'au moins 1"})
+    if data['op'] == 'set' and 'quantity' not in data:
+      raise serializers.ValidationError({'quantity': "Quantité requise pour set"})
+    if data['op'] == 'add':
+      data.setdefault('quantity', 1)
+    return data
+
+
+class BulkCartSerializer(serializers.Serializer):
+  operations = CartOperationSerializer(many=True, allow_empty=False)
+
+  def validate_operations(self, value):
+    limit = getattr(settings, 'CART_BULK_MAX', 100)
+    if len(value) > limit:
+      raise serializers.ValidationError(f"{limit} opérations au plus par requête")
+    return value
@@ -0,0 +1,120 @@
+from functools import partial
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache import bump_version
+from .models import (
+  Category, Product, ProductImage, ProductAttribute, ProductAttributeValue,
+  Inventory, Promotion, Cart, Order, UserProfile, BlogPost
+)
+from .reservations import release_carts
+from .carts import recompute_for_product, merge_session_cart
+from . import analytics, images, search
+
+
+CATALOG_MODELS = (
+  Category, Product, ProductImage, ProductAttribute, ProductAttributeValue,
+  Inventory, Promotion
+)
+
+
+def bump_now_and_on_commit(model):
+  # tout de suite pour les lectures de la transaction elle-même, puis à la validation :
+  # une réponse calculée entre-temps par une autre requête, sur les lignes d'avant la
+  # validation, reste sous une version déjà dépassée
+  bump_version(model)
+  transaction.on_commit(partial(bump_version, model))
+
+
+def invalidate_catalog(sender, **kwargs):
+  bump_now_and_on_commit(sender)
+
+
+for model in CATALOG_MODELS:
+  post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog-save-{model.__name__}')
+  post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog-delete-{model.__name__}')
+
+
+@receiver(m2m_changed, sender=Promotion.applicable_categories.through)
+@receiver(m2m_changed, sender=Promotion.applicable_products.through)
+def invalidate_promotion_targets(sender, action, **kwargs):
+  if action in ('post_add', 'post_remove', 'post_clear'):
+    bump_now_and_on_commit(Promotion)
+
+
+@receiver(pre_delete, sender=Cart)
+def release_cart_reservations(sender, instance, **kwargs):
+  # la cascade supprimerait les réservations sans rendre le stock retenu
+  release_carts([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+  search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+  search.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductAttributeValue)
+@receiver(post_delete, sender=ProductAttributeValue)
+def index_product_attributes(sender, instance, **kwargs):
+  # la suppression d'un produit supprime ses valeurs en cascade : rien à réindexer
+  if Product.objects.filter(pk=instance.product_id).exists():
+    search.index_products([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def index_category_products(sender, instance, created, **kwargs):
+  if not created:
+    search.index_products(instance.products.values_list('pk', flat=True))
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+  # connexion par session : le panier anonyme rejoint celui de l'utilisateur
+  if request is not None and hasattr(request, 'session'):
+    merge_session_cart(request.session, user)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_price(sender, instance, update_fields=None, **kwargs):
+  instance._previous_price = None
+  if instance.pk and (update_fields is None or 'price' in update_fields):
+    instance._previous_price = Product.objects.filter(pk=instance.pk).values_list('price', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def refresh_cart_totals(sender, instance, created, **kwargs):
+  # seul un changement de prix rend faux les sous-totaux des paniers (nom, image, admin : rien à faire)
+  previous = getattr(instance, '_previous_price', None)
+  if created or previous is None or previous == instance.price:
+    return
+  recompute_for_product(instance.pk)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+  instance._previous_status = (
+    Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first() if instance.pk else None
+  )
+
+
+@receiver(post_save, sender=Order)
+def update_sales_rollups(sender, instance, created, **kwargs):
+  # les changements de statut par queryset.update() ne passent pas ici
+  analytics.order_status_changed(instance, getattr(instance, '_previous_status', None), created)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=BlogPost)
+def generate_image_variants(sender, instance, **kwargs):
+  # après validation : le pool ne doit pas travailler sur un envoi annulé
+  transaction.on_commit(partial(images.schedule, instance))
@@ -1,3 +1,1757 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import parse_qsl, urlsplit
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from rest_framework import permissions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.throttling import AnonRateThrottle
+from rest_framework.test import APIClient
+
+from .cache import cache_stats
+from .promotions import PromotionEngine, get_engine
+from .reservations import release_expired
+from .retention import purge_abandoned_carts, rollup_inventory_history
+from .analytics import rebuild_sales, snapshot_stock
+from .catalog_io import import_products
+from .images import regenerate, wait_for_variants
+from .search import search_ids
+from . import benchmarks, images, metrics, views
+from .renderers import FastJSONRenderer
+from .seed import seed
+from .models import (
+  User, Category, Product, ProductImage, ProductAttribute, ProductAttributeValue, Inventory, InventoryHistory, Promotion, BlogPost,
+  Order, OrderItem, Cart, CartItem, StockReservation, InventoryHistoryDaily,
+  SalesDaily, ProductSalesDaily, CategorySalesDaily, StockLevelDaily
+)
+
+
+def make_product(category, index, **kwargs):
+  defaults = {
+    'name': f'Produit {index}',
+    'slug': f'produit-{category.pk}-{index}',
+    'price': Decimal('10.00'),
+    'compare_price': Decimal('12.00'),
+    'category': category,
+  }
+  defaults.update(kwargs)
+  return Product.objects.create(**defaults)
+
+
+class ListQueryCountTests(TestCase):
+  """Le nombre de requêtes d'une page ne doit pas dépendre du nombre de lignes"""
+
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.user = User.objects.create_user(username='client', password='secret123', phone='0100')
+    self.counter = 0
+
+  def count_queries(self, url):
+    with CaptureQueriesContext(connection) as ctx:
+      response = self.client.get(url)
+    self.assertEqual(response.status_code, 200, response.content)
+    return len(ctx.captured_queries)
+
+  def assertConstantQueries(self, url, seed):
+    # premier appel à vide : construit les index en mémoire (promotions, facettes)
+    self.count_queries(url)
+    seed(2)
+    small = self.count_queries(url)
+    seed(10)
+    large = self.count_queries(url)
+    self.assertEqual(small, large)
+
+  def seed_products(self, count):
+    category = Category.objects.create(name='Cat', slug=f'cat-{self.counter}')
+    self.counter += 1
+    for index in range(count):
+      product = make_product(category, index)
+      ProductImage.objects.create(product=product, image=f'p{index}.jpg', is_default=True)
+      ProductImage.objects.create(product=product, image=f'p{index}-alt.jpg')
+
+  def test_product_list(self):
+    self.assertConstantQueries(reverse('product-list'), self.seed_products)
+
+  def test_product_list_image_url(self):
+    self.seed_products(1)
+    response = self.client.get(reverse('product-list'))
+    row = response.data['results'][0]
+    self.assertTrue(row['image_url'].endswith('p0.jpg'))
+    self.assertEqual(row['category_name'], 'Cat')
+
+  def test_category_list(self):
+    def seed(count):
+      for index in range(count):
+        category = Category.objects.create(name='Cat', slug=f'cat-{self.counter}-{index}')
+        make_product(category, index)
+      self.counter += 1
+    self.assertConstantQueries(reverse('category-list'), seed)
+
+  def test_promotion_list(self):
+    def seed(count):
+      category = Category.objects.create(name='Cat', slug=f'cat-{self.counter}')
+      self.counter += 1
+      now = timezone.now()
+      for index in range(count):
+        promotion = Promotion.objects.create(
+          name=f'Promo {index}', discount_type='percentage', discount_value=Decimal('10'),
+          valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1)
+        )
+        promotion.applicable_categories.add(category)
+        promotion.applicable_products.add(make_product(category, index))
+    self.assertConstantQueries(reverse('promotion-list'), seed)
+
+  def test_blog_list(self):
+    def seed(count):
+      author = User.objects.create_user(username=f'auteur{self.counter}', password='x', phone='0')
+      self.counter += 1
+      for index in range(count):
+        BlogPost.objects.create(
+          title='Article', slug=f'article-{author.pk}-{index}', content='...', author=author,
+          published=True, published_at=timezone.now() - timedelta(hours=1)
+        )
+    self.assertConstantQueries(reverse('blogpost-list'), seed)
+
+  def test_order_list(self):
+    self.client.force_authenticate(self.user)
+
+    def seed(count):
+      category = Category.objects.create(name='Cat', slug=f'cat-{self.counter}')
+      self.counter += 1
+      for index in range(count):
+        order = Order.objects.create(
+          user=self.user, order_number=f'CMD-{category.pk}-{index}', customer_phone='0100',
+          tax=0, subtotal=Decimal('10.00'), total=Decimal('10.00')
+        )
+        for line in range(2):
+          OrderItem.objects.create(
+            order=order, product=make_product(category, f'{index}-{line}'),
+            quantity=1, price=Decimal('10.00')
+          )
+    self.assertConstantQueries(reverse('order-list'), seed)
+
+
+class CategoryTreeCountTests(TestCase):
+  def setUp(self):
+    cache.clear()
+
+  def test_counts_roll_up_descendants(self):
+    root = Category.objects.create(name='Cuisine', slug='cuisine')
+    child = Category.objects.create(name='Ustensiles', slug='ustensiles', parent=root)
+    leaf = Category.objects.create(name='Couteaux', slug='couteaux', parent=child)
+    make_product(root, 1)
+    make_product(child, 2)
+    make_product(leaf, 3)
+    make_product(leaf, 4)
+
+    response = APIClient().get(reverse('category-list'))
+    counts = {row['slug']: (row['product_count'], row['total_product_count'])
+              for row in response.data['results']}
+    self.assertEqual(counts['cuisine'], (1, 4))
+    self.assertEqual(counts['ustensiles'], (1, 3))
+    self.assertEqual(counts['couteaux'], (2, 2))
+
+
+class CatalogCacheTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.category = Category.objects.create(name='Cat', slug='cat')
+    self.product = make_product(self.category, 1)
+
+  def test_repeated_request_is_served_from_cache(self):
+    url = reverse('product-list')
+    self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+    with self.assertNumQueries(0):
+      response = self.client.get(url)
+    self.assertEqual(response['X-Cache'], 'HIT')
+    self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1})
+
+  def test_query_params_are_part_of_the_key(self):
+    url = reverse('product-list')
+    self.client.get(url)
+    self.assertEqual(self.client.get(url, {'ordering': 'price'})['X-Cache'], 'MISS')
+    self.assertEqual(self.client.get(url, {'page': 1})['X-Cache'], 'MISS')
+
+  def test_save_invalidates_dependent_endpoints(self):
+    url = reverse('product-detail', args=[self.product.pk])
+    self.client.get(url)
+    self.product.name = 'Renommé'
+    self.product.save()
+    response = self.client.get(url)
+    self.assertEqual(response['X-Cache'], 'MISS')
+    self.assertEqual(response.data['name'], 'Renommé')
+
+  def test_version_bumped_again_on_commit(self):
+    # une réponse mise en cache avant la validation (lignes d'avant) ne survit pas au commit
+    url = reverse('product-detail', args=[self.product.pk])
+    with self.captureOnCommitCallbacks(execute=True):
+      self.product.name = 'Renommé'
+      self.product.save()
+      self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+      self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+    self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+  def test_related_model_change_invalidates(self):
+    url = reverse('product-list')
+    self.client.get(url)
+    Inventory.objects.create(product=self.product, quantity=3)
+    self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+  def test_unrelated_model_change_keeps_entry(self):
+    url = reverse('category-list')
+    self.client.get(url)
+    Inventory.objects.create(product=self.product, quantity=3)
+    self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+
+class PromotionEngineTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    now = timezone.now()
+    self.window = {'valid_from': now - timedelta(days=1), 'valid_to': now + timedelta(days=1)}
+    self.root = Category.objects.create(name='Cuisine', slug='cuisine')
+    self.child = Category.objects.create(name='Couteaux', slug='couteaux', parent=self.root)
+    self.other = Category.objects.create(name='Linge', slug='linge')
+    self.knife = make_product(self.child, 1, price=Decimal('50.00'))
+    self.towel = make_product(self.other, 2, price=Decimal('20.00'))
+
+  def promotion(self, discount_type, value, **kwargs):
+    return Promotion.objects.create(
+      name='Promo', discount_type=discount_type, discount_value=Decimal(value),
+      **self.window, **kwargs
+    )
+
+  def test_category_promotion_applies_to_subcategories(self):
+    self.promotion('percentage', '10').applicable_categories.add(self.root)
+    prices = PromotionEngine().price_products([self.knife, self.towel])
+    self.assertEqual(prices[self.knife.pk][0], Decimal('45.00'))
+    self.assertEqual(prices[self.towel.pk], (Decimal('20.00'), None))
+
+  def test_best_promotion_wins(self):
+    self.promotion('percentage', '10').applicable_products.add(self.knife)
+    best = self.promotion('fixed', '15')
+    best.applicable_categories.add(self.child)
+    prices = PromotionEngine().price_products([self.knife])
+    self.assertEqual(prices[self.knife.pk], (Decimal('35.00'), best.pk))
+
+  def test_expired_and_inactive_promotions_are_ignored(self):
+    self.promotion('fixed', '5', active=False).applicable_products.add(self.knife)
+    expired = self.promotion('fixed', '5')
+    expired.valid_to = timezone.now() - timedelta(minutes=1)
+    expired.save()
+    expired.applicable_products.add(self.knife)
+    prices = PromotionEngine().price_products([self.knife])
+    self.assertEqual(prices[self.knife.pk][0], Decimal('50.00'))
+
+  def test_cart_minimum_order_amount(self):
+    self.promotion('fixed', '10', min_order_amount=Decimal('100'))
+    engine = PromotionEngine()
+    small = engine.price_cart([(self.knife.pk, self.child.pk, self.knife.price, 1)])
+    self.assertEqual(small['discount'], Decimal('0'))
+    large = engine.price_cart([
+      (self.knife.pk, self.child.pk, self.knife.price, 1),
+      (self.towel.pk, self.other.pk, self.towel.price, 3),
+    ])
+    self.assertEqual(large, {'subtotal': Decimal('110.00'), 'discount': Decimal('10'), 'total': Decimal('100.00')})
+
+  def test_product_list_ignores_future_promotions(self):
+    upcoming = self.promotion('percentage', '10')
+    upcoming.valid_from = timezone.now() + timedelta(days=1)
+    upcoming.save()
+    upcoming.applicable_products.add(self.knife)
+    response = APIClient().get(reverse('product-list'), {'promotion': upcoming.pk})
+    self.assertEqual(response.data['results'], [])
+
+  def test_product_list_filters_by_promotion_categories(self):
+    promotion = self.promotion('percentage', '10')
+    promotion.applicable_categories.add(self.root)
+    response = APIClient().get(reverse('product-list'), {'promotion': promotion.pk})
+    rows = response.data['results']
+    self.assertEqual([row['id'] for row in rows], [self.knife.pk])
+    self.assertEqual(rows[0]['discounted_price'], '45.00')
+
+
+class CheckoutTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.user = User.objects.create_user(username='client', password='secret123', phone='0100')
+    self.client.force_authenticate(self.user)
+    self.cart = Cart.objects.create(user=self.user)
+    self.category = Category.objects.create(name='Cat', slug='cat')
+
+  def add_line(self, index, quantity, stock):
+    product = make_product(self.category, index)
+    Inventory.objects.create(product=product, quantity=stock)
+    CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+    return product
+
+  def test_checkout_is_bulk_and_decrements_stock(self):
+    for index in range(50):
+      self.add_line(index, 2, 5)
+    get_engine()  # index des promotions construit une fois, hors mesure
+    with CaptureQueriesContext(connection) as ctx:
+      response = self.client.post(reverse('order-list'), {}, format='json')
+    self.assertEqual(response.status_code, 201, response.content)
+    self.assertLessEqual(len(ctx.captured_queries), 10)
+
+    order = Order.objects.get()
+    self.assertEqual(order.status, 'pending')
+    self.assertEqual(order.subtotal, Decimal('1000.00'))
+    self.assertEqual(order.items.count(), 50)
+    self.assertEqual(len(response.data['items']), 50)
+    self.assertEqual(set(Inventory.objects.values_list('quantity', flat=True)), {3})
+    self.assertEqual(InventoryHistory.objects.filter(quantity_changed=-2).count(), 50)
+    self.assertFalse(CartItem.objects.exists())
+
+  def test_cart_and_order_use_promoted_prices(self):
+    product = self.add_line(1, 2, 5)
+    now = timezone.now()
+    promotion = Promotion.objects.create(
+      name='Promo', discount_type='percentage', discount_value=Decimal('10'),
+      valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+    )
+    promotion.applicable_products.add(product)
+    listed = self.client.get(reverse('product-list')).data['results'][0]['discounted_price']
+    self.assertEqual(listed, '9.00')
+
+    cart = self.client.get(reverse('cart')).data
+    self.assertEqual((cart['subtotal'], cart['discount'], cart['total']), ('20.00', '2.00', '18.00'))
+    summary = self.client.get(reverse('cart-summary')).data
+    self.assertEqual(summary['total'], Decimal('18.00'))
+    response = self.client.post(reverse('order-list'), {}, format='json')
+    self.assertEqual(response.status_code, 201, response.content)
+    self.assertEqual((response.data['subtotal'], response.data['total']), ('20.00', '18.00'))
+
+  def test_cancel_restores_stock(self):
+    first = self.add_line(1, 2, 5)
+    second = self.add_line(2, 3, 4)
+    order = self.client.post(reverse('order-list'), {}, format='json').data
+    self.assertEqual(sorted(Inventory.objects.values_list('quantity', flat=True)), [1, 3])
+    response = self.client.post(reverse('order-cancel', args=[order['id']]))
+    self.assertEqual(response.status_code, 200, response.content)
+    self.assertEqual(Inventory.objects.get(product=first).quantity, 5)
+    self.assertEqual(Inventory.objects.get(product=second).quantity, 4)
+    restocked = InventoryHistory.objects.filter(reason=f"Annulation {order['order_number']}")
+    self.assertEqual(sorted(restocked.values_list('quantity_changed', flat=True)), [2, 3])
+    # une seconde annulation est refusée et ne rend rien
+    self.assertEqual(self.client.post(reverse('order-cancel', args=[order['id']])).status_code, 400)
+    self.assertEqual(Inventory.objects.get(product=first).quantity, 5)
+
+  def test_add_to_cart_with_several_carts(self):
+    product = self.add_line(1, 1, 5)
+    Cart.objects.create(user=self.user)
+    response = self.client.post(reverse('cart-add'), {'product_id': product.pk, 'quantity': 2}, format='json')
+    self.assertEqual(response.status_code, 200, response.content)
+    self.assertEqual(CartItem.objects.get(cart=self.cart).quantity, 3)
+
+  def test_checkout_uses_a_single_cart(self):
+    ordered = self.add_line(1, 2, 5)
+    other_cart = Cart.objects.create(user=self.user)
+    other = make_product(self.category, 2)
+    CartItem.objects.create(cart=other_cart, product=other, quantity=1)
+    response = self.client.post(reverse('order-list'), {}, format='json')
+    self.assertEqual(response.status_code, 201, response.content)
+    self.assertEqual([item['product'] for item in response.data['items']], [ordered.pk])
+    self.assertEqual(Order.objects.get().subtotal, ordered.price * 2)
+    self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+    self.assertTrue(CartItem.objects.filter(cart=other_cart).exists())
+
+  def test_insufficient_stock_rolls_back_everything(self):
+    self.add_line(1, 2, 5)
+    self.add_line(2, 4, 3)
+    response = self.client.post(reverse('order-list'), {}, format='json')
+    self.assertEqual(response.status_code, 400)
+    self.assertFalse(Order.objects.exists())
+    self.assertEqual(sorted(Inventory.objects.values_list('quantity', flat=True)), [3, 5])
+    self.assertEqual(CartItem.objects.count(), 2)
+
+  def test_empty_cart_is_rejected(self):
+    response = self.client.post(reverse('order-list'), {}, format='json')
+    self.assertEqual(response.status_code, 400)
+
+
+class StockReservationTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.category = Category.objects.create(name='Cat', slug='cat')
+    self.product = make_product(self.category, 1)
+    self.inventory = Inventory.objects.create(product=self.product, quantity=5)
+    self.first = APIClient()
+    self.first.force_authenticate(User.objects.create_user(username='a', password='x', phone='1'))
+    self.second = APIClient()
+    self.second.force_authenticate(User.objects.create_user(username='b', password='x', phone='2'))
+
+  def add(self, client, quantity):
+    return client.post(reverse('cart-add'), {'product_id': self.product.pk, 'quantity': quantity}, format='json')
+
+  def test_added_items_hold_stock(self):
+    self.assertEqual(self.add(self.first, 3).status_code, 200)
+    self.assertEqual(self.add(self.second, 3).status_code, 400)
+    self.assertEqual(self.add(self.second, 2).status_code, 200)
+    self.inventory.refresh_from_db()
+    self.assertEqual((self.inventory.reserved, self.inventory.available), (5, 0))
+
+  def test_update_and_remove_adjust_the_hold(self):
+    self.add(self.first, 2)
+    item = CartItem.objects.get()
+    response = self.first.patch(reverse('cart-item-update', args=[item.pk]), {'quantity': 4}, format='json')
+    self.assertEqual(response.status_code, 200, response.content)
+    self.inventory.refresh_from_db()
+    self.assertEqual(self.inventory.reserved, 4)
+    self.assertEqual(self.add(self.second, 2).status_code, 400)
+
+    self.first.delete(reverse('cart-item-remove', args=[item.pk]))
+    self.inventory.refresh_from_db()
+    self.assertEqual(self.inventory.reserved, 0)
+    self.assertFalse(StockReservation.objects.filter(cart__user__username='a').exists())
+
+  def test_expired_holds_are_swept(self):
+    self.add(self.first, 5)
+    StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+    call_command('release_reservations', stdout=io.StringIO())
+    self.inventory.refresh_from_db()
+    self.assertEqual(self.inventory.reserved, 0)
+    self.assertEqual(self.add(self.second, 5).status_code, 200)
+
+  def test_checkout_consumes_own_hold(self):
+    self.add(self.first, 3)
+    self.add(self.second, 2)
+    response = self.first.post(reverse('order-list'), {}, format='json')
+    self.assertEqual(response.status_code, 201, response.content)
+    self.inventory.refresh_from_db()
+    self.assertEqual((self.inventory.quantity, self.inventory.reserved), (2, 2))
+    self.assertEqual(StockReservation.objects.count(), 1)
+
+  def test_deleting_cart_returns_stock(self):
+    self.add(self.first, 4)
+    Cart.objects.filter(user__username='a').delete()
+    self.inventory.refresh_from_db()
+    self.assertEqual(self.inventory.reserved, 0)
+
+
+class StockReservationStressTests(TransactionTestCase):
+  """Beaucoup de paniers ajoutent le même produit en parallèle : jamais plus que le stock"""
+
+  threads = 16
+  attempts = 4
+  stock = 25
+
+  def test_concurrent_add_to_cart_never_oversells(self):
+    category = Category.objects.create(name='Cat', slug='cat')
+    product = make_product(category, 1)
+    Inventory.objects.create(product=product, quantity=self.stock)
+    users = [
+      User.objects.create_user(username=f'client{index}', password='x', phone=str(index))
+      for index in range(self.threads)
+    ]
+    results = []
+    lock = threading.Lock()
+
+    def hammer(user):
+      client = APIClient()
+      client.force_authenticate(user)
+      try:
+        for _ in range(self.attempts):
+          response = client.post(reverse('cart-add'), {'product_id': product.pk, 'quantity': 1}, format='json')
+          with lock:
+            results.append(response.status_code)
+      finally:
+        connection.close()
+
+    workers = [threading.Thread(target=hammer, args=(user,)) for user in users]
+    for worker in workers:
+      worker.start()
+    for worker in workers:
+      worker.join()
+
+    inventory = Inventory.objects.get()
+    held = sum(StockReservation.objects.values_list('quantity', flat=True))
+    carted = sum(CartItem.objects.values_list('quantity', flat=True))
+    self.assertEqual(results.count(200), self.stock)
+    self.assertEqual(results.count(400), self.threads * self.attempts - self.stock)
+    self.assertEqual(inventory.reserved, self.stock)
+    self.assertEqual(held, self.stock)
+    self.assertEqual(carted, self.stock)
+
+
+class ProductSearchTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.knives = Category.objects.create(name='Couteaux', slug='couteaux')
+    self.pans = Category.objects.create(name='Poêles', slug='poeles')
+    self.chef = make_product(self.knives, 1, name='Couteau de chef', description='Lame en acier')
+    self.pan = make_product(self.pans, 2, name='Poêle en fonte', description='Idéale pour saisir')
+    self.steel = make_product(self.pans, 3, name='Sauteuse', description='Acier inoxydable, compatible couteau')
+
+  def search(self, term):
+    response = APIClient().get(reverse('product-list'), {'search': term})
+    return [row['id'] for row in response.data['results']]
+
+  def test_prefix_and_accent_insensitive_matching(self):
+    self.assertEqual(self.search('poel'), [self.pan.pk, self.steel.pk])
+    self.assertEqual(self.search('fon'), [self.pan.pk])
+
+  def test_name_matches_rank_first(self):
+    self.assertEqual(self.search('couteau'), [self.chef.pk, self.steel.pk])
+
+  def test_explicit_ordering_overrides_rank(self):
+    self.assertEqual(self.search('acier')[0:2], [self.steel.pk, self.chef.pk])
+    response = APIClient().get(reverse('product-list'), {'search': 'acier', 'ordering': 'name'})
+    self.assertEqual([row['id'] for row in response.data['results']], [self.chef.pk, self.steel.pk])
+
+  def test_category_and_attribute_values_are_indexed(self):
+    color = ProductAttribute.objects.create(name='Couleur')
+    ProductAttributeValue.objects.create(product=self.pan, attribute=color, value='Rouge')
+    self.assertEqual(search_ids('rouge'), [self.pan.pk])
+    self.assertEqual(set(search_ids('couteaux')), {self.chef.pk})
+
+  @override_settings(SEARCH_MAX_RESULTS=10)
+  @mock.patch.object(views.KeysetPagination, 'page_size', 3)
+  def test_filters_apply_to_every_match(self):
+    # les meilleures correspondances sont hors stock : les filtres de la vue portent sur tous les résultats
+    for index in range(30):
+      make_product(self.pans, 100 + index, name='Acier acier', in_stock=False)
+    weak = [make_product(self.pans, 200 + index, description=f'acier {index}') for index in range(5)]
+    url = reverse('product-list')
+    response = APIClient().get(url, {'search': 'acier'})
+    self.assertEqual(response.data['count'], 7)
+    by_page = [row['id'] for page in (1, 2, 3) for row in APIClient().get(url, {'search': 'acier', 'page': page}).data['results']]
+
+    by_cursor, params = [], {'search': 'acier', 'pagination': 'cursor'}
+    while params:
+      page = APIClient().get(url, params).data
+      by_cursor += [row['id'] for row in page['results']]
+      params = dict(parse_qsl(urlsplit(page['next']).query)) if page['next'] else None
+    # curseurs : même classement par pertinence que la pagination par page
+    self.assertEqual(by_cursor, by_page)
+    self.assertEqual(set(by_page), {self.chef.pk, self.steel.pk, *(product.pk for product in weak)})
+
+  def test_index_follows_updates_and_deletes(self):
+    self.pan.name = 'Wok'
+    self.pan.save()
+    self.assertEqual(search_ids('wok'), [self.pan.pk])
+    self.assertEqual(search_ids('fonte'), [])
+    self.pans.name = 'Cuisson'
+    self.pans.save()
+    self.assertEqual(set(search_ids('cuisson')), {self.pan.pk, self.steel.pk})
+    self.pan.delete()
+    self.assertEqual(search_ids('cuisson'), [self.steel.pk])
+
+
+class AttributeFacetTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    category = Category.objects.create(name='Linge', slug='linge')
+    color = ProductAttribute.objects.create(name='color')
+    size = ProductAttribute.objects.create(name='size')
+    self.products = {}
+    for index, (colour, sizes) in enumerate([('Red', 'M'), ('red', 'L'), ('Blue', 'M'), ('Blue', 'S')]):
+      product = make_product(category, index)
+      ProductAttributeValue.objects.create(product=product, attribute=color, value=colour)
+      ProductAttributeValue.objects.create(product=product, attribute=size, value=sizes)
+      self.products[index] = product.pk
+    self.other_category = Category.objects.create(name='Autre', slug='autre')
+    ProductAttributeValue.objects.create(
+      product=make_product(self.other_category, 9), attribute=color, value='Green'
+    )
+
+  def get(self, **params):
+    response = self.client.get(reverse('product-list'), params)
+    self.assertEqual(response.status_code, 200)
+    return sorted(row['id'] for row in response.data['results']), response.data['facets']
+
+  def test_counts_without_selection(self):
+    ids, facets = self.get()
+    self.assertEqual(len(ids), 5)
+    self.assertEqual(facets['color'], {'Blue': 2, 'Red': 2, 'Green': 1})
+    self.assertEqual(facets['size'], {'M': 2, 'L': 1, 'S': 1})
+
+  def test_selection_filters_and_keeps_own_alternatives(self):
+    ids, facets = self.get(**{'attr.color': 'red'})
+    self.assertEqual(ids, [self.products[0], self.products[1]])
+    # les autres couleurs restent proposées, les tailles suivent la sélection
+    self.assertEqual(facets['color'], {'Blue': 2, 'Red': 2, 'Green': 1})
+    self.assertEqual(facets['size'], {'L': 1, 'M': 1})
+
+  def test_values_are_or_and_attributes_are_and(self):
+    ids, facets = self.get(**{'attr.color': 'red,blue', 'attr.size': 'M'})
+    self.assertEqual(ids, [self.products[0], self.products[2]])
+    self.assertEqual(facets['color'], {'Blue': 1, 'Red': 1})
+
+  def test_counts_follow_other_filters(self):
+    _, facets = self.get(category=self.other_category.pk)
+    self.assertEqual(facets, {'color': {'Green': 1}})
+
+  def test_unknown_value_returns_nothing(self):
+    ids, _ = self.get(**{'attr.color': 'purple'})
+    self.assertEqual(ids, [])
+
+
+class KeysetPaginationTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    category = Category.objects.create(name='Cat', slug='cat')
+    # beaucoup d'égalités de prix pour vérifier le départage par id
+    self.ids = [
+      make_product(category, index, price=Decimal(10 + index % 3)).pk
+      for index in range(45)
+    ]
+
+  def walk(self, url, params):
+    seen = []
+    response = self.client.get(url, params)
+    while True:
+      self.assertEqual(response.status_code, 200, response.content)
+      self.assertNotIn('count', response.data)
+      seen.extend(row['id'] for row in response.data['results'])
+      if not response.data['next']:
+        return seen
+      response = self.client.get(response.data['next'])
+
+  def test_walks_every_product_once_in_order(self):
+    seen = self.walk(reverse('product-list'), {'pagination': 'cursor', 'ordering': 'price'})
+    expected = sorted(
+      Product.objects.values_list('price', 'id'), key=lambda row: (row[0], row[1])
+    )
+    self.assertEqual(seen, [pk for _, pk in expected])
+
+  def test_default_ordering_is_newest_first(self):
+    seen = self.walk(reverse('product-list'), {'pagination': 'cursor'})
+    self.assertEqual(seen, sorted(self.ids, reverse=True))
+
+  def test_deep_page_uses_no_count_or_offset(self):
+    response = self.client.get(reverse('product-list'), {'pagination': 'cursor'})
+    with CaptureQueriesContext(connection) as ctx:
+      self.client.get(response.data['next'])
+    sql = ' '.join(query['sql'] for query in ctx.captured_queries)
+    self.assertNotIn('COUNT(', sql)
+    self.assertNotIn('OFFSET', sql)
+
+  def test_page_numbers_remain_the_default(self):
+    response = self.client.get(reverse('product-list'))
+    self.assertEqual(response.data['count'], 45)
+
+  def test_invalid_cursor(self):
+    response = self.client.get(reverse('product-list'), {'cursor': 'pas-un-curseur'})
+    self.assertEqual(response.status_code, 404)
+
+  def test_wrong_typed_cursor(self):
+    cursor = base64.urlsafe_b64encode(json.dumps(['abc', 1]).encode()).decode()
+    response = self.client.get(reverse('product-list'), {'cursor': cursor})
+    self.assertEqual(response.status_code, 404)
+    response = self.client.get(reverse('product-list'), {'ordering': 'price', 'cursor': cursor})
+    self.assertEqual(response.status_code, 404)
+    response = self.client.get(reverse('blogpost-list'), {'cursor': cursor})
+    self.assertEqual(response.status_code, 404)
+
+  async def test_wrong_typed_cursor_async(self):
+    cursor = base64.urlsafe_b64encode(json.dumps(['abc', 1]).encode()).decode()
+    response = await AsyncClient().get(reverse('async-product-list'), {'cursor': cursor})
+    self.assertEqual(response.status_code, 404)
+
+  def test_cursor_reused_under_another_ordering(self):
+    response = self.client.get(reverse('product-list'), {'pagination': 'cursor'})
+    cursor = dict(parse_qsl(urlsplit(response.data['next']).query))['cursor']
+    response = self.client.get(reverse('product-list'), {'ordering': 'price', 'cursor': cursor})
+    self.assertEqual(response.status_code, 404)
+
+  def test_orders_and_blog_posts(self):
+    user = User.objects.create_user(username='client', password='x', phone='0')
+    for index in range(25):
+      Order.objects.create(
+        user=user, order_number=f'CMD-{index}', customer_phone='0',
+        tax=0, subtotal=Decimal('1.00'), total=Decimal('1.00')
+      )
+      BlogPost.objects.create(
+        title='Article', slug=f'article-{index}', content='...', author=user,
+        published=True, published_at=timezone.now() - timedelta(hours=index % 4)
+      )
+    self.assertEqual(len(set(self.walk(reverse('blogpost-list'), {'pagination': 'cursor'}))), 25)
+    self.client.force_authenticate(user)
+    self.assertEqual(len(set(self.walk(reverse('order-list'), {'pagination': 'cursor'}))), 25)
+
+
+class SeedTests(TestCase):
+  counts = dict(categories=5, products=30, users=4, carts=3, orders=6, promotions=4, posts=3)
+
+  def snapshot(self):
+    return (
+      list(Product.objects.order_by('slug').values_list('slug', 'price', 'category__slug', 'in_stock')),
+      list(Order.objects.order_by('order_number').values_list('order_number', 'total')),
+    )
+
+  def test_seed_is_deterministic(self):
+    seed(seed=7, **self.counts)
+    first = self.snapshot()
+    self.assertEqual(len(first[0]), 30)
+    self.assertEqual(Inventory.objects.count(), 30)
+    self.assertTrue(search_ids('produit'))
+    Product.objects.all().delete()
+    Order.objects.all().delete()
+    User.objects.all().delete()
+    Category.objects.all().delete()
+    Promotion.objects.all().delete()
+    seed(seed=7, **self.counts)
+    self.assertEqual(self.snapshot(), first)
+
+
+class CartTotalsTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.user = User.objects.create_user(username='client', password='x', phone='0')
+    self.client.force_authenticate(self.user)
+    self.category = Category.objects.create(name='Cat', slug='cat')
+
+  def add(self, product, quantity):
+    response = self.client.post(reverse('cart-add'), {'product_id': product.pk, 'quantity': quantity}, format='json')
+    self.assertEqual(response.status_code, 200, response.content)
+
+  def cart(self):
+    return Cart.objects.get(user=self.user)
+
+  def test_operations_maintain_totals(self):
+    pan = make_product(self.category, 1, price=Decimal('20.00'))
+    knife = make_product(self.category, 2, price=Decimal('7.50'))
+    self.add(pan, 2)
+    self.add(knife, 1)
+    self.add(pan, 1)
+    self.assertEqual((self.cart().item_count, self.cart().subtotal), (4, Decimal('67.50')))
+
+    item = CartItem.objects.get(product=pan)
+    self.client.patch(reverse('cart-item-update', args=[item.pk]), {'quantity': 1}, format='json')
+    self.assertEqual((self.cart().item_count, self.cart().subtotal), (2, Decimal('27.50')))
+
+    self.client.delete(reverse('cart-item-remove', args=[CartItem.objects.get(product=knife).pk]))
+    self.assertEqual((self.cart().item_count, self.cart().subtotal), (1, Decimal('20.00')))
+
+    summary = self.client.get(reverse('cart-summary')).data
+    self.assertEqual((summary['item_count'], summary['subtotal']), (1, Decimal('20.00')))
+
+  def test_price_change_refreshes_carts(self):
+    pan = make_product(self.category, 1, price=Decimal('20.00'))
+    self.add(pan, 3)
+    pan.price = Decimal('15.00')
+    pan.save()
+    self.assertEqual(self.cart().subtotal, Decimal('45.00'))
+
+    # autre champ modifié : les paniers ne sont pas recalculés
+    pan.name = 'Poêle renommée'
+    with CaptureQueriesContext(connection) as ctx:
+      pan.save()
+    self.assertFalse([query for query in ctx.captured_queries if 'UPDATE "cs_app_cart"' in query['sql']])
+
+  def test_summary_without_cart(self):
+    summary = self.client.get(reverse('cart-summary')).data
+    self.assertEqual((summary['item_count'], summary['subtotal']), (0, Decimal('0.00')))
+
+  def test_cart_view_is_constant_in_queries(self):
+    self.add(make_product(self.category, 0), 1)
+    with CaptureQueriesContext(connection) as small:
+      self.client.get(reverse('cart'))
+    for index in range(1, 15):
+      self.add(make_product(self.category, index), 1)
+    with CaptureQueriesContext(connection) as large:
+      response = self.client.get(reverse('cart'))
+    self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+    self.assertEqual(response.data['item_count'], 15)
+    self.assertEqual(response.data['total'], '150.00')
+    self.assertEqual(len(response.data['items']), 15)
+
+  def test_checkout_empties_totals(self):
+    self.add(make_product(self.category, 1), 2)
+    self.client.post(reverse('order-list'), {}, format='json')
+    self.assertEqual((self.cart().item_count, self.cart().subtotal), (0, Decimal('0')))
+
+
+class SessionCartTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.user = User.objects.create_user(username='client', password='secret-pass', phone='0')
+    self.category = Category.objects.create(name='Cat', slug='cat')
+    self.pan = make_product(self.category, 1, price=Decimal('20.00'))
+    self.knife = make_product(self.category, 2, price=Decimal('7.50'))
+    Inventory.objects.create(product=self.pan, quantity=5)
+
+  def add(self, product, quantity):
+    return self.client.post(reverse('cart-add'), {'product_id': product.pk, 'quantity': quantity}, format='json')
+
+  def test_anonymous_cart_never_writes(self):
+    with CaptureQueriesContext(connection) as ctx:
+      self.assertEqual(self.add(self.pan, 2).status_code, 200)
+      self.assertEqual(self.add(self.knife, 1).status_code, 200)
+      response = self.client.get(reverse('cart'))
+      self.client.patch(reverse('cart-session-item', args=[self.knife.pk]), {'quantity': 3}, format='json')
+      summary = self.client.get(reverse('cart-summary')).data
+    writes = [q['sql'] for q in ctx.captured_queries if not q['sql'].lstrip().upper().startswith('SELECT')]
+    self.assertEqual(writes, [])
+    self.assertFalse(Cart.objects.exists())
+    # session dans son propre cache, hors du cache du catalogue
+    key = 'django.contrib.sessions.cache' + self.client.session.session_key
+    self.assertTrue(caches['sessions'].has_key(key))
+    self.assertFalse(cache.has_key(key))
+    self.assertEqual((response.data['item_count'], response.data['total']), (3, '47.50'))
+    self.assertEqual((summary['item_count'], summary['subtotal']), (5, Decimal('62.50')))
+
+    self.assertEqual(self.add(self.pan, 4).status_code, 400)
+    self.assertEqual(self.client.delete(reverse('cart-session-item', args=[self.pan.pk])).status_code, 204)
+    self.assertEqual(self.client.get(reverse('cart')).data['item_count'], 3)
+
+  def test_merge_on_login(self):
+    cart = Cart.objects.create(user=self.user)
+    CartItem.objects.create(cart=cart, product=self.knife, quantity=1)
+    Inventory.objects.filter(product=self.pan).update(reserved=1)
+    self.add(self.pan, 4)
+    self.add(self.knife, 2)
+
+    self.client.login(username='client', password='secret-pass')
+    cart.refresh_from_db()
+    lines = dict(cart.items.values_list('product_id', 'quantity'))
+    self.assertEqual(lines, {self.pan.pk: 4, self.knife.pk: 3})
+    self.assertEqual((cart.item_count, cart.subtotal), (7, Decimal('102.50')))
+    self.assertEqual(Inventory.objects.get(product=self.pan).reserved, 5)
+    self.assertEqual(StockReservation.objects.get(cart=cart).quantity, 4)
+    self.assertEqual(self.client.get(reverse('cart')).data['item_count'], 7)
+
+  def test_merge_caps_to_available_stock(self):
+    self.add(self.pan, 5)
+    Inventory.objects.filter(product=self.pan).update(reserved=3)
+    self.client.force_authenticate(self.user)
+    response = self.client.post(reverse('cart-merge'))
+    self.assertEqual(response.data['merged'], 1)
+    self.assertEqual(CartItem.objects.get(cart__user=self.user).quantity, 2)
+    self.assertEqual(Inventory.objects.get(product=self.pan).reserved, 5)
+    # le panier de session est vidé : une seconde fusion ne fait rien
+    self.assertEqual(self.client.post(reverse('cart-merge')).data['merged'], 0)
+
+
+class RetentionTests(TestCase):
+  def setUp(self):
+    self.category = Category.objects.create(name='Cat', slug='cat')
+    self.product = make_product(self.category, 1)
+    self.inventory = Inventory.objects.create(product=self.product, quantity=10, reserved=2)
+    self.now = timezone.now()
+
+  def test_purge_abandoned_carts_in_batches(self):
+    old = [Cart.objects.create(session_key=f'old-{index}') for index in range(5)]
+    recent = Cart.objects.create(session_key='recent')
+    Cart.objects.filter(pk__in=[cart.pk for cart in old]).update(updated_at=self.now - timedelta(days=40))
+    CartItem.objects.create(cart=old[0], product=self.product, quantity=2)
+    StockReservation.objects.create(cart=old[0], inventory=self.inventory, quantity=2, expires_at=self.now)
+
+    batches = []
+    purged = purge_abandoned_carts(self.now - timedelta(days=30), batch_size=2, progress=batches.append)
+    self.assertEqual(purged, 5)
+    self.assertEqual(batches, [2, 4, 5])
+    self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [recent.pk])
+    self.assertFalse(CartItem.objects.exists())
+    self.inventory.refresh_from_db()
+    self.assertEqual(self.inventory.reserved, 0)
+
+  def test_rollup_inventory_history_by_day(self):
+    day = self.now - timedelta(days=200)
+    for index, quantity in enumerate([5, -2, 3]):
+      entry = InventoryHistory.objects.create(inventory=self.inventory, quantity_changed=quantity, reason='Vente')
+      InventoryHistory.objects.filter(pk=entry.pk).update(created_at=day + timedelta(minutes=index))
+    older = InventoryHistory.objects.create(inventory=self.inventory, quantity_changed=7, reason='Réassort')
+    InventoryHistory.objects.filter(pk=older.pk).update(created_at=day - timedelta(days=3))
+    InventoryHistory.objects.create(inventory=self.inventory, quantity_changed=1, reason='Récent')
+
+    # lots de deux : le jour aux trois mouvements est coupé entre deux lots
+    self.assertEqual(rollup_inventory_history(self.now - timedelta(days=90), batch_size=2), 4)
+    self.assertEqual(InventoryHistory.objects.get().reason, 'Récent')
+    daily = list(InventoryHistoryDaily.objects.order_by('day').values_list('quantity_changed', 'movements'))
+    self.assertEqual(daily, [(7, 1), (6, 3)])
+
+
+class AnalyticsTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.admin = User.objects.create_user(username='admin', password='x', phone='0', is_staff=True)
+    self.customer = User.objects.create_user(username='client', password='x', phone='0100')
+    self.client.force_authenticate(self.admin)
+    self.pans = Category.objects.create(name='Poêles', slug='poeles')
+    self.knives = Category.objects.create(name='Couteaux', slug='couteaux')
+    self.pan = make_product(self.pans, 1, price=Decimal('20.00'))
+    self.knife = make_product(self.knives, 2, price=Decimal('7.50'))
+
+  def order(self, lines):
+    order = Order.objects.create(
+      user=self.customer, order_number=f'CMD{Order.objects.count()}', status='pending',
+      customer_phone='0100', tax=0, subtotal=0, total=0
+    )
+    OrderItem.objects.bulk_create([
+      OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+      for product, quantity in lines
+    ])
+    return order
+
+  def confirm(self, order):
+    response = self.client.post(reverse('order-confirm', args=[order.pk]))
+    self.assertEqual(response.status_code, 200, response.content)
+
+  def test_confirmation_updates_rollups(self):
+    first = self.order([(self.pan, 2), (self.knife, 1)])
+    second = self.order([(self.pan, 1)])
+    self.order([(self.knife, 5)])  # en attente : non comptée
+    self.confirm(first)
+    self.confirm(second)
+
+    sales = SalesDaily.objects.get()
+    self.assertEqual((sales.orders, sales.units, sales.revenue), (2, 4, Decimal('67.50')))
+    self.assertEqual(ProductSalesDaily.objects.get(product=self.pan).revenue, Decimal('60.00'))
+    self.assertEqual(CategorySalesDaily.objects.get(category=self.knives).units, 1)
+
+    response = self.client.get(reverse('analytics-products'))
+    self.assertEqual([row['name'] for row in response.data['results']], ['Produit 1', 'Produit 2'])
+
+    # annuler une commande confirmée la retire des cumuls
+    self.client.force_authenticate(self.customer)
+    self.client.post(reverse('order-cancel', args=[second.pk]))
+    sales.refresh_from_db()
+    self.assertEqual((sales.orders, sales.units, sales.revenue), (1, 3, Decimal('47.50')))
+
+  def test_order_created_confirmed_is_counted(self):
+    with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+      order = Order.objects.create(
+        user=self.customer, order_number='CMD-direct', status='confirmed',
+        customer_phone='0100', tax=0, subtotal=0, total=0
+      )
+      OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=self.pan, quantity=2, price=self.pan.price),
+        OrderItem(order=order, product=self.knife, quantity=1, price=self.knife.price),
+      ])
+    sales = SalesDaily.objects.get()
+    self.assertEqual((sales.orders, sales.units, sales.revenue), (1, 3, Decimal('47.50')))
+    self.assertEqual(ProductSalesDaily.objects.get(product=self.pan).units, 2)
+
+  def test_rebuild_matches_incremental_rollups(self):
+    for lines in ([(self.pan, 2), (self.knife, 1)], [(self.knife, 3)]):
+      self.confirm(self.order(lines))
+    incremental = {
+      model: sorted(model.objects.values_list('units', 'revenue')) for model in
+      (SalesDaily, ProductSalesDaily, CategorySalesDaily)
+    }
+    rebuild_sales()
+    for model, rows in incremental.items():
+      self.assertEqual(sorted(model.objects.values_list('units', 'revenue')), rows)
+
+  def test_endpoints_read_rollups_only(self):
+    self.confirm(self.order([(self.pan, 1)]))
+    with CaptureQueriesContext(connection) as ctx:
+      response = self.client.get(reverse('analytics-sales'))
+    self.assertEqual(response.data['totals']['revenue'], Decimal('20.00'))
+    self.assertFalse([q for q in ctx.captured_queries if 'cs_app_order' in q['sql']])
+    self.assertEqual(self.client.get(reverse('analytics-sales'), {'from': '2026-13-01'}).status_code, 400)
+    self.client.force_authenticate(self.customer)
+    self.assertEqual(self.client.get(reverse('analytics-sales')).status_code, 403)
+
+  def test_stock_snapshot(self):
+    Inventory.objects.create(product=self.pan, quantity=3, low_stock=6)
+    Inventory.objects.create(product=self.knife, quantity=0)
+    snapshot_stock()
+    latest = self.client.get(reverse('analytics-stock')).data['latest']
+    self.assertEqual((latest['tracked'], latest['low_stock'], latest['out_of_stock']), (2, 1, 1))
+
+  def test_stock_snapshot_taken_on_first_view_of_the_day(self):
+    Inventory.objects.create(product=self.pan, quantity=3, low_stock=6)
+    latest = self.client.get(reverse('analytics-stock')).data['latest']
+    self.assertEqual((latest['day'], latest['tracked'], latest['low_stock']), (timezone.localdate(), 1, 1))
+
+
+class CatalogImportTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.client.force_authenticate(User.objects.create_user(username='admin', password='x', phone='0', is_staff=True))
+    self.pans = Category.objects.create(name='Poêles', slug='poeles')
+    Category.objects.create(name='Couteaux', slug='couteaux')
+
+  def jsonl(self, rows):
+    return io.StringIO(''.join(json.dumps(row) + '\n' for row in rows))
+
+  def rows(self, count, **extra):
+    return [
+      {'slug': f'p-{index}', 'name': f'Poêle {index}', 'price': '19.90', 'category': 'poeles',
+       'quantity': index, 'attributes': {'material': 'Fonte', 'size': str(index)}, **extra}
+      for index in range(count)
+    ]
+
+  def test_import_upserts_products_stock_and_attributes(self):
+    report = import_products(self.jsonl(self.rows(3)), batch_size=2)
+    self.assertEqual((report['imported'], report['error_count']), (3, 0))
+    self.assertEqual(Inventory.objects.get(product__slug='p-2').quantity, 2)
+    self.assertEqual(ProductAttributeValue.objects.count(), 6)
+
+    existing = Product.objects.get(slug='p-1')
+    import_products(self.jsonl([{**self.rows(2)[1], 'price': '9.90', 'quantity': 40, 'attributes': {'material': 'Inox'}}]))
+    product = Product.objects.get(slug='p-1')
+    self.assertEqual((product.pk, product.price, product.created_at), (existing.pk, Decimal('9.90'), existing.created_at))
+    self.assertEqual(product.inventory.quantity, 40)
+    values = dict(product.attribute_values.values_list('attribute__name', 'value'))
+    self.assertEqual(values, {'material': 'Inox', 'size': '1'})
+    self.assertEqual(Product.objects.count(), 3)
+    self.assertEqual(set(search_ids('poêle')), {item.pk for item in Product.objects.all()})
+
+  def test_partial_file_keeps_other_columns(self):
+    import_products(self.jsonl(self.rows(2, description='Fonte émaillée', featured=True, compare_price='25.00', low_stock=3)))
+    stream = io.StringIO('slug,name,price,category,quantity\np-1,Poêle 1,14.90,poeles,8\n')
+    report = import_products(stream, format='csv')
+    self.assertEqual((report['imported'], report['error_count']), (1, 0))
+    product = Product.objects.select_related('inventory').get(slug='p-1')
+    self.assertEqual(product.price, Decimal('14.90'))
+    self.assertEqual(
+      (product.description, product.featured, product.in_stock, product.compare_price),
+      ('Fonte émaillée', True, True, Decimal('25.00'))
+    )
+    self.assertEqual((product.inventory.quantity, product.inventory.low_stock), (8, 3))
+
+    # colonne présente : réécrite, y compris à vide en JSON Lines
+    import_products(self.jsonl([{**self.rows(2)[1], 'description': '', 'featured': False}]))
+    product.refresh_from_db()
+    self.assertEqual((product.description, product.featured, product.compare_price), ('', False, Decimal('25.00')))
+
+  def test_invalid_rows_are_reported(self):
+    stream = io.StringIO(
+      'slug,name,price,category,attr.color\n'
+      'a,Poêle A,12.50,poeles,Rouge\n'
+      'b,Poêle B,abc,poeles,\n'
+      'c,Poêle C,5,inconnue,\n'
+    )
+    report = import_products(stream, format='csv')
+    self.assertEqual((report['processed'], report['imported'], report['error_count']), (3, 1, 2))
+    self.assertEqual([error['line'] for error in report['errors']], [3, 4])
+    self.assertEqual(Product.objects.get().attribute_values.get().value, 'Rouge')
+
+  def test_queries_per_batch_are_constant(self):
+    import_products(self.jsonl(self.rows(1)))  # crée les attributs
+    counts = []
+    for size in (5, 50):
+      with CaptureQueriesContext(connection) as ctx:
+        import_products(self.jsonl(self.rows(size, name='Poêle')), batch_size=1000)
+      counts.append(len(ctx.captured_queries))
+    self.assertEqual(counts[0], counts[1])
+
+  def test_export_round_trip_through_endpoints(self):
+    upload = SimpleUploadedFile('catalog.jsonl', self.jsonl(self.rows(4)).getvalue().encode())
+    response = self.client.post(reverse('product-import'), {'file': upload}, format='multipart')
+    self.assertEqual(response.data['imported'], 4, response.data)
+
+    for output in ('csv', 'jsonl'):
+      response = self.client.get(reverse('product-export'), {'output': output})
+      self.assertEqual(response.status_code, 200)
+      exported = b''.join(response.streaming_content).decode()
+      Product.objects.all().delete()
+      report = import_products(io.StringIO(exported), format=output)
+      self.assertEqual(report['imported'], 4, report)
+      self.assertEqual(Inventory.objects.get(product__slug='p-3').quantity, 3)
+      self.assertEqual(
+        dict(Product.objects.get(slug='p-3').attribute_values.values_list('attribute__name', 'value')),
+        {'material': 'Fonte', 'size': '3'}
+      )
+
+
+class OrderExportTests(TestCase):
+  def setUp(self):
+    self.client = APIClient()
+    self.customer = User.objects.create_user(username='grossiste', password='x', phone='0100')
+    self.other = User.objects.create_user(username='autre', password='x', phone='0200')
+    self.client.force_authenticate(self.customer)
+    category = Category.objects.create(name='Cat', slug='cat')
+    self.products = [make_product(category, index) for index in range(3)]
+
+  def create_orders(self, user, count, start=0):
+    orders = Order.objects.bulk_create([
+      Order(user=user, order_number=f'{user.username[:3]}{index}', status='pending',
+            customer_phone='0', tax=0, subtotal=20, total=20)
+      for index in range(start, start + count)
+    ])
+    OrderItem.objects.bulk_create([
+      OrderItem(order=order, product=product, quantity=2, price=product.price)
+      for order in orders for product in self.products[:2]
+    ])
+
+  def export(self, output, **params):
+    response = self.client.get(reverse('order-export'), {'output': output, **params})
+    self.assertEqual(response.status_code, 200)
+    return b''.join(response.streaming_content).decode()
+
+  def test_exports_own_orders_with_items(self):
+    self.create_orders(self.customer, 3)
+    self.create_orders(self.other, 2)
+    orders = [json.loads(line) for line in self.export('jsonl').splitlines()]
+    self.assertEqual(len(orders), 3)
+    self.assertEqual(orders[0]['items'][0]['product_name'], 'Produit 0')
+    lines = self.export('csv').splitlines()
+    self.assertEqual(lines[0].split(',')[:2], ['order_number', 'status'])
+    self.assertEqual(len(lines), 1 + 3 * 2)
+
+  def test_admin_exports_any_account_in_constant_queries(self):
+    admin = User.objects.create_user(username='admin', password='x', phone='0', is_staff=True)
+    self.client.force_authenticate(admin)
+    self.create_orders(self.customer, 5)
+    with CaptureQueriesContext(connection) as small:
+      self.export('jsonl', user=self.customer.pk)
+    self.create_orders(self.customer, 200, start=5)
+    with CaptureQueriesContext(connection) as large:
+      exported = self.export('jsonl', user=self.customer.pk)
+    self.assertEqual(len(exported.splitlines()), 205)
+    self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+def make_image(size=(1200, 800), mode='RGB'):
+  from PIL import Image
+  buffer = io.BytesIO()
+  Image.new(mode, size, 'red').save(buffer, 'PNG')
+  return SimpleUploadedFile('poele.png', buffer.getvalue(), content_type='image/png')
+
+
+class ImageVariantTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.media = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.media)
+    overrides = override_settings(MEDIA_ROOT=self.media, IMAGE_WORKERS=0)
+    overrides.enable()
+    self.addCleanup(overrides.disable)
+    self.client = APIClient()
+    self.category = Category.objects.create(name='Cat', slug='cat')
+    self.product = make_product(self.category, 1)
+
+  def upload(self, **kwargs):
+    with self.captureOnCommitCallbacks(execute=True):
+      image = ProductImage.objects.create(product=self.product, image=make_image(**kwargs), is_default=True)
+    image.refresh_from_db()
+    return image
+
+  def test_upload_generates_hashed_variants(self):
+    from PIL import Image
+    image = self.upload()
+    self.assertEqual(image.variants['source'], image.image.name)
+    self.assertRegex(image.variants['thumb_webp'], r'poele[^/]*\.thumb\.[0-9a-f]{12}\.webp$')
+    with Image.open(os.path.join(self.media, image.variants['thumb'])) as thumb:
+      self.assertEqual(thumb.size, (320, 213))
+    # même contenu, même nom : régénérer ne crée pas de nouveau fichier
+    files = len(os.listdir(os.path.dirname(os.path.join(self.media, image.image.name))))
+    ProductImage.objects.filter(pk=image.pk).update(variants={})
+    self.assertEqual(regenerate(ProductImage), 1)
+    self.assertEqual(len(os.listdir(os.path.dirname(os.path.join(self.media, image.image.name)))), files)
+
+  def test_replaced_image_deletes_previous_variants(self):
+    image = self.upload()
+    previous = [path for key, path in image.variants.items() if key != 'source']
+    with self.captureOnCommitCallbacks(execute=True):
+      image.image = make_image(mode='RGBA')
+      image.save()
+    image.refresh_from_db()
+    self.assertEqual(image.variants['source'], image.image.name)
+    for path in previous:
+      self.assertFalse(os.path.exists(os.path.join(self.media, path)), path)
+    for key, path in image.variants.items():
+      self.assertTrue(os.path.exists(os.path.join(self.media, path)), key)
+
+  def test_list_serves_thumbnail_by_accept_header(self):
+    image = self.upload(mode='RGBA')
+    self.assertTrue(image.variants['thumb'].endswith('.png'))
+    response = self.client.get(reverse('product-list'))
+    self.assertTrue(response.data['results'][0]['image_url'].endswith(image.variants['thumb']))
+    response = self.client.get(reverse('product-list'), HTTP_ACCEPT='image/webp,*/*')
+    self.assertTrue(response.data['results'][0]['image_url'].endswith(image.variants['thumb_webp']))
+    self.assertIn('Accept', response['Vary'])
+
+  def test_missing_variants_fall_back_to_original(self):
+    ProductImage.objects.create(product=self.product, image='media/Products/absent.jpg', is_default=True)
+    with self.assertLogs('cs_app.images', 'ERROR'):
+      self.assertEqual(regenerate(ProductImage), 1)
+    response = self.client.get(reverse('product-list'))
+    self.assertTrue(response.data['results'][0]['image_url'].endswith('media/Products/absent.jpg'))
+
+  def test_process_pool_generates_variants(self):
+    image = self.upload()
+    ProductImage.objects.filter(pk=image.pk).update(variants={})
+    with override_settings(IMAGE_WORKERS=1):
+      self.assertEqual(regenerate(ProductImage), 1)
+    image.refresh_from_db()
+    self.assertEqual(set(image.variants), {'source', 'thumb', 'thumb_webp', 'medium', 'medium_webp'})
+
+
+class ImageVariantPoolTests(TransactionTestCase):
+  def setUp(self):
+    cache.clear()
+    self.media = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.media)
+    overrides = override_settings(MEDIA_ROOT=self.media, IMAGE_WORKERS=1)
+    overrides.enable()
+    self.addCleanup(overrides.disable)
+    self.reset_pool()
+    self.addCleanup(self.reset_pool)
+
+  def reset_pool(self):
+    # les processus du pool gardent les réglages (MEDIA_ROOT) du moment de leur création
+    if images._executor is not None:
+      images._executor.shutdown()
+      images._executor = None
+
+  def test_upload_renders_in_background(self):
+    category = Category.objects.create(name='Cat', slug='cat')
+    image = ProductImage.objects.create(product=make_product(category, 1), image=make_image(), is_default=True)
+    wait_for_variants()
+    image.refresh_from_db()
+    self.assertEqual(image.variants['source'], image.image.name)
+    self.assertTrue(os.path.exists(os.path.join(self.media, image.variants['thumb_webp'])))
+
+
+class AsyncCatalogTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.async_client = AsyncClient()
+    self.category = Category.objects.create(name='Poêles', slug='poeles')
+    for index in range(25):
+      make_product(self.category, index, featured=index % 2 == 0)
+    author = User.objects.create_user(username='auteur', password='x', phone='0')
+    self.post = BlogPost.objects.create(
+      title='Article', slug='article', content='Contenu', author=author, published=True,
+      published_at=timezone.now() - timedelta(days=1)
+    )
+
+  async def compare(self, name, args=(), params=None):
+    params = params or {}
+    expected = await sync_to_async(lambda: self.client.get(reverse(name, args=args), params).json())()
+    cache.clear()
+    response = await self.async_client.get(reverse(f'async-{name}', args=args), params)
+    self.assertEqual(response.status_code, 200, response.content)
+    # les liens de pagination pointent sur la route asynchrone
+    self.assertEqual(json.loads(response.content.decode().replace('/async/', '/')), expected)
+    return response
+
+  async def test_async_reads_match_sync_views(self):
+    await self.compare('product-list', params={'featured': 'true', 'ordering': 'price'})
+    await self.compare('product-list', params={'page': 2})
+    await self.compare('product-list', params={'pagination': 'cursor'})
+    product = await Product.objects.order_by('pk').afirst()
+    await self.compare('product-detail', args=[product.pk])
+    await self.compare('category-list')
+    await self.compare('promotion-list')
+    await self.compare('blogpost-list')
+    await self.compare('blogpost-detail', args=[self.post.pk])
+
+  async def test_async_views_share_the_response_cache(self):
+    await sync_to_async(self.client.get)(reverse('product-list'))
+    response = await self.async_client.get(reverse('async-product-list'))
+    self.assertEqual(response['X-Cache'], 'HIT')
+    self.assertIn('Accept', response['Vary'])
+
+  async def test_async_errors(self):
+    self.assertEqual((await self.async_client.get(reverse('async-product-detail', args=[999]))).status_code, 404)
+    self.assertEqual((await self.async_client.get(reverse('async-product-list'), {'page': 99})).status_code, 404)
+    response = await self.async_client.get(reverse('async-product-list'), {'category': 999})
+    self.assertEqual(response.status_code, 400)
+    # message de NotFound de DRF, comme la vue synchrone
+    expected = await sync_to_async(lambda: self.client.get(reverse('product-detail', args=[999])).json())()
+    response = await self.async_client.get(reverse('async-product-detail', args=[999]))
+    self.assertEqual(json.loads(response.content), expected)
+
+  async def test_async_views_check_permissions(self):
+    with mock.patch.object(views.ProductListView, 'permission_classes', [permissions.IsAdminUser]):
+      sync_response = await sync_to_async(self.client.get)(reverse('product-list'))
+      response = await self.async_client.get(reverse('async-product-list'))
+    self.assertEqual(response.status_code, sync_response.status_code)
+    self.assertEqual(response.status_code, 401)
+    self.assertEqual(response['WWW-Authenticate'], sync_response['WWW-Authenticate'])
+
+  async def test_async_views_check_throttles(self):
+    class OnePerMinute(AnonRateThrottle):
+      rate = '1/min'
+
+    with mock.patch.object(views.ProductDetailView, 'throttle_classes', [OnePerMinute]):
+      product = await Product.objects.order_by('pk').afirst()
+      url = reverse('async-product-detail', args=[product.pk])
+      self.assertEqual((await self.async_client.get(url)).status_code, 200)
+      response = await self.async_client.get(url)
+    self.assertEqual(response.status_code, 429)
+    self.assertIn('Retry-After', response)
+
+
+class ConditionalRequestTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.category = Category.objects.create(name='Poêles', slug='poeles')
+    self.products = [make_product(self.category, index) for index in range(3)]
+    Inventory.objects.create(product=self.products[0], quantity=5)
+    author = User.objects.create_user(username='auteur', password='x', phone='0')
+    self.post = BlogPost.objects.create(
+      title='Article', slug='article', content='Contenu', author=author, published=True,
+      published_at=timezone.now() - timedelta(days=1)
+    )
+
+  def revalidate(self, url, response, **params):
+    return self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+  def test_product_detail_not_modified(self):
+    url = reverse('product-detail', args=[self.products[0].pk])
+    response = self.client.get(url)
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response['ETag'].startswith('W/"'))
+    self.assertIn('no-cache', response['Cache-Control'])
+
+    # validateurs gardés en cache avec la réponse : ni requête ni sérialisation
+    with self.assertNumQueries(0):
+      not_modified = self.revalidate(url, response)
+    self.assertEqual(not_modified.status_code, 304)
+    self.assertEqual(not_modified['ETag'], response['ETag'])
+    self.assertEqual(not_modified.content, b'')
+    self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    # une image n'a pas de date propre : l'ETag suit les versions du cache
+    ProductImage.objects.create(product=self.products[0], image='media/Products/p.jpg')
+    self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    inventory = self.products[0].inventory
+    inventory.quantity = 4
+    inventory.save()
+    changed = self.client.get(url)
+    self.assertNotEqual(changed['ETag'], response['ETag'])
+    self.assertEqual(self.client.get(reverse('product-detail', args=[999])).status_code, 404)
+
+  def test_product_list_validators_follow_filtered_set(self):
+    url = reverse('product-list')
+    response = self.client.get(url)
+    self.assertEqual(self.revalidate(url, response).status_code, 304)
+    self.assertNotEqual(self.client.get(url, {'featured': 'true'})['ETag'], response['ETag'])
+
+    # un produit qui sort de la liste sans signal (update) change les lignes de la page
+    Product.objects.filter(pk=self.products[1].pk).update(in_stock=False)
+    cache.clear()
+    self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+  def test_blog_not_modified(self):
+    detail = reverse('blogpost-detail', args=[self.post.pk])
+    response = self.client.get(detail)
+    self.assertEqual(response['Last-Modified'], http_date(int(self.post.updated_at.timestamp())))
+    with self.assertNumQueries(1):
+      self.assertEqual(self.revalidate(detail, response).status_code, 304)
+
+    listing = self.client.get(reverse('blogpost-list'))
+    self.post.title = 'Nouveau titre'
+    self.post.save()
+    self.assertEqual(self.revalidate(detail, response).status_code, 200)
+    self.assertEqual(self.revalidate(reverse('blogpost-list'), listing).status_code, 200)
+
+  def test_list_validators_add_no_query(self):
+    url = reverse('product-list')
+    response = self.client.get(url)
+    # liste en cache : l'ETag vient des versions du cache, la réponse aussi
+    with self.assertNumQueries(0):
+      self.assertEqual(self.revalidate(url, response).status_code, 304)
+    with self.assertNumQueries(0):
+      self.assertEqual(self.client.get(url).status_code, 200)
+
+    # liste sans cache : un agrégat (total, date la plus récente) dont la pagination reprend le total
+    with CaptureQueriesContext(connection) as queries:
+      listing = self.client.get(reverse('blogpost-list'))
+    self.assertEqual(listing.data['count'], 1)
+    self.assertEqual(len(queries), 2)
+    self.assertEqual(sum('COUNT(' in query['sql'] for query in queries), 1)
+    self.assertEqual(listing['Last-Modified'], http_date(int(self.post.updated_at.timestamp())))
+
+  async def test_async_views_honour_validators(self):
+    url = reverse('product-detail', args=[self.products[0].pk])
+    response = await sync_to_async(self.client.get)(url)
+    async_url = reverse('async-product-detail', args=[self.products[0].pk])
+    not_modified = await AsyncClient().get(async_url, headers={'If-None-Match': response['ETag']})
+    self.assertEqual(not_modified.status_code, 304)
+    self.assertEqual(not_modified['ETag'], response['ETag'])
+
+
+class PerformanceMetricsTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    metrics.registry.reset()
+    self.client = APIClient()
+    category = Category.objects.create(name='Poêles', slug='poeles')
+    for index in range(3):
+      make_product(category, index)
+
+  def test_server_timing_and_prometheus_endpoint(self):
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(reverse('product-list'))
+    # request_started vide connection.queries : compter avant la requête suivante
+    count = len(queries)
+    timing = response['Server-Timing']
+    self.assertIn('total;dur=', timing)
+    self.assertIn(f'desc="{count} SQL"', timing)
+    self.assertIn('cache;desc="MISS"', timing)
+    self.client.get(reverse('product-list'))
+
+    text = self.client.get(reverse('metrics')).content.decode()
+    self.assertIn('cs_request_duration_seconds_count{view="product-list",method="GET"} 2', text)
+    self.assertIn('cs_requests_total{view="product-list",method="GET",status="200"} 2', text)
+    self.assertIn('cs_response_cache_total{view="product-list",result="hit"} 1', text)
+    self.assertIn(f'cs_request_db_queries_sum{{view="product-list",method="GET"}} {float(count)}', text)
+    self.assertIn('cs_request_serializer_duration_seconds_bucket{view="product-list",method="GET",le="+Inf"} 2', text)
+
+  def test_metrics_endpoint_is_restricted(self):
+    response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+    self.assertIn(response.status_code, (401, 403))
+
+  @override_settings(METRICS_SLOW_REQUEST_MS=0)
+  def test_slow_requests_are_logged_with_their_queries(self):
+    with self.assertLogs('cs_app.middleware', 'WARNING') as logs:
+      APIClient().get(reverse('product-list'))
+    self.assertIn('FROM "cs_app_product"', logs.output[0])
+
+  @override_settings(METRICS_ENABLED=False)
+  def test_disabled_middleware_is_removed(self):
+    response = APIClient().get(reverse('product-list'))
+    self.assertNotIn('Server-Timing', response)
+
+
+class BenchmarkTests(TransactionTestCase):
+  counts = dict(categories=5, products=40, users=6, carts=6, orders=5, promotions=2, posts=3)
+
+  def setUp(self):
+    cache.clear()
+    seed(seed=3, **self.counts)
+
+  def check(self, results):
+    self.assertEqual([name for name in results], [scenario.name for scenario in benchmarks.SCENARIOS])
+    for name, result in results.items():
+      self.assertEqual(result['errors'], 0, name)
+      self.assertEqual(result['requests'], 4, name)
+      self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+      self.assertIsNotNone(result['queries'], name)
+
+  def test_client_transport(self):
+    results = benchmarks.run(benchmarks.ClientTransport(), 4)
+    self.check(results)
+    self.assertEqual(Order.objects.filter(order_number__startswith='CMD').count(), 4 + 3)
+
+    report = {'scenarios': results}
+    baseline = {'scenarios': {name: {**result, 'p50_ms': result['p50_ms'] * 2} for name, result in results.items()}}
+    self.assertEqual(benchmarks.compare_reports(baseline, report)['panier']['p50_ms'], -50.0)
+
+  def test_http_transport_against_local_server(self):
+    with benchmarks.local_server() as url:
+      self.check(benchmarks.run(benchmarks.HTTPTransport(url), 4, concurrency=2))
+
+
+class ValuesSerializerTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    now = timezone.now()
+    knives = Category.objects.create(name='Couteaux', slug='couteaux')
+    towels = Category.objects.create(name='Linge', slug='linge')
+    for index in range(30):
+      product = make_product(
+        knives if index % 2 else towels, index, price=Decimal(f'{10 + index}.50'), featured=index % 3 == 0,
+        description='couteau acier' if index % 4 == 0 else 'torchon',
+      )
+      if index % 5:
+        image = ProductImage.objects.create(product=product, image=f'media/Products/p{index}.jpg', is_default=True)
+        if index % 2:
+          ProductImage.objects.filter(pk=image.pk).update(variants={
+            'source': image.image.name, 'thumb': f'media/Products/p{index}.thumb.jpg',
+            'thumb_webp': f'media/Products/p{index}.thumb.webp',
+          })
+    ProductImage.objects.create(product=product, image='', is_default=True)
+    promotion = Promotion.objects.create(
+      name='Promo', discount_type='percentage', discount_value=Decimal('15'),
+      valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1)
+    )
+    promotion.applicable_categories.add(knives)
+    self.knives = knives
+
+  def compare(self, params=None, **headers):
+    url = reverse('product-list')
+    fast = self.client.get(url, params or {}, **headers).json()
+    cache.clear()
+    with mock.patch.object(views.ProductListView, 'values_serializer_class', None):
+      full = self.client.get(url, params or {}, **headers).json()
+    cache.clear()
+    self.assertEqual(fast, full)
+    return fast
+
+  def test_values_path_matches_model_serializer(self):
+    data = self.compare()
+    self.assertTrue(any(row['discounted_price'] for row in data['results']))
+    self.compare({'category': self.knives.pk, 'ordering': 'price'})
+    self.compare({'featured': 'true', 'page': 2, 'page_size': 5})
+    self.compare({'search': 'acier'})
+    self.compare(HTTP_ACCEPT='image/webp,*/*')
+
+    # le curseur est relu dans les lignes values() : mêmes pages, mêmes liens
+    page = self.compare({'pagination': 'cursor', 'ordering': '-price'})
+    pages = 1
+    while page['next']:
+      page = self.compare(dict(parse_qsl(urlsplit(page['next']).query)))
+      pages += 1
+    self.assertEqual(pages, 2)
+
+  def test_values_path_does_not_add_queries(self):
+    url = reverse('product-list')
+    with CaptureQueriesContext(connection) as fast:
+      self.client.get(url)
+    fast = len(fast)
+    cache.clear()
+    with mock.patch.object(views.ProductListView, 'values_serializer_class', None):
+      with CaptureQueriesContext(connection) as full:
+        self.client.get(url)
+    self.assertLessEqual(fast, len(full))
+
+  def test_fast_renderer_matches_drf_renderer(self):
+    data = {
+      'price': Decimal('12.50'), 'at': timezone.now(), 'day': timezone.now().date(), 'label': gettext_lazy('Prix'),
+      'nested': [{'accent': 'Poêle', 'none': None, 'flag': True}], 7: 'clé entière',
+    }
+    self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+    self.assertEqual(FastJSONRenderer().render(None), JSONRenderer().render(None))
+
+
+class SparseFieldsTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    category = Category.objects.create(name='Poêles', slug='poeles')
+    self.product = make_product(category, 0)
+    ProductImage.objects.create(product=self.product, image='media/Products/p.jpg', is_default=True)
+    attribute = ProductAttribute.objects.create(name='Matière')
+    ProductAttributeValue.objects.create(product=self.product, attribute=attribute, value='Fonte')
+    self.user = User.objects.create_user(username='client', password='x', phone='0')
+    order = Order.objects.create(
+      user=self.user, order_number='CMD1', status='pending', customer_phone='0',
+      subtotal=Decimal('20.00'), tax=0, total=Decimal('20.00')
+    )
+    OrderItem.objects.create(order=order, product=self.product, quantity=2, price=Decimal('10.00'))
+
+  def test_product_fields_skip_unrequested_prefetches(self):
+    url = reverse('product-detail', args=[self.product.pk])
+    full = self.client.get(url).json()
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(url, {'fields': 'id,name,price'})
+    self.assertEqual(response.json(), {'id': self.product.pk, 'name': 'Produit 0', 'price': '10.00'})
+    self.assertFalse([query for query in queries if 'cs_app_productimage' in query['sql']])
+    self.assertFalse([query for query in queries if 'cs_app_productattributevalue' in query['sql']])
+
+    cache.clear()
+    expanded = self.client.get(url, {'fields': 'id', 'expand': 'images'}).json()
+    self.assertEqual(expanded, {'id': self.product.pk, 'images': full['images']})
+    self.assertNotIn('attribute_values', self.client.get(url, {'expand': 'images'}).json())
+
+    errors = self.client.get(url, {'fields': 'id,poids', 'expand': 'category'})
+    self.assertEqual(errors.status_code, 400)
+    self.assertEqual(set(errors.json()), {'fields', 'expand'})
+
+  def test_order_fields(self):
+    self.client.force_authenticate(self.user)
+    url = reverse('order-list')
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(url, {'fields': 'order_number,total'})
+    self.assertEqual(response.json()['results'], [{'order_number': 'CMD1', 'total': '20.00'}])
+    self.assertFalse([query for query in queries if 'cs_app_orderitem' in query['sql']])
+    items = self.client.get(url, {'fields': 'order_number,items'}).json()['results'][0]['items']
+    self.assertEqual([(item['product_name'], item['quantity']) for item in items], [('Produit 0', 2)])
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    category = Category.objects.create(name='Poêles', slug='poeles')
+    for index in range(5):
+      make_product(category, index)
+    self.url = reverse('product-list')
+
+  def test_gzip_above_threshold(self):
+    plain = self.client.get(self.url)
+    self.assertNotIn('Content-Encoding', plain)
+    response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+    self.assertEqual(response['Content-Encoding'], 'gzip')
+    self.assertIn('Accept-Encoding', response['Vary'])
+    self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+    self.assertEqual(int(response['Content-Length']), len(response.content))
+
+    refused = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+    self.assertNotIn('Content-Encoding', refused)
+    with override_settings(COMPRESSION_MIN_SIZE=10 ** 6):
+      self.assertNotIn('Content-Encoding', self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip'))
+
+  def test_brotli_preferred(self):
+    with mock.patch('cs_app.middleware.brotli') as brotli:
+      brotli.compress.return_value = b'br'
+      response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+    self.assertEqual(response['Content-Encoding'], 'br')
+    self.assertEqual(response.content, b'br')
+
+
+class ProductBatchTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    category = Category.objects.create(name='Poêles', slug='poeles')
+    self.products = [make_product(category, index) for index in range(30)]
+    for product in self.products[:20]:
+      Inventory.objects.create(product=product, quantity=7, reserved=2)
+    ProductImage.objects.create(product=self.products[0], image='media/Products/p.jpg', is_default=True)
+    self.url = reverse('product-batch')
+
+  def ids(self, products):
+    return ','.join(str(product.pk) for product in products)
+
+  def test_constant_queries_and_request_order(self):
+    wanted = self.products[::-1]
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(self.url, {'ids': self.ids(wanted) + ',999999'})
+    self.assertEqual(response.status_code, 200)
+    data = response.json()
+    self.assertEqual([row['id'] for row in data['results']], [product.pk for product in wanted])
+    self.assertEqual(data['missing'], [999999])
+    by_id = {row['id']: row for row in data['results']}
+    self.assertEqual((by_id[self.products[0].pk]['quantity'], by_id[self.products[0].pk]['available']), (7, 5))
+    self.assertIsNone(by_id[self.products[25].pk]['quantity'])
+    self.assertIsNotNone(by_id[self.products[0].pk]['image_url'])
+
+    # même nombre de requêtes pour 3 produits : in_bulk, images par défaut, promotions, stock
+    cache.clear()
+    with CaptureQueriesContext(connection) as few:
+      self.client.get(self.url, {'ids': self.ids(self.products[:3])})
+    self.assertEqual(len(few), len(queries))
+
+  def test_cached_per_product(self):
+    self.client.get(self.url, {'ids': self.ids(self.products[:5])})
+    # résumés en cache : seul le stock est relu
+    with self.assertNumQueries(1):
+      self.client.get(self.url, {'ids': self.ids(self.products[:5])})
+    # seuls les trois produits absents du cache sont lus : produits, images par défaut, puis le stock
+    with self.assertNumQueries(3):
+      response = self.client.get(self.url, {'ids': self.ids(self.products[3:8])})
+    self.assertEqual(len(response.json()['results']), 5)
+
+    # un stock modifié invalide les résumés (versions du cache)
+    inventory = self.products[3].inventory
+    inventory.quantity = 1
+    inventory.save()
+    row = self.client.get(self.url, {'slugs': self.products[3].slug}).json()['results'][0]
+    self.assertEqual(row['quantity'], 1)
+
+  def test_stock_reflects_cart_reservations(self):
+    product = self.products[0]
+    params = {'ids': str(product.pk)}
+    self.assertEqual(self.client.get(self.url, params).json()['results'][0]['available'], 5)
+    user = User.objects.create_user(username='client', password='x', phone='0')
+    self.client.force_authenticate(user)
+    response = self.client.post(reverse('cart-add'), {'product_id': product.pk, 'quantity': 3}, format='json')
+    self.assertEqual(response.status_code, 200)
+    row = self.client.get(self.url, params).json()['results'][0]
+    self.assertEqual((row['quantity'], row['available']), (7, 2))
+
+  @override_settings(PRODUCT_BATCH_MAX=10)
+  def test_invalid_requests(self):
+    self.assertEqual(self.client.get(self.url).status_code, 400)
+    self.assertEqual(self.client.get(self.url, {'ids': '1,a'}).status_code, 400)
+    self.assertEqual(self.client.get(self.url, {'ids': '1', 'slugs': 'x'}).status_code, 400)
+    self.assertEqual(self.client.get(self.url, {'ids': self.ids(self.products[:11])}).status_code, 400)
+
+
+class BulkCartTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.user = User.objects.create_user(username='client', password='x', phone='0')
+    self.client.force_authenticate(self.user)
+    category = Category.objects.create(name='Cat', slug='cat')
+    self.products = [make_product(category, index, price=Decimal('5.00')) for index in range(12)]
+    for product in self.products:
+      Inventory.objects.create(product=product, quantity=10)
+    self.url = reverse('cart-bulk')
+
+  def post(self, *operations):
+    return self.client.post(self.url, {'operations': list(operations)}, format='json')
+
+  def add(self, product, quantity=1):
+    return {'op': 'add', 'product_id': product.pk, 'quantity': quantity}
+
+  def reserved(self, product):
+    return Inventory.objects.get(product=product).reserved
+
+  def test_bulk_edit_keeps_cart_from_purge(self):
+    self.assertEqual(self.post(self.add(self.products[0])).status_code, 200)
+    cart = Cart.objects.get(user=self.user)
+    Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - timedelta(days=40))
+    self.assertEqual(self.post(self.add(self.products[1])).status_code, 200)
+    self.assertEqual(purge_abandoned_carts(timezone.now() - timedelta(days=30)), 0)
+    self.assertTrue(Cart.objects.filter(pk=cart.pk).exists())
+
+  def test_operations_applied_in_order(self):
+    pan, knife, wok = self.products[:3]
+    self.assertEqual(self.post(self.add(pan, 2), self.add(knife, 4), self.add(wok)).status_code, 200)
+    response = self.post(
+      self.add(pan, 1), {'op': 'set', 'product_id': knife.pk, 'quantity': 1}, {'op': 'remove', 'product_id': wok.pk},
+    )
+    self.assertEqual(response.status_code, 200, response.content)
+    self.assertEqual({item['product']: item['quantity'] for item in response.data['items']}, {pan.pk: 3, knife.pk: 1})
+    self.assertEqual((response.data['item_count'], response.data['total']), (4, '20.00'))
+    self.assertEqual([self.reserved(product) for product in (pan, knife, wok)], [3, 1, 0])
+    self.assertFalse(StockReservation.objects.filter(inventory__product=wok).exists())
+
+  def test_constant_queries(self):
+    Cart.objects.create(user=self.user)
+    get_engine()  # index des promotions construit une fois, hors mesure
+    with CaptureQueriesContext(connection) as few:
+      self.post(*[self.add(product) for product in self.products[:2]])
+    with CaptureQueriesContext(connection) as many:
+      self.post(*[self.add(product) for product in self.products[2:]])
+    self.assertEqual(len(many), len(few))
+    self.assertEqual(Cart.objects.get(user=self.user).item_count, 12)
+
+  def test_all_or_nothing(self):
+    pan, knife = self.products[:2]
+    self.post(self.add(pan, 2))
+    response = self.post(self.add(pan, 1), self.add(knife, 11))
+    self.assertEqual(response.status_code, 400)
+    self.assertIn(f'produit {knife.pk}', response.data['items'][0])
+    self.assertEqual(CartItem.objects.get(product=pan).quantity, 2)
+    self.assertEqual((self.reserved(pan), self.reserved(knife)), (2, 0))
+
+    self.assertEqual(self.post(self.add(pan), {'op': 'add', 'product_id': 999999}).status_code, 400)
+    self.assertEqual(self.post({'op': 'set', 'product_id': pan.pk}).status_code, 400)
+    self.assertEqual(self.client.post(self.url, {'operations': []}, format='json').status_code, 400)
+
+  def test_anonymous_session_cart(self):
+    client = APIClient()
+    pan, knife = self.products[:2]
+    response = client.post(self.url, {'operations': [self.add(pan, 3), self.add(knife)]}, format='json')
+    self.assertEqual((response.data['item_count'], response.data['total']), (4, '20.00'))
+    response = client.post(self.url, {'operations': [self.add(pan, 8)]}, format='json')
+    self.assertEqual(response.status_code, 400)
+    self.assertFalse(Cart.objects.exists())
+    self.assertEqual(client.get(reverse('cart-summary')).data['item_count'], 4)
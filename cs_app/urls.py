@@ -1,5 +1,43 @@
-from django.urls import path
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from . import views, async_views
+
+router = DefaultRouter()
+router.register('orders', views.OrderViewSet, basename='order')
 
 urlpatterns = [
-  
+  path('categories/', views.CategoryListView.as_view(), name='category-list'),
+  path('categories/<int:pk>/', views.CategoryDetailView.as_view(), name='category-detail'),
+  path('products/', views.ProductListView.as_view(), name='product-list'),
+  path('products/batch/', views.ProductBatchView.as_view(), name='product-batch'),
+  path('products/import/', views.ProductImportView.as_view(), name='product-import'),
+  path('products/export/', views.ProductExportView.as_view(), name='product-export'),
+  path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
+  path('promotions/', views.PromotionListView.as_view(), name='promotion-list'),
+  path('promotions/<int:pk>/', views.PromotionDetailView.as_view(), name='promotion-detail'),
+  path('blog/', views.BlogPostListView.as_view(), name='blogpost-list'),
+  path('blog/<int:pk>/', views.BlogPostDetailView.as_view(), name='blogpost-detail'),
+  # mêmes lectures du catalogue en asynchrone, pour un déploiement ASGI
+  path('async/categories/', async_views.AsyncCategoryListView.as_view(), name='async-category-list'),
+  path('async/products/', async_views.AsyncProductListView.as_view(), name='async-product-list'),
+  path('async/products/<int:pk>/', async_views.AsyncProductDetailView.as_view(), name='async-product-detail'),
+  path('async/promotions/', async_views.AsyncPromotionListView.as_view(), name='async-promotion-list'),
+  path('async/promotions/<int:pk>/', async_views.AsyncPromotionDetailView.as_view(), name='async-promotion-detail'),
+  path('async/blog/', async_views.AsyncBlogPostListView.as_view(), name='async-blogpost-list'),
+  path('async/blog/<int:pk>/', async_views.AsyncBlogPostDetailView.as_view(), name='async-blogpost-detail'),
+  path('cart/', views.CartView.as_view(), name='cart'),
+  path('cart/summary/', views.CartSummaryView.as_view(), name='cart-summary'),
+  path('cart/add/', views.AddCartItem.as_view(), name='cart-add'),
+  path('cart/bulk/', views.BulkCartView.as_view(), name='cart-bulk'),
+  path('cart/merge/', views.MergeCartView.as_view(), name='cart-merge'),
+  path('cart/session/<int:product_id>/', views.SessionCartItemView.as_view(), name='cart-session-item'),
+  path('cart/items/<int:pk>/', views.UpdateCartItemView.as_view(), name='cart-item-update'),
+  path('cart/items/<int:pk>/remove/', views.RemoveCartItemView.as_view(), name='cart-item-remove'),
+  path('cache/stats/', views.CacheStatsView.as_view(), name='cache-stats'),
+  path('metrics/', views.MetricsView.as_view(), name='metrics'),
+  path('analytics/sales/', views.SalesAnalyticsView.as_view(), name='analytics-sales'),
+  path('analytics/products/', views.ProductSalesAnalyticsView.as_view(), name='analytics-products'),
+  path('analytics/categories/', views.CategorySalesAnalyticsView.as_view(), name='analytics-categories'),
+  path('analytics/stock/', views.StockAnalyticsView.as_view(), name='analytics-stock'),
+  path('', include(router.urls)),
 ]
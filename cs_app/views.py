@@ -1,34 +1,138 @@
 # views.py
+import io
+import uuid
+from decimal import Decimal
+
 from rest_framework import generics, permissions, status, viewsets
 from rest_framework.response import Response
+from rest_framework.parsers import MultiPartParser
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, F, Case, When, Count, Sum, IntegerField, Prefetch
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.utils import timezone
 from .models import (
     User, UserProfile, Category, Product, ProductImage,
-    ProductAttribute, ProductAttributeValue, ProductReview,
-    Inventory, Order, OrderItem, Payment, Cart, CartItem, Promotion, BlogPost
+    ProductAttribute, ProductAttributeValue,
+    Inventory, InventoryHistory, Order, OrderItem, Payment, Cart, CartItem, StockReservation,
+    Promotion, BlogPost, SalesDaily, ProductSalesDaily, CategorySalesDaily, StockLevelDaily
 )
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer,
     CategorySerializer, CategoryListSerializer, ProductSerializer,
-    ProductListSerializer, OrderSerializer,
+    ProductListSerializer, ProductListValuesSerializer, OrderSerializer,
     OrderItemSerializer, CartSerializer, CartItemSerializer,
     PromotionSerializer, BlogPostSerializer,
-    AddToCartSerializer,
+    AddToCartSerializer, BulkCartSerializer, select_fields,
 )
-from .permissions import IsOwnerOrReadOnly, IsAdminOrReadOnly
-
-
-
-
-class CategoryListView(generics.ListCreateAPIView):
-  queryset = Category.objects.all()
+from .permissions import IsOwnerOrReadOnly, IsAdminOrReadOnly, IsMetricsScraper
+from .cache import CachedResponseMixin, bump_version, cache_stats, get_many_cached
+from .promotions import get_engine
+from .reservations import InsufficientStock, reserve, release, release_carts
+from .search import ProductSearchFilter
+from .carts import (
+  SessionCart, adjust_totals, apply_cart_operations, apply_session_operations, merge_session_cart, price_lines,
+  reset_totals
+)
+from .facets import AttributeFacetFilter, facet_counts
+from .pagination import KeysetPagination
+from .analytics import date_range, snapshot_stock
+from . import catalog_io, metrics, order_export
+from .images import accepts_webp
+from .conditional import ConditionalResponseMixin
+
+
+
+
+class ImageResponseMixin(CachedResponseMixin):
+  """Réponses contenant des URL d'images : la déclinaison WebP dépend de l'en-tête Accept"""
+
+  def get_cache_variant(self, request):
+    return accepts_webp(request)
+
+  def finalize_response(self, request, response, *args, **kwargs):
+    response = super().finalize_response(request, response, *args, **kwargs)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+class FieldSelectionMixin:
+  """
+  ?fields= et ?expand= en lecture (voir serializers.select_fields) : le
+  serializer ne produit que les champs demandés et les relations imbriquées
+  absentes de la réponse ne sont ni préchargées ni lues.
+  """
+
+  def get_selected_fields(self):
+    if not hasattr(self, '_selected_fields'):
+      self._selected_fields = None
+      if self.request.method in permissions.SAFE_METHODS:
+        self._selected_fields = select_fields(self.get_serializer_class(), self.request.query_params)
+    return self._selected_fields
+
+  def get_serializer_context(self):
+    context = super().get_serializer_context()
+    context['fields'] = self.get_selected_fields()
+    return context
+
+  def filter_queryset(self, queryset):
+    # ici plutôt que dans get_queryset, que les vues redéfinissent : get_object et list passent par là
+    queryset = super().filter_queryset(queryset)
+    selected = self.get_selected_fields()
+    if selected is None:
+      return queryset
+    skipped = set(self.get_serializer_class().Meta.expandable_fields) - selected
+    lookups = [
+      lookup for lookup in queryset._prefetch_related_lookups
+      if (lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup).split('__')[0] not in skipped
+    ]
+    return queryset.prefetch_related(None).prefetch_related(*lookups)
+
+
+class ValuesListMixin:
+  """
+  Liste en lecture seule servie depuis des lignes values() par `values_serializer_class`
+  (voir ValuesSerializer) au lieu du ModelSerializer de la vue ; None garde le chemin DRF.
+  Filtres, tri et pagination restent ceux de la vue.
+  """
+  values_serializer_class = None
+
+  def list(self, request, *args, **kwargs):
+    if self.values_serializer_class is None:
+      return super().list(request, *args, **kwargs)
+    serializer = self.values_serializer_class(context=self.get_serializer_context())
+    queryset = self.get_values_queryset(serializer)
+    page = self.paginate_queryset(queryset)
+    if page is None:
+      return Response(serializer.to_representation(list(queryset)))
+    return self.get_paginated_response(serializer.to_representation(page))
+
+  def get_values_queryset(self, serializer):
+    queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+    # colonnes du tri en plus : la pagination par curseur les relit dans la dernière ligne
+    ordering = [field.lstrip('-') for field in queryset.query.order_by if isinstance(field, str) and field != '?']
+    return queryset.values(*dict.fromkeys([*serializer.columns(), *ordering, 'pk']))
+
+
+class CategoryListView(ImageResponseMixin, generics.ListCreateAPIView):
+  cache_models = (Category, Product)
+  queryset = Category.objects.annotate(product_count=Count('products')).order_by('id')
   serializer_class  = CategoryListSerializer
   permission_classes = [permissions.AllowAny]
 
+  def get_serializer_context(self):
+    context = super().get_serializer_context()
+    if self.request.method == 'GET':
+      # les totaux de l'arbre sont calculés une seule fois pour toute la page
+      context['category_counts'] = Category.objects.product_counts()
+    return context
+
 
 class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
   queryset = Category.objects.all()
@@ -36,57 +140,191 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
   permission_classes = [permissions.AllowAny]
 
 
-class ProductListView(generics.ListCreateAPIView):
+class ProductListView(ConditionalResponseMixin, ImageResponseMixin, ValuesListMixin, generics.ListCreateAPIView):
+  cache_models = (Product, ProductImage, Category, Inventory, Promotion, ProductAttribute, ProductAttributeValue)
   serializer_class = ProductListSerializer
+  values_serializer_class = ProductListValuesSerializer
   permission_classes = [permissions.AllowAny]
-  filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+  # ProductSearchFilter après OrderingFilter pour pouvoir trier par pertinence,
+  # AttributeFacetFilter en dernier pour compter les facettes sur tous les autres filtres
+  filter_backends = [DjangoFilterBackend, OrderingFilter, ProductSearchFilter, AttributeFacetFilter]
   filterset_fields = [ 'category', 'featured', 'in_stock']
-  search = ['name', 'description']
   ordering_fields = ['name', 'price', 'created_at']
   ordering = ['-created_at']
+  pagination_class = KeysetPagination
 
   def get_queryset(self):
-    queryset = Product.objects.filter(in_stock = True)
-
-    promotion_id =  self.request.query_params.get('promotion')
-    if promotion_id:
-      try:
-        promotion = Promotion.objects.get(id=promotion_id, active= True)
-        if promotion.applicable_products.exists():
-          queryset = queryset.filter(id__in=promotion.applicable_products.all())
-        elif promotion.applicable_categories.exists():
-          queryset = queryset.filter(id__in=promotion.applicable_categories.all())
-      except Promotion.DoesNotExist:
-        pass
+    queryset = Product.objects.filter(in_stock = True).with_list_relations()
+
+    # ?promotion=1 ou ?promotion=1,4 : produits ciblés par l'une des promotions
+    promotion_ids = self.request.query_params.get('promotion')
+    if promotion_ids:
+      ids = [int(pk) for pk in promotion_ids.split(',') if pk.strip().isdigit()]
+      condition = get_engine().product_filter(ids)
+      if condition is None:
+        return queryset.none()
+      queryset = queryset.filter(condition)
     return queryset
 
+  def get_serializer(self, *args, **kwargs):
+    if kwargs.get('many') and args:
+      # prix remisés de toute la page calculés en une passe, sans requête
+      context = kwargs.setdefault('context', self.get_serializer_context())
+      context['prices'] = get_engine().price_products(args[0])
+    return super().get_serializer(*args, **kwargs)
+
+  def list(self, request, *args, **kwargs):
+    response = super().list(request, *args, **kwargs)
+    response.data['facets'] = facet_counts(self)
+    return response
+
+
+class ProductBatchView(generics.GenericAPIView):
+  """
+  Résumés (prix, prix remisé, image, stock) de plusieurs produits en une seule
+  requête : ?ids=3,8,15 ou ?slugs=poele-24,wok, PRODUCT_BATCH_MAX au plus.
+
+  Chaque résumé (celui de la liste) est gardé en cache par produit (voir
+  get_many_cached) : les présents sont lus d'un coup, les autres par un seul
+  in_bulk avec catégorie et image par défaut, prix remisés calculés en une
+  passe. Le stock, que les réservations des paniers modifient sans cesse,
+  n'est jamais mis en cache : une requête values_list le relit pour tous.
+  Résultats dans l'ordre de la demande, identifiants inconnus dans `missing`.
+  """
+  cache_models = (Product, ProductImage, Category, Promotion)
+  serializer_class = ProductListSerializer
+  permission_classes = [permissions.AllowAny]
+
+  def get_lookup(self, request):
+    """(champ, valeurs sans doublon dans l'ordre de la demande)"""
+    params = request.query_params
+    if ('ids' in params) == ('slugs' in params):
+      raise ValidationError({'ids': "Indiquer soit ?ids=, soit ?slugs="})
+    field = 'pk' if 'ids' in params else 'slug'
+    raw = params['ids' if field == 'pk' else 'slugs']
+    values = [value.strip() for value in raw.split(',') if value.strip()]
+    if field == 'pk':
+      if not all(value.isdigit() for value in values):
+        raise ValidationError({'ids': "Identifiants entiers séparés par des virgules"})
+      values = [int(value) for value in values]
+    values = list(dict.fromkeys(values))
+    limit = getattr(settings, 'PRODUCT_BATCH_MAX', 100)
+    if not values or len(values) > limit:
+      raise ValidationError({'ids' if field == 'pk' else 'slugs': f"Entre 1 et {limit} produits par requête"})
+    return field, values
+
+  def load(self, field, values):
+    products = Product.objects.with_list_relations().in_bulk(values, field_name=field)
+    context = self.get_serializer_context()
+    context['prices'] = get_engine().price_products(list(products.values()))
+    serializer = self.get_serializer(context=context)
+    return {key: serializer.to_representation(product) for key, product in products.items()}
+
+  def get(self, request, *args, **kwargs):
+    field, values = self.get_lookup(request)
+    summaries = get_many_cached(
+      f'product-summary:{field}', values, self.cache_models,
+      lambda missing: self.load(field, missing), variant=accepts_webp(request),
+    )
+    stock = {
+      product_id: (quantity, quantity - reserved)
+      for product_id, quantity, reserved in Inventory.objects.filter(
+        product_id__in=[summary['id'] for summary in summaries.values()]
+      ).values_list('product_id', 'quantity', 'reserved')
+    }
+    results = []
+    for value in values:
+      if value in summaries:
+        # sans suivi de stock : None
+        quantity, available = stock.get(summaries[value]['id'], (None, None))
+        results.append({**summaries[value], 'quantity': quantity, 'available': available})
+    response = Response({
+      'results': results,
+      'missing': [value for value in values if value not in summaries],
+    })
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+class ProductImportView(generics.GenericAPIView):
+  """Import en masse d'un fichier CSV ou JSON Lines (champ `file`), lu en flux et écrit par lots"""
+  permission_classes = [permissions.IsAdminUser]
+  parser_classes = [MultiPartParser]
+
+  def post(self, request, *args, **kwargs):
+    upload = request.FILES.get('file')
+    if upload is None:
+      raise ValidationError({'file': "Fichier manquant"})
+    file_format = request.data.get('input') or catalog_io.guess_format(upload.name)
+    if file_format not in catalog_io.FORMATS:
+      raise ValidationError({'input': f"Format attendu : {', '.join(catalog_io.FORMATS)}"})
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    report = catalog_io.import_products(stream, format=file_format)
+    return Response(report, status=status.HTTP_200_OK)
+
+
+class ProductExportView(generics.GenericAPIView):
+  """Export du catalogue (?output=csv|jsonl), écrit au fil de l'eau sans charger les produits en mémoire"""
+  permission_classes = [permissions.IsAdminUser]
+
+  def get(self, request, *args, **kwargs):
+    file_format = request.query_params.get('output', 'jsonl')
+    if file_format not in catalog_io.FORMATS:
+      raise ValidationError({'output': f"Format attendu : {', '.join(catalog_io.FORMATS)}"})
+    response = StreamingHttpResponse(
+      catalog_io.export_products(file_format), content_type=catalog_io.CONTENT_TYPES[file_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+    return response
+
 
-class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ProductDetailView(
+  FieldSelectionMixin, ConditionalResponseMixin, ImageResponseMixin, generics.RetrieveUpdateDestroyAPIView
+):
+  cache_models = (Product, ProductImage, Category, ProductAttribute, ProductAttributeValue, Inventory)
+  last_modified_fields = ('updated_at', 'inventory__updated_at')
   serializer_class = ProductSerializer
   permission_classes = [permissions.AllowAny]
-  queryset = Product.objects.all()
+  queryset = Product.objects.select_related('category').prefetch_related(
+    'images', Prefetch('attribute_values', queryset=ProductAttributeValue.objects.select_related('attribute'))
+  )
 
 
 
-class PromotionListView(generics.ListCreateAPIView):
-  queryset = Promotion.objects.filter(active = True, valid_to__gte=timezone.now())
+class PromotionListView(CachedResponseMixin, generics.ListCreateAPIView):
+  cache_models = (Promotion,)
   serializer_class = PromotionSerializer
   permission_classes = [permissions.AllowAny]
 
+  def get_queryset(self):
+    # timezone.now() doit être évalué à chaque requête, pas à l'import du module
+    return Promotion.objects.filter(
+      active = True, valid_to__gte=timezone.now()
+    ).prefetch_related('applicable_categories', 'applicable_products').order_by('id')
+
 
 class PromotionDetailView(generics.RetrieveUpdateDestroyAPIView):
-  queryset = Promotion.objects.filter(active = True, valid_to__gte=timezone.now())
   serializer_class = PromotionSerializer
   permission_classes = [permissions.AllowAny]
 
+  def get_queryset(self):
+    return Promotion.objects.filter(
+      active = True, valid_to__gte=timezone.now()
+    ).prefetch_related('applicable_categories', 'applicable_products')
+
 
-class BlogPostListView(generics.ListCreateAPIView):
-  queryset = BlogPost.objects.filter(published=True, published_at__lte=timezone.now())
+class BlogPostListView(ConditionalResponseMixin, generics.ListCreateAPIView):
   serializer_class = BlogPostSerializer
   permission_classes = [permissions.AllowAny]
   ordering = ['-published_at']
+  pagination_class = KeysetPagination
+
+  def get_queryset(self):
+    return BlogPost.objects.filter(
+      published=True, published_at__lte=timezone.now()
+    ).select_related('author')
 
-class BlogPostDetailView(generics.RetrieveUpdateDestroyAPIView):
+class BlogPostDetailView(ConditionalResponseMixin, generics.RetrieveUpdateDestroyAPIView):
   queryset = BlogPost.objects.filter(published=True)
   serializer_class = BlogPostSerializer
   permission_classes = [permissions.AllowAny]
@@ -94,43 +332,154 @@ class BlogPostDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 class CartView(generics.RetrieveAPIView):
   serializer_class = CartSerializer
-  permission_classes =[permissions.IsAuthenticated]
+  permission_classes =[permissions.AllowAny]
+
+  def retrieve(self, request, *args, **kwargs):
+    if not request.user.is_authenticated:
+      # panier anonyme : lignes en session, aucune écriture en base
+      return Response(self.get_serializer(SessionCart(request.session)).data)
+    return super().retrieve(request, *args, **kwargs)
 
   def get_object(self):
-    cart, created = Cart.objects.get_or_create(user = self.request.user)
+    # panier et lignes avec leurs produits : deux requêtes quelle que soit la taille du panier
+    cart = Cart.objects.filter(user = self.request.user).prefetch_related(
+      Prefetch('items', queryset=CartItem.objects.select_related('product').order_by('id'))
+    ).first()
+    if cart is None:
+      cart = Cart.objects.create(user = self.request.user)
     return cart
 
+
+class CartSummaryView(generics.GenericAPIView):
+  """
+  Badge du panier : nombre d'articles, sous-total, remise et total.
+
+  Sans promotion en cours, tout se lit sur la seule ligne Cart ; sinon les lignes
+  sont lues en une requête et remisées comme le panier complet (price_lines).
+  """
+  permission_classes = [permissions.AllowAny]
+
+  def get(self, request, *args, **kwargs):
+    if not request.user.is_authenticated:
+      session_cart = SessionCart(request.session)
+      return Response(self.summary(session_cart.item_count, price_lines(session_cart.items)))
+    carts = Cart.objects.filter(user = request.user)
+    if not get_engine().promotions:
+      row = carts.values('item_count', 'subtotal').first() or {'item_count': 0, 'subtotal': Decimal('0')}
+      pricing = {'subtotal': row['subtotal'], 'discount': Decimal('0'), 'total': row['subtotal']}
+      return Response(self.summary(row['item_count'], pricing))
+    items = list(
+      CartItem.objects.filter(cart = carts.order_by('pk').values('pk')[:1]).select_related('product')
+    )
+    return Response(self.summary(sum(item.quantity for item in items), price_lines(items)))
+
+  def summary(self, item_count, pricing):
+    cent = Decimal('0.01')
+    return {'item_count': item_count, **{key: value.quantize(cent) for key, value in pricing.items()}}
+
 class AddCartItem(generics.GenericAPIView):
-  serializer_class = CartItemSerializer
-  permission_classes = [permissions.IsAuthenticated]
+  serializer_class = AddToCartSerializer
+  permission_classes = [permissions.AllowAny]
 
   def post(self, request, *args, **kwargs):
     serializer =  self.get_serializer(data = request.data)
     serializer.is_valid(raise_exception = True)
-    cart, created = Cart.objects.get_or_create(user = request.user)
-    product = Product.objects.get(id =serializer.validated_data['product_id'])
+    product = serializer.validated_data['product']
     quantity = serializer.validated_data['quantity']
 
-    if product.inventory.quantity < quantity:
-      return Response(
-        {'error': 'Stock insuffisant'},
-          status=status.HTTP_400_BAD_REQUEST
-         )
-
-      cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        defaults={'quantity': quantity}
-        )
+    if not request.user.is_authenticated:
+      # le stock n'est retenu qu'à la fusion dans un panier enregistré (connexion)
+      session_cart = SessionCart(request.session)
+      inventory = getattr(product, 'inventory', None)
+      in_cart = session_cart.quantity(product.pk)
+      if inventory is not None and inventory.available < in_cart + quantity:
+        raise InsufficientStock(inventory.available - in_cart)
+      session_cart.add(product.pk, quantity)
+      return Response({'message': 'Produit ajouté au panier'}, status=status.HTTP_200_OK)
+
+    with transaction.atomic():
+      # même panier que la vue du panier et la commande : le plus ancien de l'utilisateur
+      cart = Cart.objects.filter(user = request.user).order_by('pk').first() or Cart.objects.create(user = request.user)
+      inventory = getattr(product, 'inventory', None)
+      if inventory is not None:
+        # lève InsufficientStock (400) si un autre panier a pris le stock entre-temps
+        reserve(cart, inventory, quantity)
+
+      updated = CartItem.objects.filter(cart = cart, product = product).update(
+        quantity = F('quantity') + quantity
+      )
+      if not updated:
+        CartItem.objects.create(cart = cart, product = product, quantity = quantity)
+      adjust_totals(cart.pk, quantity, product.price * quantity)
 
-      if not created:
-        cart_item.quantity += quantity
-        cart_item.save()
+    return Response(
+      {'message': 'Produit ajouté au panier'},
+        status=status.HTTP_200_OK
+      )
 
-      return Response(
-        {'message': 'Produit ajouté au panier'},
-          status=status.HTTP_200_OK
-        )
+
+class BulkCartView(generics.GenericAPIView):
+  """
+  Plusieurs modifications du panier en une requête (commande rapide, commande
+  passée à refaire) : {"operations": [{"op": "add", "product_id": 3, "quantity": 2},
+  {"op": "set", "product_id": 8, "quantity": 5}, {"op": "remove", "product_id": 9}]}.
+  Appliquées dans l'ordre, tout ou rien ; retourne le panier.
+  """
+  serializer_class = BulkCartSerializer
+  permission_classes = [permissions.AllowAny]
+
+  def post(self, request, *args, **kwargs):
+    serializer = self.get_serializer(data = request.data)
+    serializer.is_valid(raise_exception = True)
+    operations = serializer.validated_data['operations']
+
+    if not request.user.is_authenticated:
+      session_cart = SessionCart(request.session)
+      apply_session_operations(session_cart, operations)
+      return Response(CartSerializer(session_cart, context = self.get_serializer_context()).data)
+
+    cart = apply_cart_operations(request.user, operations)
+    cart = Cart.objects.filter(pk = cart.pk).prefetch_related(
+      Prefetch('items', queryset=CartItem.objects.select_related('product').order_by('id'))
+    ).get()
+    return Response(CartSerializer(cart, context = self.get_serializer_context()).data)
+
+
+class SessionCartItemView(generics.GenericAPIView):
+  """Ligne d'un panier anonyme, désignée par son produit : PATCH pour la quantité, DELETE pour la retirer"""
+  serializer_class = AddToCartSerializer
+  permission_classes = [permissions.AllowAny]
+
+  def get_session_cart(self):
+    session_cart = SessionCart(self.request.session)
+    if not session_cart.quantity(self.kwargs['product_id']):
+      raise NotFound("Produit absent du panier")
+    return session_cart
+
+  def patch(self, request, product_id, *args, **kwargs):
+    session_cart = self.get_session_cart()
+    serializer = self.get_serializer(data = {'product_id': product_id, 'quantity': request.data.get('quantity')})
+    serializer.is_valid(raise_exception = True)
+    session_cart.set(product_id, serializer.validated_data['quantity'])
+    return Response(CartSerializer(session_cart, context = self.get_serializer_context()).data)
+
+  def delete(self, request, product_id, *args, **kwargs):
+    self.get_session_cart().remove(product_id)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MergeCartView(generics.GenericAPIView):
+  """
+  Fusionne le panier de session dans celui de l'utilisateur connecté.
+
+  La connexion par session le fait d'elle-même (signal user_logged_in) ; les
+  clients JWT appellent cette route après avoir obtenu leur jeton.
+  """
+  permission_classes = [permissions.IsAuthenticated]
+
+  def post(self, request, *args, **kwargs):
+    merged = merge_session_cart(request.session, request.user)
+    return Response({'message': 'Panier fusionné', 'merged': merged}, status=status.HTTP_200_OK)
 
 
 class UpdateCartItemView(generics.UpdateAPIView):
@@ -139,64 +488,307 @@ class UpdateCartItemView(generics.UpdateAPIView):
   queryset = CartItem.objects.all()
 
   def get_queryset(self):
-    return CartItem.objects.filter(cart__user = self.request.user)
+    return CartItem.objects.filter(cart__user = self.request.user).select_related('cart', 'product__inventory')
+
+  def perform_update(self, serializer):
+    item = serializer.instance
+    old_quantity = item.quantity
+    new_quantity = serializer.validated_data.get('quantity', old_quantity)
+    inventory = getattr(item.product, 'inventory', None)
+
+    with transaction.atomic():
+      if inventory is not None and new_quantity > old_quantity:
+        reserve(item.cart, inventory, new_quantity - old_quantity)
+      elif inventory is not None and new_quantity < old_quantity:
+        release(item.cart, inventory, old_quantity - new_quantity)
+      # le produit d'une ligne ne change pas, seule la quantité est modifiable
+      serializer.save(product = item.product)
+      delta = new_quantity - old_quantity
+      if delta:
+        adjust_totals(item.cart_id, delta, item.product.price * delta)
+
 
 class RemoveCartItemView(generics.DestroyAPIView):
   permission_classes= [permissions.IsAuthenticated]
   queryset = CartItem.objects.all()
 
   def get_queryset(self):
-    return CartItem.objects.filter(cart__user = self.request.user)
+    return CartItem.objects.filter(cart__user = self.request.user).select_related('cart', 'product__inventory')
+
+  def perform_destroy(self, instance):
+    inventory = getattr(instance.product, 'inventory', None)
+    with transaction.atomic():
+      if inventory is not None:
+        release(instance.cart, inventory)
+      instance.delete()
+      adjust_totals(instance.cart_id, -instance.quantity, -instance.product.price * instance.quantity)
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(FieldSelectionMixin, viewsets.ModelViewSet):
   serializer_class = OrderSerializer
   permission_classes = [permissions.IsAuthenticated]
+  pagination_class = KeysetPagination
 
 
   def get_queryset(self):
-    return Order.objects.filter(user = self.request.user)
+    return Order.objects.filter(user = self.request.user).prefetch_related(
+      Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+    ).order_by('-created_at')
 
 
   def perform_create(self, serializer):
-    cart = Cart.objects.get(user = self.request.user)
-    cart_items = cart.items.all()
-
-    subtotal = sum(item.product.price * item.quantity for item in cart_items)
-    tax = 0
-    total = subtotal + tax
+    with transaction.atomic():
+      # un seul panier, celui qu'affiche et remplit l'API (Cart.objects.filter(user=...).first()) ;
+      # lignes, produits et stocks en une seule requête
+      cart = Cart.objects.filter(user = self.request.user).order_by('pk').values('pk')[:1]
+      cart_items = list(
+        CartItem.objects.filter(cart = cart)
+        .select_related('product__inventory')
+        .order_by('id')
+      )
+      if not cart_items:
+        raise ValidationError({'cart': "Le panier est vide"})
+
+      # mêmes remises que le panier affiché (promotions en cours, seuils de commande compris)
+      pricing = price_lines(cart_items)
+      subtotal = pricing['subtotal']
+      tax = 0
+      total = pricing['total'] + tax
+
+      order = serializer.save(
+        user =self.request.user,
+        order_number = self.generate_order_number(),
+        status = 'pending',
+        subtotal =subtotal,
+        tax = tax,
+        total = total,
+        customer_phone=self.request.user.phone
+      )
 
+      stocked = {}
+      for item in cart_items:
+        inventory = getattr(item.product, 'inventory', None)
+        if inventory is not None:
+          stocked[inventory.pk] = stocked.get(inventory.pk, 0) + item.quantity
+
+      cart_id = cart_items[0].cart_id
+      held = dict(
+        StockReservation.objects.select_for_update()
+        .filter(cart_id = cart_id)
+        .values_list('inventory_id', 'quantity')
+      )
 
-    order = serializer.save(
-      user =self.request.user,
-      subtotal =subtotal,
-      tax = tax,
-      total = total,
-      customer_phone=self.request.user.phone
+      if stocked:
+        # décrément conditionnel en un UPDATE : le panier consomme sa propre réservation
+        # et ne peut prendre que ce que les autres paniers ne retiennent pas ; une ligne
+        # sans stock suffisant n'est pas modifiée, le compte ne correspond plus et tout est annulé
+        enough = Q()
+        for inventory_id, quantity in stocked.items():
+          enough |= Q(pk = inventory_id, quantity__gte = F('reserved') - held.get(inventory_id, 0) + quantity)
+        updated = Inventory.objects.filter(enough).update(
+          quantity = Case(
+            *[When(pk = inventory_id, then = F('quantity') - quantity)
+              for inventory_id, quantity in stocked.items()],
+            output_field = IntegerField()
+          ),
+          reserved = Case(
+            *[When(pk = inventory_id, then = F('reserved') - held.get(inventory_id, 0))
+              for inventory_id in stocked],
+            output_field = IntegerField()
+          ),
+          updated_at = timezone.now()
+        )
+        if updated != len(stocked):
+          raise ValidationError({'cart': "Stock insuffisant pour un ou plusieurs produits"})
+
+        # update() n'émet pas post_save : invalider le cache du catalogue à la main
+        transaction.on_commit(lambda: bump_version(Inventory))
+
+        InventoryHistory.objects.bulk_create([
+          InventoryHistory(
+            inventory_id = inventory_id,
+            quantity_changed = -quantity,
+            reason = f"Commande {order.order_number}"
+          )
+          for inventory_id, quantity in stocked.items()
+        ])
+
+      order_items = OrderItem.objects.bulk_create([
+        OrderItem(
+          order = order,
+          product = item.product,
+          quantity = item.quantity,
+          price = item.product.price
+        )
+        for item in cart_items
+      ])
+
+      CartItem.objects.filter(cart_id = cart_id).delete()
+      reset_totals(cart_id)
+      if held:
+        StockReservation.objects.filter(cart_id = cart_id, inventory_id__in = stocked).delete()
+        if set(held) - set(stocked):
+          # réservations orphelines (ligne retirée sans passer par l'API)
+          release_carts([cart_id])
+
+    # évite de relire les lignes lors de la sérialisation de la réponse
+    order._prefetched_objects_cache = {'items': order_items}
+
+  def generate_order_number(self):
+    return f"CMD{timezone.now():%y%m%d}{uuid.uuid4().hex[:10].upper()}"
+
+
+  @action(detail=False, methods=['get'])
+  def export(self, request):
+    """Historique complet en flux (?output=csv|jsonl) ; les administrateurs voient toutes les commandes (?user=)"""
+    file_format = request.query_params.get('output', 'jsonl')
+    if file_format not in order_export.FORMATS:
+      raise ValidationError({'output': f"Format attendu : {', '.join(order_export.FORMATS)}"})
+    if request.user.is_staff:
+      orders = Order.objects.all()
+      user_id = request.query_params.get('user')
+      if user_id:
+        if not user_id.isdigit():
+          raise ValidationError({'user': "Identifiant invalide"})
+        orders = orders.filter(user_id = user_id)
+    else:
+      orders = Order.objects.filter(user = request.user)
+    if request.query_params.get('status'):
+      orders = orders.filter(status = request.query_params['status'])
+    orders = orders.order_by('-created_at', '-id')
+
+    response = StreamingHttpResponse(
+      order_export.export_orders(orders, file_format), content_type = order_export.CONTENT_TYPES[file_format]
     )
-
-    for cart_item in cart_items:
-      OrderItem.objects.create(
-        order = order,
-        product = cart_item.product,
-        quantity = cart_item.quantity,
-        price = cart_item.product.price
+    response['Content-Disposition'] = f'attachment; filename="orders.{file_format}"'
+    return response
+
+  @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
+  def confirm(self, request, pk=None):
+    # les commandes de tous les clients, pas seulement celles de l'administrateur
+    order = get_object_or_404(Order, pk = pk)
+    if order.status != 'pending':
+      return Response(
+        {'error': "Seule une commande en attente peut être confirmée"}, status= status.HTTP_400_BAD_REQUEST
       )
-
-
-    cart_items.all.delete()
-
-
+    order.status = 'confirmed'
+    # post_save reporte la commande dans les cumuls d'analyse (cs_app/analytics.py)
+    order.save(update_fields=['status', 'updated_at'])
+    return Response({'status': 'Commande confirmée'})
 
   @action(detail=True, methods=['post'])
   def cancel(self, request, pk=None):
     order = self.get_object()
-    if order.status in ['pending', 'confirmed']:
-      orded.status = 'cancelled'
-      order.save()
-      return Response({'status' : 'Commande Annuler'})
+    with transaction.atomic():
+      # relue verrouillée : deux annulations simultanées ne rendent pas le stock deux fois
+      order = Order.objects.select_for_update().get(pk = order.pk)
+      if order.status in ['pending', 'confirmed']:
+        order.status = 'cancelled'
+        order.save()
+        self.restock(order)
+        return Response({'status' : 'Commande Annuler'})
     return Response(
       {
         'error': "Impossible d'annuler cette commande"
       }, status= status.HTTP_400_BAD_REQUEST
     )
+
+
+  def restock(self, order):
+    """Rend au stock les quantités décrémentées par perform_create, en un UPDATE"""
+    returned = {}
+    lines = OrderItem.objects.filter(order = order, product__inventory__isnull = False).values_list(
+      'product__inventory', 'quantity'
+    )
+    for inventory_id, quantity in lines:
+      returned[inventory_id] = returned.get(inventory_id, 0) + quantity
+    if not returned:
+      return
+    Inventory.objects.filter(pk__in = returned).update(
+      quantity = Case(
+        *[When(pk = inventory_id, then = F('quantity') + quantity)
+          for inventory_id, quantity in returned.items()],
+        output_field = IntegerField()
+      ),
+      updated_at = timezone.now()
+    )
+    InventoryHistory.objects.bulk_create([
+      InventoryHistory(
+        inventory_id = inventory_id,
+        quantity_changed = quantity,
+        reason = f"Annulation {order.order_number}"
+      )
+      for inventory_id, quantity in returned.items()
+    ])
+    # update() n'émet pas post_save : invalider le cache du catalogue à la main
+    transaction.on_commit(lambda: bump_version(Inventory))
+
+
+class CacheStatsView(generics.GenericAPIView):
+  permission_classes = [permissions.IsAdminUser]
+
+  def get(self, request, *args, **kwargs):
+    return Response(cache_stats())
+
+
+class MetricsView(generics.GenericAPIView):
+  """Mesures par vue du processus courant, au format texte de Prometheus (voir cs_app/middleware.py)"""
+  permission_classes = [IsMetricsScraper]
+
+  def get(self, request, *args, **kwargs):
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class AnalyticsView(generics.GenericAPIView):
+  """Base des vues d'analyse : lecture des seuls cumuls journaliers sur ?from=&to="""
+  permission_classes = [permissions.IsAdminUser]
+
+  def get(self, request, *args, **kwargs):
+    start, end = date_range(request.query_params)
+    return Response({'from': start, 'to': end, **self.report(start, end)})
+
+
+class SalesAnalyticsView(AnalyticsView):
+  def report(self, start, end):
+    days = list(
+      SalesDaily.objects.filter(day__range=(start, end)).order_by('day').values('day', 'orders', 'units', 'revenue')
+    )
+    totals = {field: sum(row[field] for row in days) for field in ('orders', 'units', 'revenue')}
+    return {'totals': totals, 'days': days}
+
+
+class ProductSalesAnalyticsView(AnalyticsView):
+  def report(self, start, end):
+    try:
+      limit = min(max(int(self.request.query_params.get('limit', 10)), 1), 100)
+    except ValueError:
+      raise ValidationError({'limit': "Nombre entier attendu"})
+    results = (
+      ProductSalesDaily.objects.filter(day__range=(start, end))
+      .values('product_id', name=F('product__name'))
+      .annotate(units=Sum('units'), revenue=Sum('revenue'))
+      .order_by('-revenue', 'product_id')[:limit]
+    )
+    return {'results': list(results)}
+
+
+class CategorySalesAnalyticsView(AnalyticsView):
+  def report(self, start, end):
+    results = (
+      CategorySalesDaily.objects.filter(day__range=(start, end))
+      .values('category_id', name=F('category__name'))
+      .annotate(units=Sum('units'), revenue=Sum('revenue'))
+      .order_by('-revenue', 'category_id')
+    )
+    return {'results': list(results)}
+
+
+class StockAnalyticsView(AnalyticsView):
+  def report(self, start, end):
+    fields = ('day', 'tracked', 'low_stock', 'out_of_stock')
+    if not StockLevelDaily.objects.filter(day=timezone.localdate()).exists():
+      # relevé du jour pas encore fait par rollup_analytics : le prendre maintenant
+      snapshot_stock()
+    days = list(StockLevelDaily.objects.filter(day__range=(start, end)).order_by('day').values(*fields))
+    latest = StockLevelDaily.objects.order_by('-day').values(*fields).first()
+    return {'latest': latest, 'days': days}
@@ -47,6 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # en premier : mesure toute la chaîne (voir METRICS_ENABLED)
+    'cs_app.middleware.PerformanceMiddleware',
+    # avant tout middleware qui lit ou modifie le corps (voir COMPRESSION_MIN_SIZE)
+    'cs_app.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,10 +87,87 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # les transactions prennent le verrou d'écriture dès BEGIN et attendent
+        # au lieu d'échouer quand plusieurs paniers écrivent en même temps
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # base de test sur disque : la base mémoire partagée refuse les écritures concurrentes
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# En production, remplacer par un cache partagé (Redis, Memcached) pour que
+# l'invalidation des réponses du catalogue soit vue par tous les workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # sessions à part : les entrées du catalogue ne les évincent pas. En production,
+    # un cache partagé par tous les workers et sans éviction (Redis avec
+    # maxmemory-policy noeviction, par exemple) : c'est le seul stockage des sessions
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+CATALOG_CACHE_TIMEOUT = 300
+
+# Produits par requête sur /products/batch/ (voir ProductBatchView)
+PRODUCT_BATCH_MAX = 100
+
+# Opérations par requête sur /cart/bulk/ (voir BulkCartView)
+CART_BULK_MAX = 100
+
+# Sessions dans leur propre cache : les paniers anonymes (cs_app/carts.py) n'écrivent rien en base
+SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Durée de vie (secondes) de l'index des promotions en mémoire, voir cs_app/promotions.py
+PROMOTION_ENGINE_TTL = 60
+
+# Durée (minutes) pendant laquelle un panier retient le stock ajouté, voir cs_app/reservations.py
+STOCK_RESERVATION_MINUTES = 15
+
+# Rétention (jours) des paniers inactifs et du détail des mouvements de stock,
+# voir la commande purge_stale_data
+CART_RETENTION_DAYS = 30
+INVENTORY_HISTORY_RETENTION_DAYS = 90
+
+# Commandes lues par tranche lors de l'export en flux, voir cs_app/order_export.py
+ORDER_EXPORT_CHUNK_SIZE = 500
+
+# Déclinaisons des images envoyées (côté maximal en pixels) et taille du pool de
+# processus qui les génère en arrière-plan ; 0 = génération immédiate dans la
+# requête, réservé aux tests. Voir cs_app/images.py
+IMAGE_VARIANT_SIZES = {'thumb': 320, 'medium': 960}
+IMAGE_WORKERS = 2
+
+# Étendue maximale (jours) d'une requête sur les cumuls d'analyse, voir cs_app/analytics.py
+ANALYTICS_MAX_DAYS = 366
+
+# Durée de vie (secondes) de l'index des facettes d'attributs, voir cs_app/facets.py
+FACET_INDEX_TTL = 300
+
+# Mesures par vue (latence, SQL, cache, sérialisation) : en-tête Server-Timing et
+# /metrics/ au format Prometheus, voir cs_app/middleware.py. Les requêtes plus lentes
+# que METRICS_SLOW_REQUEST_MS (None = jamais) sont journalisées avec leur SQL.
+# /metrics/ est ouvert aux administrateurs et aux adresses de METRICS_ALLOWED_IPS
+# (derrière un proxy, REMOTE_ADDR est celle du proxy).
+METRICS_ENABLED = True
+METRICS_SLOW_REQUEST_MS = 500
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -144,7 +225,12 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    # même JSON que JSONRenderer, encodé par orjson s'il est installé (cs_app/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'cs_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 
@@ -154,3 +240,7 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
 }
+
+# Réponses JSON compressées (brotli si le paquet est installé, sinon gzip) à partir
+# de cette taille en octets, voir CompressionMiddleware dans cs_app/middleware.py
+COMPRESSION_MIN_SIZE = 1024